@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from labeling_tool import journal
+from labeling_tool.imagedatabase import LabeledImage, iterDecodeImageDatabase, iterEncodeImageDatabase
+from labeling_tool.labels import *
+
+
+def syntheticDatabase(numberOfImages, seed=0):
+    rng = random.Random(seed)
+    labeledImages = []
+    for i in range(numberOfImages):
+        labeledImage = LabeledImage('/data/game_%02d/frame_%06d.png' % (i // 10000, i))
+        if rng.random() < 0.5:
+            labeledImage.labels[BallLabel] = [BallLabel((rng.randint(0, 640), rng.randint(0, 480)), rng.randint(3, 40), rng.random() < 0.1)]
+        if rng.random() < 0.3:
+            labeledImage.labels[RobotLabel] = [RobotLabel((rng.randint(0, 600), rng.randint(0, 400)), (rng.randint(0, 640), rng.randint(0, 480)), rng.choice(list(TeamColor))) for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.3:
+            labeledImage.labels[LineLabel] = [LineLabel((rng.randint(0, 640), rng.randint(0, 480)), (rng.randint(0, 640), rng.randint(0, 480))) for _ in range(rng.randint(1, 6))]
+        labeledImages.append(labeledImage)
+    return labeledImages
+
+def measure(name, function):
+    start = time.perf_counter()
+    result = function()
+    print('{:<16} {:8.3f} s'.format(name, time.perf_counter() - start))
+    return result
+
+def writeJson(fileName, labeledImages):
+    with open(fileName, 'w') as f:
+        f.writelines(iterEncodeImageDatabase(labeledImages))
+
+def readJson(fileName):
+    with open(fileName) as f:
+        return list(iterDecodeImageDatabase(f))
+
+if __name__ == '__main__':
+    numberOfImages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    labeledImages = syntheticDatabase(numberOfImages)
+    with tempfile.TemporaryDirectory() as directory:
+        pickleFileName = os.path.join(directory, 'database')
+        jsonFileName = os.path.join(directory, 'database.json')
+
+        measure('pickle write', lambda: journal.writeSnapshot(pickleFileName, labeledImages))
+        measure('json write', lambda: writeJson(jsonFileName, labeledImages))
+        print('pickle size      {:8.1f} MB'.format(os.path.getsize(pickleFileName) / 1e6))
+        print('json size        {:8.1f} MB'.format(os.path.getsize(jsonFileName) / 1e6))
+
+        fromPickle = measure('pickle load', lambda: journal.readSnapshot(pickleFileName))
+        fromJson = measure('json load', lambda: readJson(jsonFileName))
+        assert len(fromPickle) == len(fromJson) == numberOfImages
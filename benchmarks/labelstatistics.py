@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jsonimport import measure, syntheticDatabase
+from labeling_tool.labelstatistics import LabelStatistics
+
+
+if __name__ == '__main__':
+    # About 2.3 labels per image, so the default amounts to a million labels.
+    numberOfImages = int(sys.argv[1]) if len(sys.argv) > 1 else 435000
+    labeledImages = syntheticDatabase(numberOfImages)
+    print('labels           {:8d}'.format(sum(len(labels) for labeledImage in labeledImages for labels in labeledImage.labels.values())))
+
+    statistics = measure('columns', lambda: LabelStatistics(labeledImages))
+    measure('summary', statistics.summary)
+    measure('outliers', statistics.outliers)
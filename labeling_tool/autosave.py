@@ -0,0 +1,124 @@
+import glob
+import os
+import pickle
+import time
+
+from PyQt5.QtCore import QLockFile, QObject, QRunnable, QThreadPool, QTimer
+
+from labeling_tool.imagedatabase import fileStamp
+from labeling_tool.imagehashes import cacheDirectory
+
+
+def autosaveDirectory():
+    return os.path.join(cacheDirectory(), 'autosave')
+
+def writeRecoveryFile(fileName, origin, records):
+    tempFileName = fileName + '.tmp'
+    with open(tempFileName, 'wb') as f:
+        pickle.dump((origin, records), f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tempFileName, fileName)
+
+def readRecoveryFile(fileName):
+    try:
+        with open(fileName, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return None
+
+def isRecoverable(origin):
+    # The operations only apply to the state the database had when they were recorded.
+    return origin[0] == 'new' or fileStamp(origin[1]) == origin[2]
+
+def lockRecoveryFile(fileName):
+    # A lock file whose process is not running anymore is stale. Age alone never makes it stale, because an
+    # instance holds the lock for as long as it runs.
+    lock = QLockFile(fileName + '.lock')
+    lock.setStaleLockTime(0)
+    return lock
+
+def recoverableFiles(directory=None):
+    # Recovery files of instances that are still running are locked.
+    for fileName in sorted(glob.glob(os.path.join(directory or autosaveDirectory(), '*.autosave')), key=os.path.getmtime, reverse=True):
+        lock = lockRecoveryFile(fileName)
+        if lock.tryLock(0):
+            yield fileName, lock
+
+def removeStaleLocks(directory=None):
+    # An instance that crashed before it autosaved anything leaves only its lock file behind. Taking the lock replaces a
+    # stale lock file and unlocking removes it.
+    for lockFileName in glob.glob(os.path.join(directory or autosaveDirectory(), '*.autosave.lock')):
+        fileName = lockFileName[:-len('.lock')]
+        if os.path.exists(fileName):
+            continue
+        lock = lockRecoveryFile(fileName)
+        if lock.tryLock(0):
+            lock.unlock()
+
+def removeRecoveryFile(fileName, lock):
+    if os.path.exists(fileName):
+        os.remove(fileName)
+    lock.unlock()
+
+class RecoveryWriter(QRunnable):
+    def __init__(self, fileName, origin, records):
+        super().__init__()
+
+        self.__fileName = fileName
+        self.__origin = origin
+        self.__records = records
+
+    def run(self):
+        try:
+            writeRecoveryFile(self.__fileName, self.__origin, self.__records)
+        except OSError:
+            pass
+
+class Autosaver(QObject):
+    def __init__(self, imageDatabase, interval=60000, directory=None, parent=None):
+        super().__init__(parent)
+
+        self.__imageDatabase = imageDatabase
+        directory = directory or autosaveDirectory()
+        os.makedirs(directory, exist_ok=True)
+        self.__fileName = os.path.join(directory, '{}-{}.autosave'.format(os.getpid(), int(time.time())))
+        self.__lock = lockRecoveryFile(self.__fileName)
+        self.__lock.tryLock(0)
+        self.__written = None
+        self.__threadPool = QThreadPool(self)
+        self.__threadPool.setMaxThreadCount(1)
+        self.__timer = QTimer(self)
+        self.__timer.timeout.connect(self.autosave)
+        self.__timer.start(interval)
+
+    def fileName(self):
+        return self.__fileName
+
+    def autosave(self):
+        if self.__threadPool.activeThreadCount() > 0:
+            return
+        if not self.__imageDatabase.modified():
+            self.discard()
+            return
+        # The records of the operations are encoded when they happen, so taking them is only copying a list.
+        # Pickling and writing them happens on the worker thread.
+        origin = self.__imageDatabase.origin()
+        records = self.__imageDatabase.pendingOperations()
+        if (origin, len(records)) == self.__written:
+            return
+        self.__written = (origin, len(records))
+        self.__threadPool.start(RecoveryWriter(self.__fileName, origin, records))
+
+    def discard(self):
+        if self.__written is None:
+            return
+        self.__threadPool.waitForDone()
+        if os.path.exists(self.__fileName):
+            os.remove(self.__fileName)
+        self.__written = None
+
+    def close(self):
+        self.__timer.stop()
+        self.discard()
+        self.__lock.unlock()
@@ -0,0 +1,171 @@
+import argparse
+import fnmatch
+
+# Everything beyond argparse is imported by the commands themselves so that the tool starts quickly and never needs QtWidgets.
+
+
+def readDatabase(fileName):
+    from labeling_tool.imagedatabase import ImageDatabase
+    import labeling_tool.labels
+
+    imageDatabase = ImageDatabase()
+    if fileName.lower().endswith('.json'):
+        imageDatabase.importFromJson(fileName)
+    else:
+        imageDatabase.readFromFile(fileName)
+    return imageDatabase
+
+def writeDatabase(imageDatabase, fileName):
+    if fileName.lower().endswith('.json'):
+        imageDatabase.exportToJson(fileName)
+    else:
+        imageDatabase.writeToFile(fileName)
+
+def newDatabase(labeledImages=()):
+    from labeling_tool.imagedatabase import ImageDatabase
+
+    imageDatabase = ImageDatabase()
+    imageDatabase.createNew()
+    imageDatabase.addLabeledImages(labeledImages)
+    return imageDatabase
+
+def labelTypeByName(name):
+    from labeling_tool.imagedatabase import LabelBase, jsonName
+    import labeling_tool.labels
+
+    for cls in LabelBase.__subclasses__():
+        if name.lower() in (jsonName(cls).lower(), cls.name().lower()):
+            return cls
+    raise argparse.ArgumentTypeError('unknown label type ' + repr(name))
+
+def exportDatabase(args):
+    readDatabase(args.database).exportToJson(args.output)
+
+def convertDatabase(args):
+    writeDatabase(readDatabase(args.input), args.output)
+
+def compactDatabase(args):
+    readDatabase(args.database).writeToFile(args.database, compact=True)
+
+def printStatistics(args):
+    from labeling_tool.imagedatabase import jsonName
+    from labeling_tool.labelstatistics import LabelStatistics
+
+    statistics = LabelStatistics(readDatabase(args.database).labeledImages)
+    for line in statistics.summary():
+        print(line)
+    outliers = statistics.outliers()
+    print('suspicious labels: {}'.format(len(outliers)))
+    for labeledImage, label, reason in outliers:
+        print('  {} ({}): {}'.format(labeledImage.imageFile, jsonName(type(label)), reason))
+
+def mergeDatabases(args):
+    from labeling_tool.imagedatabase import jsonName
+    from labeling_tool.merge import mergeDatabases
+
+    def conflict(imageFile, cls, reason):
+        print('conflict: {}{}: {}'.format(imageFile, ' ({})'.format(jsonName(cls)) if cls is not None else '', reason))
+    imageCount, conflictCount = mergeDatabases(args.output, args.databases, args.base, args.match, args.tolerance, args.cache, conflict)
+    print('{} images, {} conflicts'.format(imageCount, conflictCount))
+
+def filterDatabase(args):
+    def accept(labeledImage):
+        if args.path and not any(fnmatch.fnmatch(labeledImage.imageFile, pattern) for pattern in args.path):
+            return False
+        if any(not labeledImage.labels.get(cls) for cls in args.has):
+            return False
+        if any(labeledImage.labels.get(cls) for cls in args.without):
+            return False
+        return True
+    writeDatabase(newDatabase(filter(accept, readDatabase(args.database).labeledImages)), args.output)
+
+def extractPatches(args):
+    from labeling_tool.patches import exportPatches
+
+    labeledImages = readDatabase(args.database).labeledImages
+    numberOfPatches = exportPatches(labeledImages, args.output, args.type or [labelTypeByName('balls'), labelTypeByName('robots')],
+                                    args.size, args.margin, args.negatives, args.seed, args.jobs)
+    print('{} patches from {} images'.format(numberOfPatches, len(labeledImages)))
+
+def findDuplicates(args):
+    from labeling_tool.imagehashes import HashCache, findDuplicates, hashImages, isExactDuplicate, mergeDuplicates
+
+    imageDatabase = readDatabase(args.database)
+    cache = HashCache(args.cache)
+    try:
+        hashes = hashImages([labeledImage.imageFile for labeledImage in imageDatabase.labeledImages], cache, args.near > 0, args.jobs)
+    finally:
+        cache.close()
+    groups = findDuplicates(imageDatabase.labeledImages, hashes, args.near)
+    for group in groups:
+        print('copies:' if isExactDuplicate(group, hashes) else 'similar:')
+        for labeledImage in group:
+            print('  ' + labeledImage.imageFile)
+    print('{} groups with {} duplicate images'.format(len(groups), sum(len(group) - 1 for group in groups)))
+    if args.merge and groups:
+        for group in groups:
+            mergeDuplicates(imageDatabase, group)
+        writeDatabase(imageDatabase, args.database)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='labeling_tool', description='Batch operations on labeled image databases without a display. Files ending in .json are exported/imported JSON, .sqlite and .db are SQLite databases, .shards are sharded databases, everything else is a pickled database.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('export', help='export a database to JSON')
+    command.add_argument('database')
+    command.add_argument('output')
+    command.set_defaults(function=exportDatabase)
+
+    command = commands.add_parser('convert', help='convert a database to another format')
+    command.add_argument('input')
+    command.add_argument('output')
+    command.set_defaults(function=convertDatabase)
+
+    command = commands.add_parser('compact', help='fold the journal of a database into its snapshot')
+    command.add_argument('database')
+    command.set_defaults(function=compactDatabase)
+
+    command = commands.add_parser('stats', help='print label statistics and suspicious labels of a database')
+    command.add_argument('database')
+    command.set_defaults(function=printStatistics)
+
+    command = commands.add_parser('merge', help='merge databases, uniting the labels of images they share', description='Merge databases, e.g. of several labelers. Images are matched by path or content, nearly identical labels are kept once and disagreements are reported as conflicts. With a base, this is a three-way merge of the changes each database made to it. The inputs are sorted on disk, so only a pickled database as input or output has to fit into memory.')
+    command.add_argument('output')
+    command.add_argument('databases', nargs='+')
+    command.add_argument('--base', help='database the others were labeled from, removals relative to it are merged as well')
+    command.add_argument('--match', choices=('path', 'content'), default='path', help='match images by canonical path or by content hash (default path)')
+    command.add_argument('--tolerance', type=float, default=1.0, help='maximum difference of coordinates of labels that are considered identical (default 1 pixel)')
+    command.add_argument('--cache', help='hash cache file for --match content (default ~/.cache/labeling_tool/hashes.sqlite)')
+    command.set_defaults(function=mergeDatabases)
+
+    command = commands.add_parser('filter', help='write the images of a database that match all given conditions')
+    command.add_argument('database')
+    command.add_argument('output')
+    command.add_argument('--path', action='append', default=[], help='glob pattern the image file has to match (may be repeated)')
+    command.add_argument('--has', action='append', default=[], type=labelTypeByName, help='label type the image must have (may be repeated)')
+    command.add_argument('--without', action='append', default=[], type=labelTypeByName, help='label type the image must not have (may be repeated)')
+    command.set_defaults(function=filterDatabase)
+
+    command = commands.add_parser('patches', help='cut square training patches around labels and random negatives')
+    command.add_argument('database')
+    command.add_argument('output', help='directory for the patches and their index patches.csv')
+    command.add_argument('--type', action='append', default=[], type=labelTypeByName, help='label type to cut patches of (may be repeated, default balls and robots)')
+    command.add_argument('--size', type=int, default=32, help='side length of the patches in pixels')
+    command.add_argument('--margin', type=float, default=0.0, help='padding around each label relative to its size')
+    command.add_argument('--negatives', type=int, default=0, help='number of patches per image that do not touch any label')
+    command.add_argument('--seed', type=int, default=0, help='seed of the negative sampling')
+    command.add_argument('--jobs', type=int, default=None, help='number of worker processes (default one per CPU)')
+    command.set_defaults(function=extractPatches)
+
+    command = commands.add_parser('dedupe', help='find images with identical or similar content')
+    command.add_argument('database')
+    command.add_argument('--near', type=int, default=0, help='maximum number of differing bits of the perceptual hashes of similar images (default 0, only exact copies)')
+    command.add_argument('--merge', action='store_true', help='keep the first image of each group, move the labels of the others to it and remove them')
+    command.add_argument('--cache', help='hash cache file (default ~/.cache/labeling_tool/hashes.sqlite)')
+    command.add_argument('--jobs', type=int, default=None, help='number of hashing threads (default one per CPU)')
+    command.set_defaults(function=findDuplicates)
+
+    args = parser.parse_args(argv)
+    args.function(args)
+    return 0
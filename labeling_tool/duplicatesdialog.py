@@ -0,0 +1,60 @@
+from PyQt5.QtCore import pyqtSignal, Qt
+from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QPushButton, QTreeWidget, QTreeWidgetItem, QVBoxLayout
+
+from labeling_tool.imagedatabase import LabeledImage
+from labeling_tool.imagehashes import isExactDuplicate
+
+
+class DuplicatesDialog(QDialog):
+    imageActivated = pyqtSignal(LabeledImage)
+    mergeRequested = pyqtSignal(list)
+
+    def __init__(self, groups, hashes, parent=None):
+        super().__init__(parent)
+
+        self.setWindowTitle('Duplicates')
+
+        self.__treeWidget = QTreeWidget(self)
+        self.__treeWidget.setHeaderLabels(['Image', 'Labels'])
+        self.__treeWidget.setAlternatingRowColors(True)
+        self.__treeWidget.itemActivated.connect(self.__activate)
+        for group in groups:
+            groupItem = QTreeWidgetItem(self.__treeWidget, ['{} {} images'.format('Copies:' if isExactDuplicate(group, hashes) else 'Similar:', len(group))])
+            groupItem.setData(0, Qt.UserRole, group)
+            for labeledImage in group:
+                imageItem = QTreeWidgetItem(groupItem, [labeledImage.imageFile, str(sum(len(labels) for labels in labeledImage.labels.values()))])
+                imageItem.setData(0, Qt.UserRole, labeledImage)
+        self.__treeWidget.expandAll()
+        self.__treeWidget.resizeColumnToContents(0)
+
+        buttonBox = QDialogButtonBox(QDialogButtonBox.Close, self)
+        mergeButton = QPushButton('&Merge Selected', self)
+        mergeButton.setToolTip('Keep the first image of the selected groups and move the labels of the others to it')
+        mergeButton.clicked.connect(lambda: self.__merge(self.__treeWidget.selectedItems()))
+        buttonBox.addButton(mergeButton, QDialogButtonBox.ActionRole)
+        mergeAllButton = QPushButton('Merge &All', self)
+        mergeAllButton.clicked.connect(lambda: self.__merge([self.__treeWidget.topLevelItem(i) for i in range(self.__treeWidget.topLevelItemCount())]))
+        buttonBox.addButton(mergeAllButton, QDialogButtonBox.ActionRole)
+        buttonBox.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.__treeWidget)
+        layout.addWidget(buttonBox)
+
+        self.resize(800, 480)
+
+    def __activate(self, item):
+        if item.parent() is not None:
+            self.imageActivated.emit(item.data(0, Qt.UserRole))
+
+    def __merge(self, items):
+        groupItems = []
+        for item in items:
+            groupItem = item.parent() or item
+            if groupItem not in groupItems:
+                groupItems.append(groupItem)
+        if not groupItems:
+            return
+        self.mergeRequested.emit([groupItem.data(0, Qt.UserRole) for groupItem in groupItems])
+        for groupItem in groupItems:
+            self.__treeWidget.takeTopLevelItem(self.__treeWidget.indexOfTopLevelItem(groupItem))
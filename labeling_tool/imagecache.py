@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import pyqtSignal, QObject, QRunnable, QThreadPool
+from PyQt5.QtGui import QImage
+
+
+class DecoderSignals(QObject):
+    decoded = pyqtSignal(str, QImage)
+
+    def deliver(self, imageFile, image):
+        # When the application shuts down while an image is being decoded, nobody is left to receive it.
+        try:
+            self.decoded.emit(imageFile, image)
+        except RuntimeError:
+            pass
+
+class ImageDecoder(QRunnable):
+    def __init__(self, imageFile):
+        super().__init__()
+
+        # The cache keeps a reference until the image has been delivered.
+        self.setAutoDelete(False)
+        self.__imageFile = imageFile
+        self.signals = DecoderSignals()
+
+    def run(self):
+        self.signals.deliver(self.__imageFile, QImage(self.__imageFile))
+
+class ImageCache(QObject):
+    imageLoaded = pyqtSignal(str, QImage)
+
+    def __init__(self, maximumBytes=512 * 1024 * 1024, parent=None):
+        super().__init__(parent)
+
+        self.__maximumBytes = maximumBytes
+        self.__bytes = 0
+        self.__images = OrderedDict()
+        self.__pending = {}
+        self.__threadPool = QThreadPool(self)
+
+    def image(self, imageFile):
+        image = self.__images.get(imageFile)
+        if image is not None:
+            self.__images.move_to_end(imageFile)
+            return image
+        self.__load(imageFile, 1)
+        return None
+
+    def prefetch(self, imageFiles):
+        # Prefetches that have not started yet and are no longer wanted would only delay the new ones.
+        wanted = set(imageFiles)
+        for imageFile, decoder in list(self.__pending.items()):
+            if imageFile not in wanted and decoder.priority == 0 and self.__threadPool.tryTake(decoder):
+                del self.__pending[imageFile]
+        for imageFile in imageFiles:
+            if imageFile not in self.__images:
+                self.__load(imageFile, 0)
+
+    def __load(self, imageFile, priority):
+        pending = self.__pending.get(imageFile)
+        if pending is not None and (pending.priority >= priority or not self.__threadPool.tryTake(pending)):
+            return
+        decoder = ImageDecoder(imageFile)
+        decoder.signals.decoded.connect(self.__insert)
+        decoder.priority = priority
+        self.__pending[imageFile] = decoder
+        self.__threadPool.start(decoder, priority)
+
+    def __insert(self, imageFile, image):
+        self.__pending.pop(imageFile, None)
+        if not image.isNull() and imageFile not in self.__images:
+            self.__images[imageFile] = image
+            self.__bytes += image.sizeInBytes()
+            while self.__bytes > self.__maximumBytes and len(self.__images) > 1:
+                _, evicted = self.__images.popitem(last=False)
+                self.__bytes -= evicted.sizeInBytes()
+        self.imageLoaded.emit(imageFile, image)
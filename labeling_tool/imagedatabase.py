@@ -1,49 +1,257 @@
 from PyQt5.QtCore import pyqtSignal, QObject
-import pickle
+import bisect
+import contextlib
+import copy
+from enum import Enum
+import importlib
 import json
+import os
+import pickle
+import re
+
+from labeling_tool import journal
+from labeling_tool.undostack import UndoStack, inverseStep
 
 class LabeledImage:
     def __init__(self, imageFile = ''):
         self.imageFile = imageFile
         self.labels = {}
 
+    def __getattr__(self, name):
+        # This is only called as long as the labels are packed.
+        if name != 'labels' or 'packedLabels' not in self.__dict__:
+            raise AttributeError(name)
+        # The packed labels are only dropped once they could be unpacked.
+        self.labels = unpackLabels(self.__dict__['packedLabels'])
+        del self.__dict__['packedLabels']
+        return self.labels
+
+    def peekLabels(self):
+        # The labels of an image that is only read, e.g. when exporting, are not unpacked for good.
+        packedLabels = self.__dict__.get('packedLabels')
+        return unpackLabels(packedLabels) if packedLabels is not None else self.labels
+
+    def loadLabels(self):
+        # Brings the labels into memory, whether they are packed or still have to be loaded from the storage.
+        return self.labels
+
+    def __reduce__(self):
+        packedLabels = self.__dict__.get('packedLabels')
+        return (packedImage, (self.imageFile, packedLabels if packedLabels is not None else packLabels(self.labels)))
+
+class LazyLabeledImage(LabeledImage):
+    def __init__(self, imageFile, loadLabels):
+        self.imageFile = imageFile
+        self.__loadLabels = loadLabels
+
+    def __getattr__(self, name):
+        # This is only called as long as the labels have not been loaded or unpacked.
+        if name != 'labels':
+            raise AttributeError(name)
+        if 'packedLabels' in self.__dict__:
+            return super().__getattr__(name)
+        self.labels = self.__loadLabels(self.imageFile)
+        return self.labels
+
+    def setLoadLabels(self, loadLabels):
+        self.__loadLabels = loadLabels
+
+def packLabels(labels):
+    # The labels of an image as a single bytes object. A few hundred thousand label objects that are not looked at take
+    # many times the memory of their states, so images keep their labels packed until they are needed.
+    return pickle.dumps([(cls.__module__, cls.__qualname__, [label.__getstate__() for label in labelList]) for cls, labelList in labels.items()], pickle.HIGHEST_PROTOCOL)
+
+def unpackLabels(packedLabels):
+    # The label classes are looked up by their module like pickle does, their module need not have been imported yet.
+    labels = {}
+    for moduleName, name, states in pickle.loads(packedLabels):
+        cls = getattr(importlib.import_module(moduleName), name)
+        labelList = labels[cls] = []
+        for state in states:
+            label = cls.__new__(cls)
+            label.__setstate__(state)
+            labelList.append(label)
+    return labels
+
+def packedImage(imageFile, packedLabels):
+    labeledImage = LabeledImage.__new__(LabeledImage)
+    labeledImage.imageFile = imageFile
+    labeledImage.packedLabels = packedLabels
+    return labeledImage
+
 class LabelBase:
+    # Labels keep their geometry in flat numeric slots instead of a __dict__ with tuples. The public attributes listed
+    # in fields are properties on top of them.
+    __slots__ = ()
+    fields = ()
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Labels pickled before they had slots store their attributes in a dictionary.
+            for name, value in state.items():
+                setattr(self, name, value)
+        else:
+            for slot, value in zip(self.__slots__, state):
+                setattr(self, slot, value)
+
     def draw(self, painter):
         raise NotImplementedError
 
+    def boundingBox(self):
+        raise NotImplementedError
+
+    def distanceTo(self, x, y):
+        raise NotImplementedError
+
+    def translate(self, dx, dy):
+        raise NotImplementedError
+
     @staticmethod
     def requiredNumberOfClicks():
         raise NotImplementedError
 
+    @classmethod
+    def fromJson(cls, obj):
+        return cls(**{ name: tuple(value) if isinstance(value, list) else value for name, value in obj.items() })
+
+def jsonName(cls):
+    components = cls.name().split()
+    return components[0].title() + ''.join(_.title() for _ in components[1:])
+
 def encodeImageDatabase(obj):
-    def translateName(name):
-        components = name.split()
-        return components[0].title() + ''.join(_.title() for _ in components[1:])
     if isinstance(obj, LabeledImage):
-        return dict({ 'fileName':  obj.imageFile }, **{ translateName(cls.name()): labels for cls, labels in obj.labels.items() })
+        return dict({ 'fileName':  obj.imageFile }, **{ jsonName(cls): labels for cls, labels in obj.peekLabels().items() })
     elif isinstance(obj, LabelBase):
-        return obj.__dict__
+        return { name: getattr(obj, name) for name in obj.fields }
+    elif isinstance(obj, Enum):
+        return obj.name
     raise TypeError('Cannot serialize ', repr(obj))
 
+def iterEncodeImageDatabase(labeledImages):
+    # Produces the same text as json.dump({'imageDatabase': labeledImages}, f, default=encodeImageDatabase), one image at a time.
+    yield '{"imageDatabase": ['
+    separator = ''
+    for labeledImage in labeledImages:
+        yield separator + json.dumps(labeledImage, default=encodeImageDatabase)
+        separator = ', '
+    yield ']}'
+
+def iterDecodeImageDatabase(f, chunkSize=1 << 20):
+    # Parses the format written by iterEncodeImageDatabase one image at a time instead of loading the whole document.
+    labelTypes = { jsonName(cls): cls for cls in LabelBase.__subclasses__() }
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'\s*')
+    buffer = f.read(max(chunkSize, 4096))
+    header = re.compile(r'\s*\{\s*"imageDatabase"\s*:\s*\[\s*').match(buffer)
+    if header is None:
+        raise ValueError('Not an exported image database')
+    position = header.end()
+    expectImage = True
+    while True:
+        position = whitespace.match(buffer, position).end()
+        if position == len(buffer):
+            buffer = f.read(chunkSize)
+            position = 0
+            if not buffer:
+                raise ValueError('Unexpected end of exported image database')
+            continue
+        if buffer[position] == ']':
+            return
+        if not expectImage:
+            if buffer[position] != ',':
+                raise ValueError('Expected \',\' in exported image database at ' + repr(buffer[position:position + 20]))
+            position += 1
+            expectImage = True
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The image record is cut off at the end of the buffer, so more has to be read.
+            chunk = f.read(chunkSize)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        labeledImage = LabeledImage(obj.pop('fileName'))
+        for name, labels in obj.items():
+            cls = labelTypes[name]
+            labeledImage.labels[cls] = [cls.fromJson(label) for label in labels]
+        yield labeledImage
+        position = end
+        expectImage = False
+
+def canonicalPath(imageFile):
+    return os.path.normcase(os.path.abspath(imageFile))
+
+def fileStamp(fileName):
+    # The journal of a database is part of its state, so it is part of the stamp as well.
+    stamp = []
+    for name in (fileName, journal.journalFileName(fileName)):
+        try:
+            info = os.stat(name)
+        except FileNotFoundError:
+            stamp.append(None)
+            continue
+        stamp.append((info.st_size, info.st_mtime_ns))
+    return tuple(stamp)
+
+def storageForFile(fileName, isPinned=lambda labeledImage: False):
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension in ('.sqlite', '.db'):
+        from labeling_tool.sqlitestorage import SqliteStorage
+        return SqliteStorage()
+    if extension == '.shards':
+        from labeling_tool.shardedstorage import ShardedStorage
+        return ShardedStorage(isPinned=isPinned)
+    return journal.JournalStorage()
+
 class ImageDatabase(QObject):
     preImageDatabaseChanged = pyqtSignal()
     imageDatabaseChanged = pyqtSignal()
     preImageAdded = pyqtSignal(LabeledImage)
     imageAdded = pyqtSignal(LabeledImage)
+    preImagesAdded = pyqtSignal(int, int)
+    imagesAdded = pyqtSignal(int, int)
     preImageRemoved = pyqtSignal(LabeledImage)
     imageRemoved = pyqtSignal(LabeledImage)
-    preLabelAdded = pyqtSignal(LabeledImage, LabelBase)
+    preImagesRemoved = pyqtSignal(int, int)
+    imagesRemoved = pyqtSignal(list)
+    preLabelAdded = pyqtSignal(LabeledImage, LabelBase, int)
     labelAdded = pyqtSignal(LabeledImage, LabelBase)
     labelChanged = pyqtSignal(LabeledImage, LabelBase)
     preLabelRemoved = pyqtSignal(LabeledImage, LabelBase)
     labelRemoved = pyqtSignal(LabeledImage, LabelBase)
+    preImagesChanged = pyqtSignal()
+    imagesChanged = pyqtSignal(list)
+    labelsChanged = pyqtSignal(list)
+    undoStackChanged = pyqtSignal()
 
     def __init__(self, parent=None):
         super().__init__(parent)
 
+        self.__undoStack = UndoStack(parent=self)
+        self.__undoStack.changed.connect(self.undoStackChanged)
+        self.__undoStack.changed.connect(self.__forgetUndoImages)
+        self.__undoImages = None
+        self.__currentImage = None
+        self.__replaying = False
+        self.__transactionDepth = 0
+        self.__imagesChanging = False
+        self.__removedImages = {}
+        self.__changedImages = {}
         self.__modified = False
         self.__exists = False
+        self.__fileName = ''
+        self.__storage = None
+        self.__origin = None
+        self.__operations = []
         self.labeledImages = []
+        self.__positions = {}
+        self.__removedPositions = []
 
     def modified(self):
         return self.__modified
@@ -51,87 +259,429 @@ class ImageDatabase(QObject):
     def exists(self):
         return self.__exists
 
+    def origin(self):
+        return self.__origin
+
+    def pendingOperations(self):
+        return list(self.__operations)
+
+    def applyOperations(self, records):
+        if not self.__exists:
+            return
+        self.preImageDatabaseChanged.emit()
+        imagesByFile = { labeledImage.imageFile: labeledImage for labeledImage in self.labeledImages }
+        for record in records:
+            operation = journal.decodeOperation(record)
+            journal.applyOperation(self.labeledImages, imagesByFile, operation)
+            if self.__storage is not None:
+                self.__storage.touch(operation)
+        self.__operations.extend(records)
+        self.__buildIndex()
+        self.__modified = True
+        self.__undoStack.clear()
+        self.imageDatabaseChanged.emit()
+
     def clear(self):
         self.preImageDatabaseChanged.emit()
         self.__modified = False
         self.__exists = False
+        self.__fileName = ''
+        self.__setStorage(None)
+        self.__origin = None
+        self.__operations = []
         self.labeledImages = []
+        self.__buildIndex()
+        self.__undoStack.clear()
         self.imageDatabaseChanged.emit()
 
     def createNew(self):
         self.preImageDatabaseChanged.emit()
         self.__modified = False
         self.__exists = True
+        self.__fileName = ''
+        self.__setStorage(None)
+        self.__origin = ('new',)
+        self.__operations = []
         self.labeledImages = []
+        self.__buildIndex()
+        self.__undoStack.clear()
         self.imageDatabaseChanged.emit()
 
     def readFromFile(self, fileName):
         self.preImageDatabaseChanged.emit()
-        with open(fileName, 'rb') as f:
-            self.labeledImages = pickle.load(f)
+        storage = storageForFile(fileName, self.isPinned)
+        self.labeledImages = storage.read(fileName)
+        self.__buildIndex()
         self.__modified = False
         self.__exists = True
+        self.__fileName = fileName
+        self.__setStorage(storage)
+        self.__origin = ('database', fileName, fileStamp(fileName))
+        self.__operations = []
+        self.__undoStack.clear()
         self.imageDatabaseChanged.emit()
 
-    def writeToFile(self, fileName):
+    def writeToFile(self, fileName, compact=False):
         if not self.__exists:
             return
-        with open(fileName, 'wb') as f:
-            pickle.dump(self.labeledImages, f)
+        # Saving to the file the database came from only applies the operations since then, e.g. by appending them to its journal.
+        if fileName == self.__fileName:
+            self.__storage.update(fileName, self.__operations, self.labeledImages)
+            if compact:
+                self.__storage.compact(fileName, self.labeledImages)
+        else:
+            storage = storageForFile(fileName, self.isPinned)
+            storage.write(fileName, self.labeledImages)
+            self.__setStorage(storage)
         self.__modified = False
+        self.__fileName = fileName
+        self.__origin = ('database', fileName, fileStamp(fileName))
+        self.__operations = []
+
+    def setCurrentImage(self, labeledImage):
+        self.__currentImage = labeledImage
+        if self.__storage is not None and labeledImage is not None:
+            self.__storage.markUsed(labeledImage)
+
+    def isPinned(self, labeledImage):
+        # The undo stack and the widgets showing the current image refer to label objects, so a storage must not
+        # unload the labels of these images and load new objects in their place.
+        if labeledImage is self.__currentImage:
+            return True
+        if self.__undoImages is None:
+            self.__undoImages = self.__undoStack.images()
+        return labeledImage in self.__undoImages
+
+    def __forgetUndoImages(self):
+        self.__undoImages = None
+
+    def __setStorage(self, storage):
+        if self.__storage is not None and self.__storage is not storage:
+            self.__storage.close()
+        self.__storage = storage
+
+    def __buildIndex(self):
+        # Every image gets a position which is its row at the time the index was built. Removing an image does not shift
+        # the positions of the following ones, instead its position is remembered and subtracted when looking up a row.
+        self.__positions = { canonicalPath(labeledImage.imageFile): row for row, labeledImage in enumerate(self.labeledImages) }
+        self.__removedPositions = []
+
+    def __lookup(self, imageFile):
+        position = self.__positions.get(canonicalPath(imageFile))
+        if position is None:
+            return None
+        return position - bisect.bisect_left(self.__removedPositions, position)
+
+    def __insertIntoIndex(self, labeledImage):
+        self.__positions[canonicalPath(labeledImage.imageFile)] = len(self.labeledImages) + len(self.__removedPositions)
+
+    def __insertIntoIndexAt(self, row, labeledImage):
+        # An image that is put back where it was removed reuses the gap its position left. Only if that gap has been
+        # renumbered away since, the index has to be rebuilt.
+        if row == len(self.labeledImages):
+            self.__insertIntoIndex(labeledImage)
+            return True
+        nextPosition = self.__positions[canonicalPath(self.labeledImages[row].imageFile)]
+        previousPosition = self.__positions[canonicalPath(self.labeledImages[row - 1].imageFile)] if row > 0 else -1
+        i = bisect.bisect_left(self.__removedPositions, nextPosition)
+        if i == 0 or self.__removedPositions[i - 1] <= previousPosition:
+            return False
+        self.__positions[canonicalPath(labeledImage.imageFile)] = self.__removedPositions.pop(i - 1)
+        return True
+
+    def __removeFromIndex(self, labeledImage):
+        bisect.insort(self.__removedPositions, self.__positions.pop(canonicalPath(labeledImage.imageFile)))
+        if len(self.__removedPositions) > 1024:
+            self.__positions = { key: position - bisect.bisect_left(self.__removedPositions, position) for key, position in self.__positions.items() }
+            self.__removedPositions = []
+
+    def findImage(self, imageFile):
+        row = self.__lookup(imageFile)
+        return self.labeledImages[row] if row is not None else None
+
+    def rowOfImage(self, labeledImage):
+        row = self.__lookup(labeledImage.imageFile)
+        return row if row is not None and self.labeledImages[row] is labeledImage else None
+
+    def __record(self, *operation):
+        self.__operations.append(journal.encodeOperation(*operation))
+        # The storage must not let go of labels that have changed since the last save.
+        if self.__storage is not None:
+            self.__storage.touch(operation)
+
+    def importFromJson(self, fileName):
+        self.preImageDatabaseChanged.emit()
+        with open(fileName, 'r') as f:
+            self.labeledImages = list(iterDecodeImageDatabase(f))
+        self.__buildIndex()
+        # The imported images are not stored in a database file yet.
+        self.__modified = True
+        self.__exists = True
+        self.__fileName = ''
+        self.__setStorage(None)
+        self.__origin = ('json', fileName, fileStamp(fileName))
+        self.__operations = []
+        self.__undoStack.clear()
+        self.imageDatabaseChanged.emit()
 
     def exportToJson(self, fileName):
         if not self.__exists:
             return
         with open(fileName, 'w') as f:
-            json.dump({'imageDatabase': self.labeledImages}, f, default=encodeImageDatabase)
+            for chunk in iterEncodeImageDatabase(self.labeledImages):
+                f.write(chunk)
+
+    def undo(self):
+        if not self.__exists or not self.__undoStack.canUndo():
+            return
+        self.__replay([inverseStep(step) for step in reversed(self.__undoStack.takeUndo())])
+
+    def redo(self):
+        if not self.__exists or not self.__undoStack.canRedo():
+            return
+        self.__replay(self.__undoStack.takeRedo())
+
+    def canUndo(self):
+        return self.__undoStack.canUndo()
+
+    def canRedo(self):
+        return self.__undoStack.canRedo()
+
+    def undoText(self):
+        return self.__undoStack.undoText()
+
+    def redoText(self):
+        return self.__undoStack.redoText()
+
+    @contextlib.contextmanager
+    def transaction(self, text):
+        self.beginTransaction(text)
+        try:
+            yield
+        finally:
+            self.endTransaction()
+
+    def beginTransaction(self, text):
+        self.__undoStack.beginMacro(text)
+        self.__beginTransaction()
+
+    def endTransaction(self):
+        self.__endTransaction()
+        self.__undoStack.endMacro()
+
+    def __beginTransaction(self):
+        self.__transactionDepth += 1
+
+    def __endTransaction(self):
+        self.__transactionDepth -= 1
+        if self.__transactionDepth > 0:
+            return
+        # Listeners get one notification for all images and one for all labels, however many changes there were.
+        if self.__imagesChanging:
+            removedImages = [labeledImage for labeledImage in self.__removedImages if self.rowOfImage(labeledImage) is None]
+            self.__imagesChanging = False
+            self.__removedImages = {}
+            self.imagesChanged.emit(removedImages)
+        if self.__changedImages:
+            changedImages = [labeledImage for labeledImage in self.__changedImages if self.rowOfImage(labeledImage) is not None]
+            self.__changedImages = {}
+            if changedImages:
+                self.labelsChanged.emit(changedImages)
+
+    def __notify(self, signal, *args):
+        if self.__transactionDepth == 0:
+            signal.emit(*args)
+
+    def __touchImages(self, removedImages=()):
+        if self.__transactionDepth == 0:
+            return
+        if not self.__imagesChanging:
+            self.__imagesChanging = True
+            self.preImagesChanged.emit()
+        self.__removedImages.update(dict.fromkeys(removedImages))
+
+    def __touchLabels(self, labeledImage):
+        if self.__transactionDepth > 0:
+            self.__changedImages[labeledImage] = None
+
+    def __pushUndo(self, step):
+        if not self.__replaying:
+            self.__undoStack.push(step)
+
+    def __replay(self, steps):
+        # Undoing a transaction is a transaction again. Single steps keep their fine grained notifications.
+        self.__replaying = True
+        batched = len(steps) > 1
+        if batched:
+            self.__beginTransaction()
+        try:
+            for step in steps:
+                name = step[0]
+                if name == 'insertImages':
+                    self.__insertImages(step[1], step[2])
+                elif name == 'removeImages':
+                    self.__removeImages(step[1], step[2])
+                elif name == 'insertLabel':
+                    self.__insertLabel(step[1], step[2], step[3])
+                elif name == 'removeLabel':
+                    self.__removeLabel(step[1], step[2], step[3])
+                elif name == 'changeLabel':
+                    self.__changeLabel(step[1], step[2], step[3])
+        finally:
+            if batched:
+                self.__endTransaction()
+            self.__replaying = False
+
+    def __insertImages(self, row, labeledImages):
+        last = row + len(labeledImages) - 1
+        self.__touchImages()
+        self.__notify(self.preImagesAdded, row, last)
+        if row == len(self.labeledImages):
+            self.__record('addImages', labeledImages)
+        else:
+            self.__record('insertImages', row, labeledImages)
+        if row < len(self.labeledImages) and len(labeledImages) > 64:
+            self.labeledImages[row:row] = labeledImages
+            self.__buildIndex()
+        else:
+            indexed = True
+            for offset, labeledImage in enumerate(labeledImages):
+                indexed = indexed and self.__insertIntoIndexAt(row + offset, labeledImage)
+                self.labeledImages.insert(row + offset, labeledImage)
+            if not indexed:
+                self.__buildIndex()
+        self.__modified = True
+        self.__notify(self.imagesAdded, row, last)
+
+    def __removeImages(self, row, labeledImages):
+        self.__touchImages(labeledImages)
+        self.__notify(self.preImagesRemoved, row, row + len(labeledImages) - 1)
+        del self.labeledImages[row:row + len(labeledImages)]
+        # Many positions at once would be renumbered over and over, so large batches rebuild the index once instead.
+        if len(labeledImages) > 64:
+            self.__buildIndex()
+        else:
+            for labeledImage in labeledImages:
+                self.__removeFromIndex(labeledImage)
+        self.__record('removeImages', [labeledImage.imageFile for labeledImage in labeledImages])
+        self.__modified = True
+        self.__notify(self.imagesRemoved, labeledImages)
+
+    def __insertLabel(self, labeledImage, index, label):
+        labels = labeledImage.labels.setdefault(type(label), [])
+        self.__touchLabels(labeledImage)
+        self.__notify(self.preLabelAdded, labeledImage, label, index)
+        if index == len(labels):
+            self.__record('addLabel', labeledImage.imageFile, label)
+        else:
+            self.__record('insertLabel', labeledImage.imageFile, index, label)
+        labels.insert(index, label)
+        self.__modified = True
+        self.__notify(self.labelAdded, labeledImage, label)
+
+    def __removeLabel(self, labeledImage, index, label):
+        self.__touchLabels(labeledImage)
+        self.__notify(self.preLabelRemoved, labeledImage, label)
+        del labeledImage.labels[type(label)][index]
+        self.__record('removeLabel', labeledImage.imageFile, type(label), index)
+        self.__modified = True
+        self.__notify(self.labelRemoved, labeledImage, label)
+
+    def __changeLabel(self, labeledImage, label, changes):
+        self.__touchLabels(labeledImage)
+        for field, old, new in changes:
+            setattr(label, field, new)
+        self.__record('changeLabel', labeledImage.imageFile, labeledImage.labels[type(label)].index(label), label)
+        self.__modified = True
+        self.__notify(self.labelChanged, labeledImage, label)
 
     def addImage(self, labeledImage):
         if not self.__exists:
             return
 
-        # TODO: make sure that the same image is not already in the database
-        for f in self.labeledImages:
-            # TODO: make sure that absolute paths are compared
-            if f.imageFile == labeledImage.imageFile:
-                return
+        if canonicalPath(labeledImage.imageFile) in self.__positions:
+            return
 
-        self.preImageAdded.emit(labeledImage)
+        self.__touchImages()
+        self.__notify(self.preImageAdded, labeledImage)
+        self.__pushUndo(('insertImages', len(self.labeledImages), [labeledImage]))
+        self.__insertIntoIndex(labeledImage)
         self.labeledImages.append(labeledImage)
+        self.__record('addImage', labeledImage)
         self.__modified = True
-        self.imageAdded.emit(labeledImage)
+        self.__notify(self.imageAdded, labeledImage)
+
+    def addImages(self, imageFiles):
+        self.addLabeledImages(LabeledImage(imageFile) for imageFile in imageFiles)
+
+    def addLabeledImages(self, labeledImages):
+        if not self.__exists:
+            return
+
+        newImages = []
+        newImageFiles = set()
+        for labeledImage in labeledImages:
+            key = canonicalPath(labeledImage.imageFile)
+            if key in self.__positions or key in newImageFiles:
+                continue
+            newImageFiles.add(key)
+            newImages.append(labeledImage)
+        if not newImages:
+            return
+
+        self.__pushUndo(('insertImages', len(self.labeledImages), newImages))
+        self.__insertImages(len(self.labeledImages), newImages)
 
     def removeImage(self, labeledImage):
         if not self.__exists:
             return
 
-        # TODO: make sure that the image is indeed in the database
+        row = self.rowOfImage(labeledImage)
+        if row is None:
+            return
 
-        self.preImageRemoved.emit(labeledImage)
-        self.labeledImages.remove(labeledImage)
+        # The labels of a lazily loaded image have to be in memory before the storage forgets them, in case the removal is undone.
+        labeledImage.loadLabels()
+        self.__touchImages([labeledImage])
+        self.__notify(self.preImageRemoved, labeledImage)
+        self.__pushUndo(('removeImages', row, [labeledImage]))
+        del self.labeledImages[row]
+        self.__removeFromIndex(labeledImage)
+        self.__record('removeImage', labeledImage.imageFile)
         self.__modified = True
-        self.imageRemoved.emit(labeledImage)
+        self.__notify(self.imageRemoved, labeledImage)
 
     def addLabel(self, labeledImage, label):
         if not self.__exists:
             return
 
-        if not type(label) in labeledImage.labels:
-            labeledImage.labels[type(label)] = []
-
-        self.preLabelAdded.emit(labeledImage, label)
-        labeledImage.labels[type(label)].append(label)
-        self.__modified = True
-        self.labelAdded.emit(labeledImage, label)
+        index = len(labeledImage.labels.get(type(label), []))
+        self.__pushUndo(('insertLabel', labeledImage, index, label))
+        self.__insertLabel(labeledImage, index, label)
 
-    def changeLabel(self, labeledImage, label):
+    def changeLabel(self, labeledImage, label, previousState=None):
         if not self.__exists:
             return
 
-        # Well, I think it has already been changed.
+        # The label has already been changed by the caller. Only with the state it had before, the change can be undone.
+        if previousState is not None:
+            changes = tuple((field, old, new) for field, old, new in zip(type(label).__slots__, previousState, label.__getstate__()) if old != new)
+            if changes:
+                self.__pushUndo(('changeLabel', labeledImage, label, changes))
+        self.__changeLabel(labeledImage, label, ())
 
-        self.__modified = True
-        self.labelChanged.emit(labeledImage, label)
+    def copyLabels(self, source, target):
+        if not self.__exists:
+            return
+
+        # Labels the target already has an identical copy of are skipped.
+        with self.transaction('Copy Labels'):
+            for cls, labels in list(source.labels.items()):
+                states = { label.__getstate__() for label in target.labels.get(cls, []) }
+                for label in labels:
+                    if label.__getstate__() not in states:
+                        states.add(label.__getstate__())
+                        self.addLabel(target, copy.copy(label))
 
     def removeLabel(self, labeledImage, label):
         if not self.__exists:
@@ -140,7 +690,6 @@ class ImageDatabase(QObject):
         if not type(label) in labeledImage.labels:
             return
 
-        self.preLabelRemoved.emit(labeledImage, label)
-        labeledImage.labels[type(label)].remove(label)
-        self.__modified = True
-        self.labelRemoved.emit(labeledImage, label)
+        index = labeledImage.labels[type(label)].index(label)
+        self.__pushUndo(('removeLabel', labeledImage, index, label))
+        self.__removeLabel(labeledImage, index, label)
@@ -1,46 +1,218 @@
-from PyQt5.QtCore import pyqtSignal, QAbstractListModel, QModelIndex, Qt, QVariant
-from PyQt5.QtWidgets import QAction, QDockWidget, QMenu, QListView
+import bisect
+
+from PyQt5.QtCore import pyqtSignal, QAbstractListModel, QAbstractProxyModel, QModelIndex, QSize, Qt, QVariant
+from PyQt5.QtWidgets import QAction, QDockWidget, QLineEdit, QMenu, QListView, QVBoxLayout, QWidget
 
 from labeling_tool.imagedatabase import LabeledImage
+from labeling_tool.imagequery import parseQuery
 
 
 class ImageDatabaseModel(QAbstractListModel):
-    def __init__(self, imageDatabase, parent=None):
+    def __init__(self, imageDatabase, thumbnailCache=None, parent=None):
         super().__init__(parent)
 
         self.__imageDatabase = imageDatabase
+        self.__thumbnailCache = thumbnailCache
+        self.__thumbnailsVisible = False
+
+    def setThumbnailsVisible(self, visible):
+        self.layoutAboutToBeChanged.emit()
+        self.__thumbnailsVisible = visible and self.__thumbnailCache is not None
+        self.layoutChanged.emit()
 
     def data(self, index, role = Qt.DisplayRole):
         if self.__imageDatabase.exists() and index.isValid() and role == Qt.DisplayRole:
             return QVariant(self.__imageDatabase.labeledImages[index.row()].imageFile)
+        elif self.__imageDatabase.exists() and index.isValid() and role == Qt.DecorationRole and self.__thumbnailsVisible:
+            return QVariant(self.__thumbnailCache.thumbnail(self.__imageDatabase.labeledImages[index.row()].imageFile))
         else:
             return QVariant()
 
     def rowCount(self, parent = QModelIndex()):
         return len(self.__imageDatabase.labeledImages) if self.__imageDatabase.exists() else 0
 
+class ImageFilterModel(QAbstractProxyModel):
+    def __init__(self, imageDatabase, imageIndex, parent=None):
+        super().__init__(parent)
+
+        self.__imageDatabase = imageDatabase
+        self.__imageIndex = imageIndex
+        self.__terms = None
+        # The sorted source rows of the images that match, or None if there is no filter.
+        self.__rows = None
+        self.__removedRows = None
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self.__resetModel)
+        model.rowsAboutToBeInserted.connect(self.__preInsertRows)
+        model.rowsInserted.connect(self.__insertRows)
+        model.rowsAboutToBeRemoved.connect(self.__preRemoveRows)
+        model.rowsRemoved.connect(self.__removeRows)
+        model.layoutAboutToBeChanged.connect(lambda: self.layoutAboutToBeChanged.emit())
+        model.layoutChanged.connect(lambda: self.layoutChanged.emit())
+        model.dataChanged.connect(self.__changeData)
+
+    def setFilter(self, terms):
+        self.beginResetModel()
+        self.__terms = terms or None
+        self.__rows = self.__imageIndex.matchingRows(terms) if terms else None
+        self.endResetModel()
+
+    def isFiltered(self):
+        return self.__rows is not None
+
+    def insertionRow(self, sourceRow):
+        # The row at which the image in the source row is or would be if it matched.
+        return bisect.bisect_left(self.__rows, sourceRow) if self.__rows is not None else sourceRow
+
+    def updateImages(self, labeledImages, keptImage=None):
+        # Images whose labels changed are checked one by one. The kept image, usually the one being labeled, does not
+        # disappear from under the cursor just because it does not match anymore.
+        if self.__rows is None:
+            return
+        for labeledImage in labeledImages:
+            sourceRow = self.__imageDatabase.rowOfImage(labeledImage)
+            if sourceRow is None:
+                continue
+            row = bisect.bisect_left(self.__rows, sourceRow)
+            present = row < len(self.__rows) and self.__rows[row] == sourceRow
+            accepted = self.__imageIndex.matches(self.__terms, labeledImage)
+            if accepted and not present:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.__rows.insert(row, sourceRow)
+                self.endInsertRows()
+            elif present and not accepted and labeledImage is not keptImage:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.__rows[row]
+                self.endRemoveRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return len(self.__rows) if self.__rows is not None else self.sourceModel().rowCount()
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def index(self, row, column=0, parent=QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < self.rowCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self.__rows[index.row()] if self.__rows is not None else index.row())
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        row = self.insertionRow(index.row())
+        if self.__rows is not None and (row == len(self.__rows) or self.__rows[row] != index.row()):
+            return QModelIndex()
+        return self.index(row)
+
+    def __resetModel(self):
+        if self.__rows is not None:
+            self.__rows = self.__imageIndex.matchingRows(self.__terms)
+        self.endResetModel()
+
+    def __preInsertRows(self, parent, first, last):
+        if self.__rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+
+    def __insertRows(self, parent, first, last):
+        if self.__rows is None:
+            self.endInsertRows()
+            return
+        row = bisect.bisect_left(self.__rows, first)
+        count = last - first + 1
+        self.__rows[row:] = [sourceRow + count for sourceRow in self.__rows[row:]]
+        labeledImages = self.__imageDatabase.labeledImages
+        insertedRows = [sourceRow for sourceRow in range(first, last + 1) if self.__imageIndex.matches(self.__terms, labeledImages[sourceRow])]
+        if insertedRows:
+            self.beginInsertRows(QModelIndex(), row, row + len(insertedRows) - 1)
+            self.__rows[row:row] = insertedRows
+            self.endInsertRows()
+
+    def __preRemoveRows(self, parent, first, last):
+        if self.__rows is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            return
+        self.__removedRows = (bisect.bisect_left(self.__rows, first), bisect.bisect_right(self.__rows, last))
+        if self.__removedRows[0] < self.__removedRows[1]:
+            self.beginRemoveRows(QModelIndex(), self.__removedRows[0], self.__removedRows[1] - 1)
+
+    def __removeRows(self, parent, first, last):
+        if self.__rows is None:
+            self.endRemoveRows()
+            return
+        (row, end), self.__removedRows = self.__removedRows, None
+        count = last - first + 1
+        if row < end:
+            del self.__rows[row:end]
+            self.endRemoveRows()
+        self.__rows[row:] = [sourceRow - count for sourceRow in self.__rows[row:]]
+
+    def __changeData(self, topLeft, bottomRight, roles):
+        if topLeft.row() == bottomRight.row():
+            index = self.mapFromSource(topLeft)
+            if index.isValid():
+                self.dataChanged.emit(index, index, roles)
+        elif self.rowCount() > 0:
+            self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1), roles)
+
 class ImageDatabaseWidget(QDockWidget):
     addImageClicked = pyqtSignal()
+    addDirectoryClicked = pyqtSignal()
     selectImageClicked = pyqtSignal(LabeledImage)
     removeImageClicked = pyqtSignal(LabeledImage)
+    prefetchRequested = pyqtSignal(list)
+    imageStepped = pyqtSignal(LabeledImage, LabeledImage)
 
-    def __init__(self, imageDatabase, parent=None):
+    def __init__(self, imageDatabase, imageIndex, thumbnailCache=None, prefetchCount=4, parent=None):
         super().__init__(parent)
 
         self.setAllowedAreas(Qt.LeftDockWidgetArea)
         self.setWindowTitle('Image Database')
 
+        proxy = QWidget(self)
+        layout = QVBoxLayout(proxy)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.__filterEdit = QLineEdit(self)
+        self.__filterEdit.setPlaceholderText('Filter, e.g. robots=0 blurred game_03/*')
+        self.__filterEdit.setClearButtonEnabled(True)
+        self.__filterEdit.textChanged.connect(self.__changeFilter)
+        layout.addWidget(self.__filterEdit)
+
         self.__listView = QListView(self)
         self.__listView.customContextMenuRequested.connect(self.__prepareMenu)
-        self.__listView.activated.connect(lambda index: self.selectImageClicked.emit(self.__imageDatabase.labeledImages[index.row()]))
+        self.__listView.activated.connect(self.__activate)
         self.__listView.setAlternatingRowColors(True)
+        # With uniform item sizes and batched layouting the view only asks the model for the rows that are visible.
+        self.__listView.setUniformItemSizes(True)
+        self.__listView.setLayoutMode(QListView.Batched)
         self.__listView.setContextMenuPolicy(Qt.NoContextMenu)
+        layout.addWidget(self.__listView)
 
         self.__imageDatabase = imageDatabase
-        self.__listModel = ImageDatabaseModel(imageDatabase, self)
-        self.__listView.setModel(self.__listModel)
+        self.__prefetchCount = prefetchCount
+        self.__thumbnailCache = thumbnailCache
+        self.__currentImage = None
+        self.__listModel = ImageDatabaseModel(imageDatabase, thumbnailCache, self)
+        self.__filterModel = ImageFilterModel(imageDatabase, imageIndex, self)
+        self.__filterModel.setSourceModel(self.__listModel)
+        self.__listView.setModel(self.__filterModel)
+        if thumbnailCache is not None:
+            thumbnailCache.thumbnailLoaded.connect(self.__updateThumbnail)
 
-        self.setWidget(self.__listView)
+        self.setWidget(proxy)
 
     def preChangeImageDatabase(self):
         self.__listModel.beginResetModel()
@@ -56,13 +228,120 @@ class ImageDatabaseWidget(QDockWidget):
     def addImage(self, image):
         self.__listModel.endInsertRows()
 
+    def preAddImages(self, first, last):
+        self.__listModel.beginInsertRows(QModelIndex(), first, last)
+
+    def addImages(self, first, last):
+        self.__listModel.endInsertRows()
+
     def preRemoveImage(self, image):
-        index = self.__imageDatabase.labeledImages.index(image)
+        index = self.__imageDatabase.rowOfImage(image)
         self.__listModel.beginRemoveRows(QModelIndex(), index, index)
 
     def removeImage(self, image):
         self.__listModel.endRemoveRows()
 
+    def preRemoveImages(self, first, last):
+        self.__listModel.beginRemoveRows(QModelIndex(), first, last)
+
+    def removeImages(self, images):
+        self.__listModel.endRemoveRows()
+
+    def preChangeImages(self):
+        self.__currentImage = self.currentImage()
+        self.__listModel.beginResetModel()
+
+    def changeImages(self, removedImages):
+        self.__listModel.endResetModel()
+        # The reset forgets the current row, so it is looked up again for the image that was current.
+        self.__setCurrentImage(self.__currentImage)
+        self.__currentImage = None
+
+    def updateImages(self, labeledImages):
+        self.__filterModel.updateImages(labeledImages, self.currentImage())
+
+    def setThumbnailsVisible(self, visible):
+        self.__listView.setIconSize(self.__thumbnailCache.size() if visible and self.__thumbnailCache is not None else QSize())
+        self.__listModel.setThumbnailsVisible(visible)
+
+    def selectImage(self, image):
+        index = self.__indexOfImage(image)
+        # An image that does not match the filter can only be shown without it.
+        if not index.isValid() and self.__filterModel.isFiltered() and self.__imageDatabase.rowOfImage(image) is not None:
+            self.__filterEdit.clear()
+            index = self.__indexOfImage(image)
+        if not index.isValid():
+            return
+        self.__listView.setCurrentIndex(index)
+        self.__activate(index)
+
+    def currentImage(self):
+        return self.__imageAt(self.__listView.currentIndex())
+
+    def selectNextImage(self):
+        self.__step(1)
+
+    def selectPreviousImage(self):
+        self.__step(-1)
+
+    def __imageAt(self, index):
+        index = self.__filterModel.mapToSource(index)
+        return self.__imageDatabase.labeledImages[index.row()] if index.isValid() else None
+
+    def __indexOfImage(self, image):
+        row = self.__imageDatabase.rowOfImage(image)
+        return self.__filterModel.mapFromSource(self.__listModel.index(row)) if row is not None else QModelIndex()
+
+    def __setCurrentImage(self, image):
+        index = self.__indexOfImage(image) if image is not None else QModelIndex()
+        if index.isValid():
+            self.__listView.setCurrentIndex(index)
+
+    def __changeFilter(self, text):
+        try:
+            terms = parseQuery(text)
+        except ValueError as error:
+            self.__filterEdit.setStyleSheet('color: red')
+            self.__filterEdit.setToolTip(str(error))
+            return
+        self.__filterEdit.setStyleSheet('')
+        self.__filterEdit.setToolTip('')
+        currentImage = self.currentImage()
+        self.__filterModel.setFilter(terms)
+        self.__setCurrentImage(currentImage)
+
+    def __step(self, direction):
+        previousImage = self.currentImage()
+        row = self.__listView.currentIndex().row() + direction if previousImage is not None else 0
+        if not 0 <= row < self.__filterModel.rowCount():
+            return
+        index = self.__filterModel.index(row)
+        self.__listView.setCurrentIndex(index)
+        self.__activate(index, direction)
+        if previousImage is not None:
+            self.imageStepped.emit(previousImage, self.__imageAt(index))
+
+    def __activate(self, index, direction=0):
+        row = index.row()
+        self.selectImageClicked.emit(self.__imageAt(index))
+
+        # While stepping through a sequence, the frames ahead are decoded first and twice as far.
+        # With a filter, the sequence is the images that match it.
+        if direction != 0:
+            rows = [row + direction * distance for distance in range(1, 2 * self.__prefetchCount + 1)] + [row - direction]
+        else:
+            rows = []
+            for distance in range(1, self.__prefetchCount + 1):
+                rows += [row + distance, row - distance]
+        self.prefetchRequested.emit([self.__imageAt(self.__filterModel.index(r)).imageFile for r in rows if 0 <= r < self.__filterModel.rowCount()])
+
+    def __updateThumbnail(self, imageFile):
+        labeledImage = self.__imageDatabase.findImage(imageFile) if self.__imageDatabase.exists() else None
+        row = self.__imageDatabase.rowOfImage(labeledImage) if labeledImage is not None else None
+        if row is not None:
+            index = self.__listModel.index(row)
+            self.__listModel.dataChanged.emit(index, index, [Qt.DecorationRole])
+
     def __prepareMenu(self, pos):
         menu = QMenu(self)
 
@@ -70,12 +349,16 @@ class ImageDatabaseWidget(QDockWidget):
         addFileAction.triggered.connect(lambda: self.addImageClicked.emit())
         menu.addAction(addFileAction)
 
-        index = self.__listView.indexAt(pos)
-        if index.isValid():
+        addDirectoryAction = QAction('Add Directory...', self)
+        addDirectoryAction.triggered.connect(lambda: self.addDirectoryClicked.emit())
+        menu.addAction(addDirectoryAction)
+
+        image = self.__imageAt(self.__listView.indexAt(pos))
+        if image is not None:
             menu.addSeparator()
 
             removeFileAction = QAction('Remove Image', self)
-            removeFileAction.triggered.connect(lambda: self.removeImageClicked.emit(self.__imageDatabase.labeledImages[index.row()]))
+            removeFileAction.triggered.connect(lambda: self.removeImageClicked.emit(image))
             menu.addAction(removeFileAction)
 
         menu.exec_(self.__listView.mapToGlobal(pos))
@@ -0,0 +1,161 @@
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QImageReader
+
+from labeling_tool.imagedatabase import canonicalPath
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hashes (
+    imageFile TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    contentHash TEXT NOT NULL,
+    perceptualHash TEXT
+);
+'''
+
+def cacheDirectory():
+    cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cacheHome, 'labeling_tool')
+
+def defaultCacheFile():
+    return os.path.join(cacheDirectory(), 'hashes.sqlite')
+
+class HashCache:
+    def __init__(self, fileName=None):
+        fileName = fileName or defaultCacheFile()
+        os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok=True)
+        self.__connection = sqlite3.connect(fileName)
+        self.__connection.executescript(SCHEMA)
+
+    def lookup(self, imageFile, stat):
+        row = self.__connection.execute('SELECT size, mtime, contentHash, perceptualHash FROM hashes WHERE imageFile = ?', (canonicalPath(imageFile),)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        return row[2], row[3]
+
+    def store(self, entries):
+        with self.__connection:
+            self.__connection.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                                          [(canonicalPath(imageFile), stat.st_size, stat.st_mtime_ns, contentHash, perceptualHash) for imageFile, stat, contentHash, perceptualHash in entries])
+
+    def close(self):
+        self.__connection.close()
+
+def contentHash(imageFile):
+    digest = hashlib.sha256()
+    with open(imageFile, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def perceptualHash(imageFile):
+    # A difference hash: each bit tells whether a pixel of a 9x8 thumbnail is brighter than its right neighbour.
+    # Letting the reader scale allows JPEG images to be decoded at a fraction of their size.
+    reader = QImageReader(imageFile)
+    reader.setScaledSize(QSize(9, 8))
+    image = reader.read()
+    if image.isNull():
+        return None
+    bits = 0
+    for y in range(8):
+        gray = [image.pixel(x, y) & 0xff for x in range(9)]
+        for x in range(8):
+            bits = bits << 1 | (gray[x] > gray[x + 1])
+    return '{:016x}'.format(bits)
+
+def imageHashes(imageFile, knownContentHash, perceptual):
+    return knownContentHash or contentHash(imageFile), perceptualHash(imageFile) if perceptual else None
+
+def hashImages(imageFiles, cache, perceptual=False, workers=None, progress=None, interrupted=lambda: False):
+    hashes = {}
+    tasks = []
+    for imageFile in imageFiles:
+        try:
+            stat = os.stat(imageFile)
+        except OSError:
+            continue
+        cached = cache.lookup(imageFile, stat)
+        if cached is not None and (cached[1] is not None or not perceptual):
+            hashes[imageFile] = cached
+        else:
+            tasks.append((imageFile, stat, cached[0] if cached is not None else None))
+
+    done = len(hashes)
+    if progress:
+        progress(done)
+    # Reading, SHA-256 and image decoding all release the GIL, so threads keep every core busy.
+    with concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        futures = {executor.submit(imageHashes, imageFile, known, perceptual): (imageFile, stat) for imageFile, stat, known in tasks}
+        entries = []
+        for future in concurrent.futures.as_completed(futures):
+            if interrupted():
+                for pending in futures:
+                    pending.cancel()
+                break
+            imageFile, stat = futures[future]
+            try:
+                hashes[imageFile] = future.result()
+            except OSError:
+                continue
+            entries.append((imageFile, stat) + hashes[imageFile])
+            done += 1
+            if len(entries) == 256:
+                cache.store(entries)
+                entries = []
+                if progress:
+                    progress(done)
+        cache.store(entries)
+    if progress:
+        progress(done)
+    return hashes
+
+def hammingDistance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+def bandKeys(bits, maximumDistance):
+    # Split the 64 bits into maximumDistance + 1 bands. Hashes that differ in at most maximumDistance bits agree on at least one band.
+    value = int(bits, 16)
+    bounds = [round(band * 64 / (maximumDistance + 1)) for band in range(maximumDistance + 2)]
+    return [(band, value >> low & ((1 << (high - low)) - 1)) for band, (low, high) in enumerate(zip(bounds, bounds[1:]))]
+
+def findDuplicates(labeledImages, hashes, maximumDistance=0):
+    # The first image of a group leads it. Later images join the first leader they are similar to,
+    # which keeps a slowly changing sequence of frames from being chained into a single group.
+    groups = []
+    leaderHashes = []
+    groupsByContent = {}
+    leadersByBand = {}
+    for labeledImage in labeledImages:
+        if labeledImage.imageFile not in hashes:
+            continue
+        contentHash, bits = hashes[labeledImage.imageFile]
+        group = groupsByContent.get(contentHash)
+        keys = bandKeys(bits, maximumDistance) if maximumDistance > 0 and bits is not None else []
+        if group is None and keys:
+            candidates = sorted({leader for key in keys for leader in leadersByBand.get(key, ())})
+            group = next((leader for leader in candidates if hammingDistance(bits, leaderHashes[leader]) <= maximumDistance), None)
+        if group is None:
+            group = len(groups)
+            groups.append([])
+            leaderHashes.append(bits)
+            for key in keys:
+                leadersByBand.setdefault(key, []).append(group)
+        groupsByContent.setdefault(contentHash, group)
+        groups[group].append(labeledImage)
+    return [group for group in groups if len(group) > 1]
+
+def isExactDuplicate(group, hashes):
+    return len({hashes[labeledImage.imageFile][0] for labeledImage in group}) == 1
+
+def mergeDuplicates(imageDatabase, group):
+    # The first image is kept. Labels of the others move to it unless it already has an identical one.
+    kept, duplicates = group[0], group[1:]
+    for duplicate in duplicates:
+        imageDatabase.copyLabels(duplicate, kept)
+        imageDatabase.removeImage(duplicate)
@@ -0,0 +1,251 @@
+import fnmatch
+import functools
+import operator
+import os
+import re
+from enum import Enum
+
+from PyQt5.QtCore import pyqtSignal, QObject
+
+from labeling_tool.imagedatabase import LabelBase, jsonName
+
+
+comparisons = {'=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+termPattern = re.compile(r'(?:(\w+)\.)?(\w+)(?:(!=|<=|>=|=|<|>)(\w+))?$')
+trueWords = ('true', 'yes', '1')
+falseWords = ('false', 'no', '0')
+
+def parseQuery(text):
+    # A query is a list of terms that all have to match. A leading '-' negates a term.
+    #   robots, robots=0, balls>2     number of labels of a type, 'robots' is 'robots>0'
+    #   labeled, unlabeled            whether an image has any labels
+    #   blurred, teamColor=red        attributes of labels, optionally of one type only as in robots.teamColor!=blue
+    #   game_03/*, path:*.png         glob patterns the path of an image ends with
+    labelTypes = { jsonName(cls).lower(): cls for cls in LabelBase.__subclasses__() }
+    terms = []
+    for word in text.split():
+        negated = word.startswith('-') and len(word) > 1
+        if negated:
+            word = word[1:]
+        if word.lower() == 'unlabeled':
+            negated, word = not negated, 'labeled'
+        terms.append((negated, parseTerm(word, labelTypes)))
+    return terms
+
+def parseTerm(word, labelTypes):
+    if word.lower().startswith('path:'):
+        return ('path', os.path.normcase(word[5:]))
+    if any(c in word for c in '/\\*?['):
+        return ('path', os.path.normcase(word))
+    match = termPattern.match(word)
+    if match is None:
+        raise ValueError('Cannot parse query term ' + repr(word))
+    qualifier, name, op, value = match.groups()
+    name = name.lower()
+    if qualifier is None and name == 'labeled' and op is None:
+        return ('labeled',)
+    if qualifier is None and name in labelTypes:
+        if op is None:
+            op, value = '>', '0'
+        if not value.isdigit():
+            raise ValueError('Expected a number of labels in ' + repr(word))
+        return ('count', labelTypes[name], comparisons[op], int(value))
+    if qualifier is not None and qualifier.lower() not in labelTypes:
+        raise ValueError('Unknown label type ' + repr(qualifier))
+    classes = [labelTypes[qualifier.lower()]] if qualifier is not None else list(labelTypes.values())
+    slots = [(cls, slot) for cls in classes for slot in cls.__slots__ if slot.lower() == name]
+    if not slots:
+        raise ValueError('Unknown label type or attribute ' + repr(word))
+    if op is None:
+        op, value = '=', 'true'
+    if op not in ('=', '!='):
+        raise ValueError('Attributes can only be compared with = and != in ' + repr(word))
+    return ('attribute', tuple(slots), op == '=', value.lower())
+
+def valueMatches(value, text):
+    if isinstance(value, bool):
+        return text in (trueWords if value else falseWords)
+    return isinstance(value, Enum) and value.name.lower() == text
+
+def isIndexed(value):
+    # Only values that come from a small set are worth an index. Coordinates are different for almost every label.
+    return isinstance(value, (bool, Enum))
+
+def imageKeys(labeledImage):
+    keys = set()
+    for cls, labels in labeledImage.peekLabels().items():
+        if not labels:
+            continue
+        keys.add(('labeled',))
+        keys.add(('count', cls, len(labels)))
+        slots = [slot for slot in cls.__slots__ if isIndexed(getattr(labels[0], slot))]
+        for label in labels:
+            for slot in slots:
+                keys.add(('attribute', cls, slot, getattr(label, slot)))
+    return frozenset(keys)
+
+def directories(path):
+    # File names are left out, an index entry for every single image would not narrow anything down.
+    return [component for component in re.split(r'[\\/]', path)[:-1] if component]
+
+@functools.lru_cache(maxsize=64)
+def pathExpression(pattern):
+    # The pattern matches the whole path or any part of it that starts with a directory.
+    return re.compile('(?:.*/)?' + fnmatch.translate(pattern.replace('\\', '/')))
+
+def pathMatches(imageFile, pattern):
+    return pathExpression(pattern).match(os.path.normcase(imageFile).replace('\\', '/')) is not None
+
+class ImageIndex(QObject):
+    # Emitted after the labels of images changed, which may change whether they match a query.
+    imagesUpdated = pyqtSignal(list)
+
+    def __init__(self, imageDatabase, parent=None):
+        super().__init__(parent)
+
+        self.__imageDatabase = imageDatabase
+        self.__built = False
+        self.__keys = {}
+        self.__keySets = {}
+        self.__postings = {}
+        self.__directories = {}
+
+        # The index has to be connected before any view, so it is up to date when the views ask for the images that match.
+        imageDatabase.imageDatabaseChanged.connect(self.__invalidate)
+        imageDatabase.imageAdded.connect(lambda labeledImage: self.__addImages([labeledImage]))
+        imageDatabase.imagesAdded.connect(lambda first, last: self.__addImages(imageDatabase.labeledImages[first:last + 1]))
+        imageDatabase.imageRemoved.connect(lambda labeledImage: self.__removeImages([labeledImage]))
+        imageDatabase.imagesRemoved.connect(self.__removeImages)
+        imageDatabase.imagesChanged.connect(self.__changeImages)
+        imageDatabase.labelAdded.connect(lambda labeledImage, label: self.__updateImages([labeledImage]))
+        imageDatabase.labelChanged.connect(lambda labeledImage, label: self.__updateImages([labeledImage]))
+        imageDatabase.labelRemoved.connect(lambda labeledImage, label: self.__updateImages([labeledImage]))
+        imageDatabase.labelsChanged.connect(self.__updateImages)
+
+    def matchingImages(self, terms):
+        self.__build()
+        # The smallest sets are intersected first, negated terms are subtracted from the result.
+        positive = sorted((self.__termImages(term) for negated, term in terms if not negated), key=len)
+        result = set(positive[0]) if positive else set(self.__keys)
+        for images in positive[1:]:
+            result.intersection_update(images)
+        for negated, term in terms:
+            if negated:
+                result.difference_update(self.__termImages(term))
+        return result
+
+    def matchingRows(self, terms):
+        # Only the images that match are looked up in the path index of the database, the others are never looked at.
+        rows = (self.__imageDatabase.rowOfImage(labeledImage) for labeledImage in self.matchingImages(terms))
+        return sorted(row for row in rows if row is not None)
+
+    def matches(self, terms, labeledImage):
+        # A single image is checked against its labels directly, so this does not need the index to be built.
+        return all(self.__termAccepts(term, labeledImage) != negated for negated, term in terms)
+
+    def __termImages(self, term):
+        kind = term[0]
+        if kind == 'labeled':
+            return self.__postings.get(('labeled',), set())
+        elif kind == 'count':
+            _, cls, compare, count = term
+            # Every number of labels an image has of the type has its own entry, so only a few sets are combined.
+            keys = [key for key in self.__postings if key[0] == 'count' and key[1] is cls]
+            if not compare(0, count):
+                return set().union(*(self.__postings[key] for key in keys if compare(key[2], count)))
+            # Images without labels of the type match, so the result is every image except those that do not.
+            return set(self.__keys).difference(*(self.__postings[key] for key in keys if not compare(key[2], count)))
+        elif kind == 'attribute':
+            _, slots, equal, text = term
+            images = set()
+            for key, postings in self.__postings.items():
+                if key[0] == 'attribute' and (key[1], key[2]) in slots and valueMatches(key[3], text) == equal:
+                    images.update(postings)
+            return images
+        elif kind == 'path':
+            pattern = term[1]
+            # Literal directories of the pattern narrow the images down before the pattern is matched.
+            candidates = sorted((self.__directories.get(directory, set()) for directory in directories(pattern) if not any(c in directory for c in '*?[')), key=len)
+            images = candidates[0] if candidates else self.__keys
+            for other in candidates[1:]:
+                images = images & other
+            return {labeledImage for labeledImage in images if pathMatches(labeledImage.imageFile, pattern)}
+        raise ValueError('Unknown query term ' + repr(kind))
+
+    def __termAccepts(self, term, labeledImage):
+        kind = term[0]
+        if kind == 'labeled':
+            return any(labeledImage.labels.values())
+        elif kind == 'count':
+            _, cls, compare, count = term
+            return compare(len(labeledImage.labels.get(cls, ())), count)
+        elif kind == 'attribute':
+            _, slots, equal, text = term
+            return any(valueMatches(getattr(label, slot), text) == equal
+                       for cls, slot in slots for label in labeledImage.labels.get(cls, ()) if isIndexed(getattr(label, slot)))
+        elif kind == 'path':
+            return pathMatches(labeledImage.imageFile, term[1])
+        raise ValueError('Unknown query term ' + repr(kind))
+
+    def __build(self):
+        if self.__built:
+            return
+        self.__built = True
+        self.__addImages(self.__imageDatabase.labeledImages if self.__imageDatabase.exists() else [])
+
+    def __invalidate(self):
+        # Building the index loads the labels of every image, so it only happens once a query needs it.
+        self.__built = False
+        self.__keys = {}
+        self.__keySets = {}
+        self.__postings = {}
+        self.__directories = {}
+
+    def __setKeys(self, labeledImage, keys):
+        # Most images share the same few sets of keys, so each set is only stored once.
+        keys = self.__keySets.setdefault(keys, keys)
+        oldKeys = self.__keys.get(labeledImage, frozenset())
+        for key in oldKeys - keys:
+            postings = self.__postings[key]
+            postings.discard(labeledImage)
+            if not postings:
+                del self.__postings[key]
+        for key in keys - oldKeys:
+            self.__postings.setdefault(key, set()).add(labeledImage)
+        self.__keys[labeledImage] = keys
+
+    def __addImages(self, labeledImages):
+        if not self.__built:
+            return
+        for labeledImage in labeledImages:
+            for directory in directories(os.path.normcase(labeledImage.imageFile)):
+                self.__directories.setdefault(directory, set()).add(labeledImage)
+            self.__setKeys(labeledImage, imageKeys(labeledImage))
+
+    def __removeImages(self, labeledImages):
+        if not self.__built:
+            return
+        for labeledImage in labeledImages:
+            if labeledImage not in self.__keys:
+                continue
+            self.__setKeys(labeledImage, frozenset())
+            del self.__keys[labeledImage]
+            for directory in directories(os.path.normcase(labeledImage.imageFile)):
+                images = self.__directories.get(directory)
+                if images is not None:
+                    images.discard(labeledImage)
+                    if not images:
+                        del self.__directories[directory]
+
+    def __changeImages(self, removedImages):
+        # A transaction only tells which images were removed. The added ones are those the index does not know yet.
+        self.__removeImages(removedImages)
+        if self.__built:
+            self.__addImages([labeledImage for labeledImage in self.__imageDatabase.labeledImages if labeledImage not in self.__keys])
+
+    def __updateImages(self, labeledImages):
+        if self.__built:
+            for labeledImage in labeledImages:
+                if labeledImage in self.__keys:
+                    self.__setKeys(labeledImage, imageKeys(labeledImage))
+        self.imagesUpdated.emit(labeledImages)
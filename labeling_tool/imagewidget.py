@@ -1,33 +1,85 @@
-from PyQt5.QtCore import pyqtSignal, Qt, QPoint, QRect
-from PyQt5.QtGui import QImage, QPainter
+import math
+
+from PyQt5.QtCore import pyqtSignal, Qt, QPoint, QPointF, QRect, QRectF, QSize
+from PyQt5.QtGui import QImage, QPainter, QPen, QPicture, QPixmap, QTransform
 from PyQt5.QtWidgets import QWidget
 
+from labeling_tool.imagedatabase import LabelBase, LabeledImage
+from labeling_tool.spatialindex import SpatialIndex
+
 class ImageWidget(QWidget):
     mousePressed = pyqtSignal(QPoint)
     mouseMoved = pyqtSignal(QPoint)
+    labelClicked = pyqtSignal(LabeledImage, LabelBase)
+    labelMoved = pyqtSignal(LabeledImage, LabelBase, object)
 
-    def __init__(self, parent=None):
+    def __init__(self, imageCache, tileSize=512, parent=None):
         super().__init__(parent)
 
         self.__hiddenLabelTypes = set()
+        self.__overlays = {}
         self.__image = QImage()
+        self.__imageSize = QSize()
+        self.__levels = []
+        self.__tiles = {}
+        self.__tileSize = tileSize
+        # The view shows the image point self.__center in the middle of the widget, magnified by self.__scale.
+        self.__center = QPointF()
+        self.__scale = 1.0
+        self.__panPosition = None
+        self.__imageCache = imageCache
+        self.__imageCache.imageLoaded.connect(self.__imageLoaded)
         self.__selectedImage = None
 
+        self.__spatialIndex = SpatialIndex()
+        self.__remainingClicks = 0
+        self.__hoveredLabel = None
+        self.__selectedLabel = None
+        self.__draggedLabel = None
+        self.__dragPosition = QPoint()
+        self.__dragMoved = False
+        self.__dragState = None
+        self.__hoverPen = QPen(Qt.cyan, 1, Qt.DashLine)
+        self.__hoverPen.setCosmetic(True)
+        self.__selectionPen = QPen(Qt.cyan, 1)
+        self.__selectionPen.setCosmetic(True)
+
         self.setMouseTracking(True)
         self.setCursor(Qt.CrossCursor)
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
 
-        if event.button() != 1 or self.__image.isNull() or not self.__selectedImage:
+        if self.__image.isNull() or not self.__selectedImage:
+            return
+
+        if event.button() == Qt.MiddleButton:
+            self.__panPosition = event.pos()
+            self.setCursor(Qt.ClosedHandCursor)
+            return
+
+        if event.button() != Qt.LeftButton:
             return
 
-        origin = QPoint(self.width() / 2 - self.__image.width() / 2, self.height() / 2 - self.__image.height() / 2)
-        relPos = event.pos() - origin
+        relPos = self.__imagePos(event.pos())
         if relPos.x() < 0 or relPos.y() < 0 or relPos.x() >= self.__image.width() or relPos.y() >= self.__image.height():
             return
 
-        self.mousePressed.emit(relPos)
+        # While a label is being created, clicks are its points. Otherwise they pick the label under the cursor.
+        if self.__remainingClicks > 0:
+            self.mousePressed.emit(relPos)
+            return
+
+        self.__updateLabel(self.__selectedLabel)
+        self.__selectedLabel = self.__labelAt(relPos)
+        self.__updateLabel(self.__selectedLabel)
+        if self.__selectedLabel is None:
+            return
+        self.__draggedLabel = self.__selectedLabel
+        self.__dragPosition = relPos
+        self.__dragMoved = False
+        self.__dragState = self.__selectedLabel.__getstate__()
+        self.labelClicked.emit(self.__selectedImage, self.__selectedLabel)
 
     def mouseMoveEvent(self, event):
         super().mouseMoveEvent(event)
@@ -35,30 +87,196 @@ class ImageWidget(QWidget):
         if self.__image.isNull() or not self.__selectedImage:
             return
 
-        origin = QPoint(self.width() / 2 - self.__image.width() / 2, self.height() / 2 - self.__image.height() / 2)
-        relPos = event.pos() - origin
+        if self.__panPosition is not None:
+            delta = event.pos() - self.__panPosition
+            self.__panPosition = event.pos()
+            self.__center -= QPointF(delta) / self.__scale
+            self.update()
+            return
+
+        relPos = self.__imagePos(event.pos())
+
+        if self.__draggedLabel is not None:
+            delta = relPos - self.__dragPosition
+            if not delta.isNull():
+                self.__updateLabel(self.__draggedLabel)
+                self.__draggedLabel.translate(delta.x(), delta.y())
+                self.__dragPosition = relPos
+                self.__dragMoved = True
+                self.__overlays.pop(type(self.__draggedLabel), None)
+                self.__updateLabel(self.__draggedLabel)
+        else:
+            hoveredLabel = self.__labelAt(relPos) if self.__remainingClicks == 0 else None
+            if hoveredLabel is not self.__hoveredLabel:
+                self.__updateLabel(self.__hoveredLabel)
+                self.__hoveredLabel = hoveredLabel
+                self.__updateLabel(self.__hoveredLabel)
 
         self.mouseMoved.emit(relPos)
 
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+
+        if event.button() == Qt.MiddleButton and self.__panPosition is not None:
+            self.__panPosition = None
+            self.setCursor(Qt.CrossCursor)
+            return
+
+        draggedLabel = self.__draggedLabel
+        self.__draggedLabel = None
+        if draggedLabel is not None and self.__dragMoved:
+            self.labelMoved.emit(self.__selectedImage, draggedLabel, self.__dragState)
+
+    def wheelEvent(self, event):
+        if self.__image.isNull():
+            return
+        self.zoom(1.25 ** (event.angleDelta().y() / 120), event.pos())
+
+    def zoom(self, factor, pos=None):
+        # The image point under pos stays where it is.
+        pos = QPointF(pos if pos is not None else self.rect().center())
+        anchor = self.__transform().inverted()[0].map(pos)
+        self.__scale = min(max(self.__scale * factor, 1 / 32), 32)
+        self.__center = anchor - (pos - QPointF(self.width() / 2, self.height() / 2)) / self.__scale
+        self.update()
+
+    def zoomIn(self):
+        self.zoom(1.25)
+
+    def zoomOut(self):
+        self.zoom(1 / 1.25)
+
+    def resetZoom(self):
+        self.__scale = 1.0
+        self.__center = QPointF(self.__image.width() / 2, self.__image.height() / 2)
+        self.update()
+
+    def fitToWindow(self):
+        if self.__image.isNull():
+            return
+        self.__scale = min(self.width() / self.__image.width(), self.height() / self.__image.height())
+        self.__center = QPointF(self.__image.width() / 2, self.__image.height() / 2)
+        self.update()
+
+    def __transform(self):
+        # The translation is rounded so that the image stays sharp at 1:1.
+        transform = QTransform()
+        transform.translate(round(self.width() / 2 - self.__center.x() * self.__scale), round(self.height() / 2 - self.__center.y() * self.__scale))
+        transform.scale(self.__scale, self.__scale)
+        return transform
+
+    def __imagePos(self, pos):
+        point = self.__transform().inverted()[0].map(QPointF(pos))
+        return QPoint(math.floor(point.x()), math.floor(point.y()))
+
+    def __updateLabel(self, label):
+        if label is None:
+            return
+        left, top, right, bottom = label.boundingBox()
+        rect = self.__transform().mapRect(QRectF(QPointF(left, top), QPointF(right, bottom)))
+        # Leave room for pens and the highlight frame around the label.
+        self.update(rect.adjusted(-8, -8, 8, 8).toAlignedRect())
+
+    def __labelAt(self, pos):
+        return self.__spatialIndex.labelAt(pos.x(), pos.y(), 4 / self.__scale, lambda label: type(label) not in self.__hiddenLabelTypes)
+
+    def __level(self, level):
+        # Each level of the pyramid halves the previous one, so zoomed out views draw from a level close to their scale.
+        while len(self.__levels) <= level:
+            previous = self.__levels[-1]
+            self.__levels.append(previous.scaled(max(1, previous.width() // 2), max(1, previous.height() // 2), Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        return self.__levels[level]
+
+    def __tile(self, level, column, row):
+        tile = self.__tiles.get((level, column, row))
+        if tile is None:
+            rect = QRect(column * self.__tileSize, row * self.__tileSize, self.__tileSize, self.__tileSize)
+            tile = QPixmap.fromImage(self.__level(level).copy(rect.intersected(self.__level(level).rect())))
+            self.__tiles[(level, column, row)] = tile
+        return tile
+
+    def __drawImage(self, painter, exposed):
+        level = 0
+        if self.__scale < 1:
+            level = min(int(math.log2(1 / self.__scale)), int(math.log2(max(self.__image.width(), self.__image.height()))))
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        levelImage = self.__level(level)
+        scaleX = self.__image.width() / levelImage.width()
+        scaleY = self.__image.height() / levelImage.height()
+
+        # Only the tiles that intersect the exposed part of the widget are drawn.
+        visible = exposed.intersected(QRectF(self.__image.rect()))
+        if visible.isEmpty():
+            return
+        firstColumn = int(visible.left() / scaleX) // self.__tileSize
+        lastColumn = min(int(visible.right() / scaleX), levelImage.width() - 1) // self.__tileSize
+        firstRow = int(visible.top() / scaleY) // self.__tileSize
+        lastRow = min(int(visible.bottom() / scaleY), levelImage.height() - 1) // self.__tileSize
+        for row in range(firstRow, lastRow + 1):
+            for column in range(firstColumn, lastColumn + 1):
+                tile = self.__tile(level, column, row)
+                target = QRectF(column * self.__tileSize * scaleX, row * self.__tileSize * scaleY, tile.width() * scaleX, tile.height() * scaleY)
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
+
     def paintEvent(self, event):
         if self.__image.isNull() or not self.__selectedImage:
             return
 
-        origin = QPoint(self.width() / 2 - self.__image.width() / 2, self.height() / 2 - self.__image.height() / 2)
+        transform = self.__transform()
 
         painter = QPainter(self)
-        painter.translate(origin)
-        painter.drawImage(QPoint(), self.__image)
+        painter.setTransform(transform)
+        self.__drawImage(painter, transform.inverted()[0].mapRect(QRectF(event.rect())))
 
         for labelType in self.__selectedImage.labels:
             if labelType in self.__hiddenLabelTypes:
                 continue
+            painter.drawPicture(QPoint(), self.__overlay(labelType))
+
+        for label, pen in ((self.__hoveredLabel, self.__hoverPen), (self.__selectedLabel, self.__selectionPen)):
+            if label is None or type(label) in self.__hiddenLabelTypes:
+                continue
+            left, top, right, bottom = label.boundingBox()
+            margin = 2 / self.__scale
+            painter.setPen(pen)
+            painter.drawRect(QRectF(QPointF(left, top), QPointF(right, bottom)).adjusted(-margin, -margin, margin, margin))
+
+    def __overlay(self, labelType):
+        # The labels of each type are recorded once and replayed on every repaint until one of them changes.
+        overlay = self.__overlays.get(labelType)
+        if overlay is None:
+            overlay = QPicture()
+            painter = QPainter(overlay)
             for label in self.__selectedImage.labels[labelType]:
-                    label.draw(painter)
+                label.draw(painter)
+            painter.end()
+            self.__overlays[labelType] = overlay
+        return overlay
+
+    def __resetLabels(self):
+        self.__overlays.clear()
+        self.__spatialIndex.clear()
+        self.__hoveredLabel = None
+        self.__selectedLabel = None
+        self.__draggedLabel = None
+        if self.__selectedImage:
+            for labels in self.__selectedImage.labels.values():
+                for label in labels:
+                    self.__spatialIndex.insert(label)
+
+    def __setImage(self, image):
+        # Frames of the same size keep the view, so a zoomed in region can be followed through a sequence.
+        if not image.isNull() and image.size() != self.__imageSize:
+            self.__imageSize = image.size()
+            self.__center = QPointF(image.width() / 2, image.height() / 2)
+        self.__image = image
+        self.__levels = [image]
+        self.__tiles = {}
 
     def changeImageDatabase(self):
-        self.__image = QImage()
+        self.__setImage(QImage())
         self.__selectedImage = None
+        self.__resetLabels()
         self.update()
 
     def hideLabelType(self, labelType):
@@ -72,28 +290,73 @@ class ImageWidget(QWidget):
     def removeImage(self, image):
         if image != self.__selectedImage:
             return
-        self.__image = QImage()
+        self.__setImage(QImage())
         self.__selectedImage = None
+        self.__resetLabels()
         self.update()
 
+    def removeImages(self, images):
+        if any(image is self.__selectedImage for image in images):
+            self.removeImage(self.__selectedImage)
+
     def addLabel(self, image, label):
         if image != self.__selectedImage:
             return
+        self.__overlays.pop(type(label), None)
+        self.__spatialIndex.insert(label)
         self.update()
 
     def changeLabel(self, image, label):
         if image != self.__selectedImage:
             return
+        self.__overlays.pop(type(label), None)
+        self.__spatialIndex.update(label)
         self.update()
 
     def removeLabel(self, image, label):
         if image != self.__selectedImage:
             return
+        self.__overlays.pop(type(label), None)
+        self.__spatialIndex.remove(label)
+        if self.__hoveredLabel is label:
+            self.__hoveredLabel = None
+        if self.__selectedLabel is label:
+            self.__selectedLabel = None
+        self.update()
+
+    def changeLabels(self, images):
+        if not any(image is self.__selectedImage for image in images):
+            return
+        selectedLabel = self.__selectedLabel
+        self.__resetLabels()
+        if selectedLabel is not None and any(label is selectedLabel for label in self.__selectedImage.labels.get(type(selectedLabel), [])):
+            self.__selectedLabel = selectedLabel
+        self.update()
+
+    def selectLabel(self, image, label):
+        if image != self.__selectedImage or label is self.__selectedLabel:
+            return
+        self.__updateLabel(self.__selectedLabel)
+        self.__selectedLabel = label
+        self.__updateLabel(self.__selectedLabel)
+
+    def setRemainingClicks(self, remainingClicks):
+        self.__remainingClicks = remainingClicks
+        self.__hoveredLabel = None
         self.update()
 
     def selectImage(self, image):
         if image == self.__selectedImage:
             return
-        self.__image.load(image.imageFile)
+        # If the image is not cached yet, it is shown as soon as it has been decoded in the background.
+        cachedImage = self.__imageCache.image(image.imageFile)
+        self.__setImage(cachedImage if cachedImage is not None else QImage())
         self.__selectedImage = image
+        self.__resetLabels()
+        self.update()
+
+    def __imageLoaded(self, imageFile, image):
+        if not self.__selectedImage or imageFile != self.__selectedImage.imageFile:
+            return
+        self.__setImage(image)
         self.update()
@@ -0,0 +1,162 @@
+import collections
+import concurrent.futures
+import copy
+import math
+import os
+
+import numpy as np
+from PyQt5.QtGui import QImage
+
+
+def labelCenter(label):
+    left, top, right, bottom = label.boundingBox()
+    return ((left + right) / 2, (top + bottom) / 2)
+
+def matchLabels(first, second):
+    # Labels of the same type are paired greedily, the closest pair first. Labels without a partner are not interpolated.
+    pairs = []
+    for cls, labels in first.labels.items():
+        candidates = sorted((math.dist(labelCenter(a), labelCenter(b)), i, j) for i, a in enumerate(labels) for j, b in enumerate(second.labels.get(cls, [])))
+        usedFirst = set()
+        usedSecond = set()
+        for _, i, j in candidates:
+            if i not in usedFirst and j not in usedSecond:
+                usedFirst.add(i)
+                usedSecond.add(j)
+                pairs.append((labels[i], second.labels[cls][j]))
+    return pairs
+
+def interpolateValue(a, b, t):
+    if isinstance(a, bool) or not isinstance(a, (int, float)):
+        return a if t < 0.5 else b
+    value = a + (b - a) * t
+    return round(value) if isinstance(a, int) and isinstance(b, int) else value
+
+def interpolateLabel(a, b, t):
+    label = copy.copy(a)
+    label.__setstate__(tuple(interpolateValue(x, y, t) for x, y in zip(a.__getstate__(), b.__getstate__())))
+    return label
+
+def findKeyframes(labeledImages, row):
+    # The current image is the second keyframe if it has labels, otherwise the next image with labels is.
+    # The first keyframe is the closest image with labels before it.
+    def hasLabels(r):
+        return any(labeledImages[r].labels.values())
+    last = row if hasLabels(row) else next((r for r in range(row + 1, len(labeledImages)) if hasLabels(r)), None)
+    first = next((r for r in range(min(row, last if last is not None else row) - 1, -1, -1) if hasLabels(r)), None)
+    if first is None or last is None or last - first < 2:
+        return None
+    return first, last
+
+def interpolationProposals(labeledImages, first, last):
+    proposals = []
+    pairs = matchLabels(labeledImages[first], labeledImages[last])
+    for row in range(first + 1, last):
+        t = (row - first) / (last - first)
+        proposals += [(labeledImages[row], interpolateLabel(a, b, t)) for a, b in pairs]
+    return proposals
+
+def grayImage(imageFile):
+    image = QImage(imageFile)
+    if image.isNull():
+        return None
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    return np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine())[:, :image.width()].copy()
+
+def trackingStep(label):
+    # Large labels are matched on a coarser grid, so every label costs about the same.
+    left, top, right, bottom = label.boundingBox()
+    return max(1, math.ceil(max(right - left, bottom - top) / 32))
+
+def labelTemplate(gray, label, step):
+    left, top, right, bottom = (int(round(value)) for value in label.boundingBox())
+    if left < 0 or top < 0 or right > gray.shape[1] or bottom > gray.shape[0] or right - left < 2 or bottom - top < 2:
+        return None
+    return gray[top:bottom:step, left:right:step].astype(np.float32)
+
+def matchTemplate(gray, template, step, center, searchRadius):
+    # The position within the search window around center where the sum of squared differences to the template is smallest.
+    height, width = template.shape
+    radius = searchRadius // step * step
+    x0 = int(round(center[0] - width * step / 2)) - radius
+    y0 = int(round(center[1] - height * step / 2)) - radius
+    if x0 < 0 or y0 < 0 or x0 + (width - 1) * step + 2 * radius >= gray.shape[1] or y0 + (height - 1) * step + 2 * radius >= gray.shape[0]:
+        return None
+    region = gray[y0:y0 + (height - 1) * step + 2 * radius + 1:step, x0:x0 + (width - 1) * step + 2 * radius + 1:step].astype(np.float32)
+    differences = np.square(np.lib.stride_tricks.sliding_window_view(region, template.shape) - template).sum(axis=(2, 3))
+    dy, dx = np.unravel_index(np.argmin(differences), differences.shape)
+    return float(differences[dy, dx]), (center[0] + int(dx) * step - radius, center[1] + int(dy) * step - radius)
+
+def iterFrames(executor, imageFiles, window):
+    # Only a few frames are decoded ahead of the one being tracked, so memory does not grow with the gap between the keyframes.
+    pending = collections.deque()
+    try:
+        for imageFile in imageFiles:
+            pending.append(executor.submit(grayImage, imageFile))
+            if len(pending) > window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def trackChains(executor, frames, chains, searchRadius, progress=None, interrupted=lambda: False):
+    # Each frame is searched around where a label would be if it kept moving like between the two frames before.
+    # The templates always come from the keyframe, so their appearance does not drift. Returns the matches of every chain.
+    positions = [start for _, _, start in chains]
+    velocities = [(0, 0)] * len(chains)
+    matches = [[] for _ in chains]
+    for done, gray in enumerate(frames):
+        if interrupted():
+            return None
+        predicted = [(position[0] + velocity[0], position[1] + velocity[1]) for position, velocity in zip(positions, velocities)]
+        futures = [executor.submit(matchTemplate, gray, template, step, center, searchRadius) if gray is not None and template is not None else None
+                   for (template, step, _), center in zip(chains, predicted)]
+        for i, future in enumerate(futures):
+            match = future.result() if future is not None else None
+            matches[i].append(match)
+            if match is None:
+                positions[i] = predicted[i]
+                continue
+            velocities[i] = (match[1][0] - positions[i][0], match[1][1] - positions[i][1])
+            positions[i] = match[1]
+        if progress:
+            progress(done + 1)
+    return matches
+
+def trackingProposals(labeledImages, first, last, searchRadius=16, workers=None, progress=None, interrupted=lambda: False):
+    # Every label is tracked forwards from the first keyframe and backwards from the last one. A frame gets the position of the
+    # direction that matched it better. Other properties are interpolated.
+    pairs = matchLabels(labeledImages[first], labeledImages[last])
+    rows = range(first + 1, last)
+    imageFiles = [labeledImages[row].imageFile for row in rows]
+    workers = workers or os.cpu_count()
+    firstFrame, lastFrame = grayImage(labeledImages[first].imageFile), grayImage(labeledImages[last].imageFile)
+    forwardChains = [(labelTemplate(firstFrame, a, trackingStep(a)) if firstFrame is not None else None, trackingStep(a), labelCenter(a)) for a, _ in pairs]
+    backwardChains = [(labelTemplate(lastFrame, b, trackingStep(b)) if lastFrame is not None else None, trackingStep(b), labelCenter(b)) for _, b in pairs]
+    # Decoding and NumPy release the GIL, so threads keep every core busy. Each direction is a pass over the frames,
+    # which decodes them twice but never holds more than a few of them.
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        forwards = trackChains(executor, iterFrames(executor, imageFiles, 2 * workers), forwardChains, searchRadius,
+                               progress=lambda done: progress(done // 2) if progress else None, interrupted=interrupted)
+        if forwards is None:
+            return None
+        backwards = trackChains(executor, iterFrames(executor, imageFiles[::-1], 2 * workers), backwardChains, searchRadius,
+                                progress=lambda done: progress((len(rows) + done) // 2) if progress else None, interrupted=interrupted)
+        if backwards is None:
+            return None
+
+    proposals = []
+    for (a, b), forward, backward in zip(pairs, forwards, backwards):
+        for i, matches in enumerate(zip(forward, backward[::-1])):
+            label = interpolateLabel(a, b, (i + 1) / (last - first))
+            matches = [match for match in matches if match is not None]
+            if matches:
+                # Offsets are rounded, so labels with integer coordinates keep them.
+                center, position = labelCenter(label), min(matches)[1]
+                label.translate(round(position[0] - center[0]), round(position[1] - center[1]))
+            proposals.append((labeledImages[rows[i]], label))
+    return proposals
@@ -0,0 +1,191 @@
+import os
+import pickle
+import struct
+import zlib
+
+
+def journalFileName(fileName):
+    return fileName + '.journal'
+
+def snapshotStamp(fileName):
+    info = os.stat(fileName)
+    return ('snapshot', info.st_size, info.st_mtime_ns)
+
+def encodeOperation(*operation):
+    return pickle.dumps(operation, pickle.HIGHEST_PROTOCOL)
+
+def decodeOperation(record):
+    return pickle.loads(record)
+
+def readSnapshot(fileName):
+    with open(fileName, 'rb') as f:
+        return pickle.load(f)
+
+def writeSnapshot(fileName, labeledImages):
+    # The snapshot is replaced atomically and the journal belonging to the old snapshot is dropped afterwards.
+    # Should we crash in between, the stamp at the beginning of the journal does not match anymore and it is ignored.
+    tempFileName = fileName + '.tmp'
+    with open(tempFileName, 'wb') as f:
+        pickle.dump(labeledImages, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tempFileName, fileName)
+    if os.path.exists(journalFileName(fileName)):
+        os.remove(journalFileName(fileName))
+
+# Every record in the journal is preceded by its length and checksum. A record that is cut off or does not match its
+# checksum is what is left over from a crash during a save and ends the journal.
+RECORD_HEADER = struct.Struct('<II')
+
+def frameRecord(record):
+    return RECORD_HEADER.pack(len(record), zlib.crc32(record)) + record
+
+def iterRecords(f):
+    # Yields the complete records together with the offset behind each of them.
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        size, checksum = RECORD_HEADER.unpack(header)
+        record = f.read(size)
+        if len(record) < size or zlib.crc32(record) != checksum:
+            return
+        yield record, f.tell()
+
+def journalEnd(fileName):
+    # Returns the stamp of the journal and the offset behind its last complete record.
+    try:
+        f = open(journalFileName(fileName), 'rb')
+    except FileNotFoundError:
+        return None, 0
+    with f:
+        stamp = None
+        end = 0
+        for record, end in iterRecords(f):
+            if stamp is None:
+                try:
+                    stamp = decodeOperation(record)
+                except Exception:
+                    return None, 0
+        return stamp, end
+
+def appendToJournal(fileName, records):
+    if not records:
+        return
+    # A journal that does not belong to the current snapshot, e.g. after a crash in writeSnapshot, would be ignored
+    # together with everything appended to it. It is started over instead.
+    stamp = snapshotStamp(fileName)
+    journalStamp, end = journalEnd(fileName)
+    if journalStamp != stamp:
+        end = 0
+    with open(journalFileName(fileName), 'r+b' if end > 0 else 'wb') as f:
+        # The rest of a record that was torn by a crash is cut off, so the new records follow the last complete one.
+        f.seek(end)
+        f.truncate()
+        if end == 0:
+            f.write(frameRecord(encodeOperation(*stamp)))
+        f.write(b''.join(frameRecord(record) for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+
+def readJournal(fileName):
+    try:
+        f = open(journalFileName(fileName), 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        stamp = None
+        for record, _ in iterRecords(f):
+            try:
+                operation = decodeOperation(record)
+            except Exception:
+                # Anything that cannot be decoded is treated like a torn record at the end.
+                return
+            if stamp is None:
+                if operation != snapshotStamp(fileName):
+                    return
+                stamp = operation
+            else:
+                yield operation
+
+def applyOperation(labeledImages, imagesByFile, operation):
+    name = operation[0]
+    if name == 'addImage':
+        labeledImage = operation[1]
+        if labeledImage.imageFile in imagesByFile:
+            return
+        labeledImages.append(labeledImage)
+        imagesByFile[labeledImage.imageFile] = labeledImage
+    elif name == 'addImages':
+        for labeledImage in operation[1]:
+            applyOperation(labeledImages, imagesByFile, ('addImage', labeledImage))
+    elif name == 'insertImages':
+        _, row, newImages = operation
+        newImages = [labeledImage for labeledImage in newImages if labeledImage.imageFile not in imagesByFile]
+        labeledImages[row:row] = newImages
+        imagesByFile.update((labeledImage.imageFile, labeledImage) for labeledImage in newImages)
+    elif name == 'removeImage':
+        labeledImage = imagesByFile.pop(operation[1], None)
+        if labeledImage is not None:
+            labeledImages.remove(labeledImage)
+    elif name == 'removeImages':
+        removed = { id(imagesByFile.pop(imageFile)) for imageFile in operation[1] if imageFile in imagesByFile }
+        labeledImages[:] = [labeledImage for labeledImage in labeledImages if id(labeledImage) not in removed]
+    elif name == 'addLabel':
+        _, imageFile, label = operation
+        imagesByFile[imageFile].labels.setdefault(type(label), []).append(label)
+    elif name == 'insertLabel':
+        _, imageFile, index, label = operation
+        imagesByFile[imageFile].labels.setdefault(type(label), []).insert(index, label)
+    elif name == 'changeLabel':
+        _, imageFile, index, label = operation
+        imagesByFile[imageFile].labels[type(label)][index] = label
+    elif name == 'removeLabel':
+        _, imageFile, labelType, index = operation
+        del imagesByFile[imageFile].labels[labelType][index]
+    else:
+        raise ValueError('Unknown journal operation ' + repr(name))
+
+def operationImageFiles(operation):
+    name = operation[0]
+    if name == 'addImage':
+        return [operation[1].imageFile]
+    elif name == 'addImages':
+        return [labeledImage.imageFile for labeledImage in operation[1]]
+    elif name == 'insertImages':
+        return [labeledImage.imageFile for labeledImage in operation[2]]
+    elif name == 'removeImages':
+        return operation[1]
+    return [operation[1]]
+
+def replayJournal(fileName, labeledImages):
+    imagesByFile = { labeledImage.imageFile: labeledImage for labeledImage in labeledImages }
+    for operation in readJournal(fileName):
+        applyOperation(labeledImages, imagesByFile, operation)
+    return labeledImages
+
+def readDatabase(fileName):
+    return replayJournal(fileName, readSnapshot(fileName))
+
+def compactDatabase(fileName):
+    writeSnapshot(fileName, readDatabase(fileName))
+
+class JournalStorage:
+    def read(self, fileName):
+        return readDatabase(fileName)
+
+    def write(self, fileName, labeledImages):
+        writeSnapshot(fileName, labeledImages)
+
+    def update(self, fileName, records, labeledImages):
+        appendToJournal(fileName, records)
+
+    def compact(self, fileName, labeledImages):
+        writeSnapshot(fileName, labeledImages)
+
+    def close(self):
+        pass
+
+    def touch(self, operation):
+        pass
+
+    def markUsed(self, labeledImage):
+        pass
@@ -1,7 +1,7 @@
 import math
 from enum import Enum
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QLineF, QRectF, Qt
 from PyQt5.QtGui import QIcon, QPen
 
 import labeling_tool.resources_rc
@@ -9,16 +9,43 @@ import labeling_tool.resources_rc
 from labeling_tool.imagedatabase import LabelBase
 
 
+def cosmeticPen(color, width):
+    # Outlines keep their width on screen at every zoom level of the image widget.
+    pen = QPen(color, width)
+    pen.setCosmetic(True)
+    return pen
+
 class BallLabel(LabelBase):
+    __slots__ = ('centerX', 'centerY', 'radius', 'blurred')
+    fields = ('center', 'radius', 'blurred')
+
     def __init__(self, center, radius, blurred=False):
         super().__init__()
         self.center = center
         self.radius = radius
         self.blurred = blurred
 
+    @property
+    def center(self):
+        return (self.centerX, self.centerY)
+
+    @center.setter
+    def center(self, center):
+        self.centerX, self.centerY = center
+
     def draw(self, painter):
-        painter.setPen(QPen(Qt.red, 3 if self.blurred else 1))
-        painter.drawEllipse(self.center[0] - self.radius, self.center[1] - self.radius, 2 * self.radius, 2 * self.radius)
+        painter.setPen(cosmeticPen(Qt.red, 3 if self.blurred else 1))
+        painter.drawEllipse(QRectF(self.centerX - self.radius, self.centerY - self.radius, 2 * self.radius, 2 * self.radius))
+
+    def boundingBox(self):
+        return (self.centerX - self.radius, self.centerY - self.radius, self.centerX + self.radius, self.centerY + self.radius)
+
+    def distanceTo(self, x, y):
+        return max(0, math.hypot(x - self.centerX, y - self.centerY) - self.radius)
+
+    def translate(self, dx, dy):
+        self.centerX += dx
+        self.centerY += dy
 
     @staticmethod
     def name():
@@ -41,14 +68,49 @@ class BallLabel(LabelBase):
         return cls(center, radius)
 
 class LineLabel(LabelBase):
+    __slots__ = ('startX', 'startY', 'endX', 'endY')
+    fields = ('start', 'end')
+
     def __init__(self, start, end):
         super().__init__()
         self.start = start
         self.end = end
 
+    @property
+    def start(self):
+        return (self.startX, self.startY)
+
+    @start.setter
+    def start(self, start):
+        self.startX, self.startY = start
+
+    @property
+    def end(self):
+        return (self.endX, self.endY)
+
+    @end.setter
+    def end(self, end):
+        self.endX, self.endY = end
+
     def draw(self, painter):
-        painter.setPen(QPen(Qt.black, 2))
-        painter.drawLine(self.start[0], self.start[1], self.end[0], self.end[1])
+        painter.setPen(cosmeticPen(Qt.black, 2))
+        painter.drawLine(QLineF(self.startX, self.startY, self.endX, self.endY))
+
+    def boundingBox(self):
+        return (min(self.startX, self.endX), min(self.startY, self.endY), max(self.startX, self.endX), max(self.startY, self.endY))
+
+    def distanceTo(self, x, y):
+        dx = self.endX - self.startX
+        dy = self.endY - self.startY
+        lengthSquared = dx * dx + dy * dy
+        t = max(0, min(1, ((x - self.startX) * dx + (y - self.startY) * dy) / lengthSquared)) if lengthSquared else 0
+        return math.hypot(x - self.startX - t * dx, y - self.startY - t * dy)
+
+    def translate(self, dx, dy):
+        self.startX += dx
+        self.startY += dy
+        self.endX += dx
+        self.endY += dy
 
     @staticmethod
     def name():
@@ -68,13 +130,34 @@ class LineLabel(LabelBase):
         return cls((points[0].x(), points[0].y()), (points[1].x(), points[1].y()))
 
 class GoalPostLabel(LabelBase):
+    __slots__ = ('baseX', 'baseY')
+    fields = ('base',)
+
     def __init__(self, base):
         super().__init__()
         self.base = base
 
+    @property
+    def base(self):
+        return (self.baseX, self.baseY)
+
+    @base.setter
+    def base(self, base):
+        self.baseX, self.baseY = base
+
     def draw(self, painter):
-        painter.setPen(QPen(Qt.green, 1))
-        painter.drawEllipse(self.base[0] - 10, self.base[1] - 10, 20, 20)
+        painter.setPen(cosmeticPen(Qt.green, 1))
+        painter.drawEllipse(QRectF(self.baseX - 10, self.baseY - 10, 20, 20))
+
+    def boundingBox(self):
+        return (self.baseX - 10, self.baseY - 10, self.baseX + 10, self.baseY + 10)
+
+    def distanceTo(self, x, y):
+        return max(0, math.hypot(x - self.baseX, y - self.baseY) - 10)
+
+    def translate(self, dx, dy):
+        self.baseX += dx
+        self.baseY += dy
 
     @staticmethod
     def name():
@@ -107,12 +190,31 @@ class TeamColor(Enum):
     GRAY = 10
 
 class RobotLabel(LabelBase):
+    __slots__ = ('topLeftX', 'topLeftY', 'bottomRightX', 'bottomRightY', 'teamColor')
+    fields = ('topLeft', 'bottomRight', 'teamColor')
+
     def __init__(self, topLeft, bottomRight, teamColor=TeamColor.NONE):
         super().__init__()
         self.topLeft = topLeft
         self.bottomRight = bottomRight
         self.teamColor = teamColor
 
+    @property
+    def topLeft(self):
+        return (self.topLeftX, self.topLeftY)
+
+    @topLeft.setter
+    def topLeft(self, topLeft):
+        self.topLeftX, self.topLeftY = topLeft
+
+    @property
+    def bottomRight(self):
+        return (self.bottomRightX, self.bottomRightY)
+
+    @bottomRight.setter
+    def bottomRight(self, bottomRight):
+        self.bottomRightX, self.bottomRightY = bottomRight
+
     def draw(self, painter):
         teamColorToQtColor = {
             TeamColor.NONE: Qt.darkGray,
@@ -127,13 +229,30 @@ class RobotLabel(LabelBase):
             TeamColor.BROWN: Qt.darkRed,
             TeamColor.GRAY: Qt.gray
         }
-        painter.setPen(QPen(teamColorToQtColor[self.teamColor], 2))
-        painter.drawRect(self.topLeft[0], self.topLeft[1], self.bottomRight[0] - self.topLeft[0], self.bottomRight[1] - self.topLeft[1])
+        painter.setPen(cosmeticPen(teamColorToQtColor[self.teamColor], 2))
+        painter.drawRect(QRectF(self.topLeftX, self.topLeftY, self.bottomRightX - self.topLeftX, self.bottomRightY - self.topLeftY))
+
+    def boundingBox(self):
+        return (min(self.topLeftX, self.bottomRightX), min(self.topLeftY, self.bottomRightY), max(self.topLeftX, self.bottomRightX), max(self.topLeftY, self.bottomRightY))
+
+    def distanceTo(self, x, y):
+        left, top, right, bottom = self.boundingBox()
+        return math.hypot(max(left - x, 0, x - right), max(top - y, 0, y - bottom))
+
+    def translate(self, dx, dy):
+        self.topLeftX += dx
+        self.topLeftY += dy
+        self.bottomRightX += dx
+        self.bottomRightY += dy
 
     @staticmethod
     def name():
         return 'Robots'
 
+    @classmethod
+    def fromJson(cls, obj):
+        return cls(tuple(obj['topLeft']), tuple(obj['bottomRight']), TeamColor[obj['teamColor']])
+
     @staticmethod
     def icon():
         return QIcon(':/Icons/robot.png')
@@ -149,15 +268,36 @@ class RobotLabel(LabelBase):
         return cls((points[0].x(), points[0].y()), (points[1].x(), points[1].y()))
 
 class PenaltySpotLabel(LabelBase):
+    __slots__ = ('spotX', 'spotY')
+    fields = ('spot',)
+
     def __init__(self, spot):
         super().__init__()
 
         self.spot = spot
 
+    @property
+    def spot(self):
+        return (self.spotX, self.spotY)
+
+    @spot.setter
+    def spot(self, spot):
+        self.spotX, self.spotY = spot
+
     def draw(self, painter):
-        painter.setPen(QPen(Qt.black, 2))
-        painter.drawLine(self.spot[0] - 10, self.spot[1], self.spot[0] + 10, self.spot[1])
-        painter.drawLine(self.spot[0], self.spot[1] - 10, self.spot[0], self.spot[1] + 10)
+        painter.setPen(cosmeticPen(Qt.black, 2))
+        painter.drawLine(QLineF(self.spotX - 10, self.spotY, self.spotX + 10, self.spotY))
+        painter.drawLine(QLineF(self.spotX, self.spotY - 10, self.spotX, self.spotY + 10))
+
+    def boundingBox(self):
+        return (self.spotX - 10, self.spotY - 10, self.spotX + 10, self.spotY + 10)
+
+    def distanceTo(self, x, y):
+        return max(0, math.hypot(x - self.spotX, y - self.spotY) - 10)
+
+    def translate(self, dx, dy):
+        self.spotX += dx
+        self.spotY += dy
 
     @staticmethod
     def name():
@@ -0,0 +1,121 @@
+import itertools
+from enum import Enum
+from operator import attrgetter
+
+import numpy as np
+
+from labeling_tool.imagedatabase import jsonName
+from labeling_tool.labels import BallLabel, LineLabel, RobotLabel, TeamColor
+
+
+# Checks run on the label columns of a type. Each yields a mask of the labels that are most likely mistakes.
+outlierChecks = {
+    BallLabel: [
+        ('radius is not positive', lambda columns: columns['radius'] <= 0)
+    ],
+    LineLabel: [
+        ('start and end coincide', lambda columns: (columns['startX'] == columns['endX']) & (columns['startY'] == columns['endY']))
+    ],
+    RobotLabel: [
+        ('box has negative width', lambda columns: columns['bottomRightX'] < columns['topLeftX']),
+        ('box has negative height', lambda columns: columns['bottomRightY'] < columns['topLeftY']),
+        ('box is empty', lambda columns: (columns['bottomRightX'] == columns['topLeftX']) | (columns['bottomRightY'] == columns['topLeftY']))
+    ]
+}
+
+def labelColumns(cls, labels):
+    columns = {}
+    for field in cls.__slots__:
+        first = getattr(labels[0], field) if labels else None
+        values = map(attrgetter(field), labels)
+        if isinstance(first, Enum):
+            columns[field] = np.fromiter((value.value for value in values), np.int64, len(labels))
+        else:
+            columns[field] = np.fromiter(values, bool if isinstance(first, bool) else np.float64, len(labels))
+    return columns
+
+def percentiles(values):
+    return np.percentile(values, [0, 25, 50, 75, 100]) if len(values) else np.full(5, np.nan)
+
+class LabelStatistics:
+    def __init__(self, labeledImages):
+        self.labeledImages = list(labeledImages)
+        self.__labels = {}
+        self.__rows = {}
+        for row, labeledImage in enumerate(self.labeledImages):
+            for cls, labels in labeledImage.labels.items():
+                if labels:
+                    self.__labels.setdefault(cls, []).extend(labels)
+                    self.__rows.setdefault(cls, []).extend(itertools.repeat(row, len(labels)))
+        self.__rows = {cls: np.array(rows, np.intp) for cls, rows in self.__rows.items()}
+        self.__columns = {cls: labelColumns(cls, labels) for cls, labels in self.__labels.items()}
+
+    def labelTypes(self):
+        return sorted(self.__labels, key=jsonName)
+
+    def column(self, cls, field):
+        return self.__columns[cls][field] if cls in self.__columns else np.empty(0)
+
+    def labelCount(self, cls):
+        return len(self.__labels.get(cls, ()))
+
+    def imageCount(self, cls):
+        # The rows of a type are sorted, so every change between neighbours starts a new image.
+        rows = self.__rows.get(cls)
+        return int(np.count_nonzero(np.diff(rows))) + 1 if rows is not None and len(rows) else 0
+
+    def unlabeledImages(self):
+        labeled = np.zeros(len(self.labeledImages), bool)
+        for rows in self.__rows.values():
+            labeled[rows] = True
+        return [self.labeledImages[row] for row in np.flatnonzero(~labeled)]
+
+    def ballRadiusHistogram(self, bins=10):
+        return np.histogram(self.column(BallLabel, 'radius'), bins)
+
+    def robotSizes(self):
+        width = self.column(RobotLabel, 'bottomRightX') - self.column(RobotLabel, 'topLeftX')
+        height = self.column(RobotLabel, 'bottomRightY') - self.column(RobotLabel, 'topLeftY')
+        return width, height
+
+    def robotAspectRatios(self):
+        width, height = self.robotSizes()
+        valid = height != 0
+        return width[valid] / height[valid]
+
+    def teamColorCounts(self):
+        counts = np.bincount(self.column(RobotLabel, 'teamColor').astype(np.int64), minlength=len(TeamColor))
+        return {teamColor: int(counts[teamColor.value]) for teamColor in TeamColor}
+
+    def outliers(self):
+        outliers = []
+        for cls, checks in outlierChecks.items():
+            if cls not in self.__columns:
+                continue
+            for reason, check in checks:
+                for i in np.flatnonzero(check(self.__columns[cls])):
+                    outliers.append((self.labeledImages[self.__rows[cls][i]], self.__labels[cls][i], reason))
+        return outliers
+
+    def summary(self):
+        lines = ['images: {}'.format(len(self.labeledImages)),
+                 'images without labels: {}'.format(len(self.unlabeledImages()))]
+        for cls in self.labelTypes():
+            lines.append('{}: {} labels in {} images'.format(jsonName(cls), self.labelCount(cls), self.imageCount(cls)))
+
+        if self.labelCount(BallLabel):
+            counts, edges = self.ballRadiusHistogram()
+            lines.append('ball radius histogram:')
+            for count, low, high in zip(counts, edges, edges[1:]):
+                lines.append('  {:8.1f} - {:8.1f}: {}'.format(low, high, count))
+
+        if self.labelCount(RobotLabel):
+            width, height = self.robotSizes()
+            lines.append('robot boxes (min / 25% / median / 75% / max):')
+            for name, values in (('width', width), ('height', height), ('aspect', self.robotAspectRatios())):
+                lines.append('  {:<6} {}'.format(name, ' / '.join('{:.2f}'.format(value) for value in percentiles(values))))
+            lines.append('robot team colors:')
+            for teamColor, count in self.teamColorCounts().items():
+                if count:
+                    lines.append('  {}: {}'.format(teamColor.name, count))
+        return lines
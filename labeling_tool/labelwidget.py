@@ -2,29 +2,26 @@ from ast import literal_eval
 from enum import Enum
 from PyQt5.QtCore import pyqtSignal, QAbstractItemModel, QModelIndex, Qt, QVariant
 from PyQt5.QtWidgets import QAction, QComboBox, QDockWidget, QLineEdit, QMenu, QSpinBox, QStyledItemDelegate, QTabBar, QTreeView, QVBoxLayout, QWidget
-import weakref
 from labeling_tool.labels import *
 
 from labeling_tool.imagedatabase import LabelBase, LabeledImage
 
-class LabelProperty:
-    def __init__(self, row, obj, parent):
-        self.__name = list(vars(parent).keys())[row]
-        if obj is not None:
-            self.__ref = weakref.ref(obj)
-        self.__parent = parent
+class LabelFields:
+    # All properties of a label share this node, the row of their index tells which field they are.
+    def __init__(self, label):
+        self.__label = label
 
-    def name(self):
-        return self.__name
+    def name(self, row):
+        return type(self.__label).fields[row]
 
-    def property(self):
-        return getattr(self.__ref(), self.__name)
+    def property(self, row):
+        return getattr(self.__label, self.name(row))
 
-    def setProperty(self, val):
-        setattr(self.__ref(), self.__name, val)
+    def setProperty(self, row, val):
+        setattr(self.__label, self.name(row), val)
 
     def parent(self):
-        return self.__parent
+        return self.__label
 
 class LabelDelegate(QStyledItemDelegate):
     def __init__(self, parent=None):
@@ -32,7 +29,7 @@ class LabelDelegate(QStyledItemDelegate):
 
     def createEditor(self, parent, option, index):
         item = index.internalPointer()
-        var = type(item.property())
+        var = type(item.property(index.row()))
         if issubclass(var, Enum):
             return QComboBox(parent)
         elif var is int:
@@ -43,19 +40,19 @@ class LabelDelegate(QStyledItemDelegate):
     def setEditorData(self, editor, index):
         self.blockSignals(True)
         item = index.internalPointer()
-        var = type(item.property())
+        var = type(item.property(index.row()))
         if issubclass(var, Enum):
             editor.addItems(var.__members__.keys())
-            editor.setCurrentIndex(item.property().value)
+            editor.setCurrentIndex(item.property(index.row()).value)
         elif var is int:
-            editor.setValue(item.property())
+            editor.setValue(item.property(index.row()))
         else:
-            editor.setText(str(index.internalPointer().property()))
+            editor.setText(str(item.property(index.row())))
         self.blockSignals(False)
 
     def setModelData(self, editor, model, index):
         item = index.internalPointer()
-        var = type(item.property())
+        var = type(item.property(index.row()))
         if issubclass(var, Enum):
             model.setData(index, var[editor.currentText()], Qt.EditRole)
         elif var is int:
@@ -64,30 +61,66 @@ class LabelDelegate(QStyledItemDelegate):
             model.setData(index, literal_eval(editor.text()), Qt.EditRole)
 
 class LabelModel(QAbstractItemModel):
-    labelEdited = pyqtSignal(LabeledImage, LabelBase)
+    labelEdited = pyqtSignal(LabeledImage, LabelBase, object)
 
     def __init__(self, labelType, parent=None):
         super().__init__(parent)
 
         self.__labelType = labelType
-        self.__items = {}
         self.__selectedImage = None
+        # The row of every label and the property nodes of the labels whose properties have been asked for.
+        # Both only hold the labels of the selected image and are kept up to date when labels are added or removed.
+        self.__rows = {}
+        self.__nodes = {}
 
     def setImage(self, image):
-        self.__items = {}
         self.__selectedImage = image
+        self.__rows = { label: row for row, label in enumerate(self.__labelsOfImage()) }
+        self.__nodes = {}
+
+    def __labelsOfImage(self):
+        return self.__selectedImage.labels.get(self.__labelType, []) if self.__selectedImage else []
+
+    def rowOfLabel(self, label):
+        return self.__rows.get(label)
+
+    def labelAt(self, index):
+        item = index.internalPointer()
+        return item if isinstance(item, LabelBase) else item.parent()
+
+    def beginInsertLabel(self, row):
+        self.beginInsertRows(QModelIndex(), row, row)
+
+    def endInsertLabel(self, row):
+        labels = self.__labelsOfImage()
+        for r in range(row, len(labels)):
+            self.__rows[labels[r]] = r
+        self.endInsertRows()
+
+    def beginRemoveLabel(self, label):
+        row = self.__rows[label]
+        self.beginRemoveRows(QModelIndex(), row, row)
+
+    def endRemoveLabel(self, label):
+        row = self.__rows.pop(label)
+        labels = self.__labelsOfImage()
+        for r in range(row, len(labels)):
+            self.__rows[labels[r]] = r
+        self.endRemoveRows()
+        # Only now no index refers to the node anymore.
+        self.__nodes.pop(label, None)
 
     def columnCount(self, parent = QModelIndex()):
         return 2
 
     def rowCount(self, parent = QModelIndex()):
-        if parent.column() > 0 or not self.__selectedImage or not self.__labelType in self.__selectedImage.labels:
+        if parent.column() > 0 or not self.__selectedImage:
             return 0
 
         if not parent.isValid():
-            return len(self.__selectedImage.labels[self.__labelType])
+            return len(self.__labelsOfImage())
         elif isinstance(parent.internalPointer(), LabelBase):
-            return len(vars(parent.internalPointer()))
+            return len(parent.internalPointer().fields)
         else:
             return 0
 
@@ -96,20 +129,16 @@ class LabelModel(QAbstractItemModel):
             return QModelIndex()
 
         if not parent.isValid():
-            parentItem = self.__selectedImage.labels[self.__labelType]
-            return self.createIndex(row, column, parentItem[row])
+            return self.createIndex(row, column, self.__labelsOfImage()[row])
         else:
             parentItem = parent.internalPointer()
 
-            # This is necessary because the label property becomes garbage-collected otherwise.
-            p = None
-            try:
-                p = self.__items[(parentItem, row)]
-            except KeyError:
-                p = LabelProperty(row, parentItem, parentItem)
-                self.__items[(parentItem, row)] = p
-            assert(p)
-            return self.createIndex(row, column, p)
+            # This is necessary because the node becomes garbage-collected otherwise.
+            node = self.__nodes.get(parentItem)
+            if node is None:
+                node = LabelFields(parentItem)
+                self.__nodes[parentItem] = node
+            return self.createIndex(row, column, node)
 
     def parent(self, index):
         if not index.isValid():
@@ -120,7 +149,7 @@ class LabelModel(QAbstractItemModel):
             return QModelIndex()
         else:
             parentItem = childItem.parent()
-            return self.createIndex(self.__selectedImage.labels[self.__labelType].index(parentItem), 0, parentItem)
+            return self.createIndex(self.__rows[parentItem], 0, parentItem)
 
     def data(self, index, role = Qt.DisplayRole):
         if not index.isValid():
@@ -131,12 +160,13 @@ class LabelModel(QAbstractItemModel):
             if isinstance(item, LabelBase):
                 return str(index.row()) if index.column() == 0 else QVariant()
             elif index.column() == 0:
-                return item.name()
+                return item.name(index.row())
             else:
-                if isinstance(item.property(), Enum):
-                    return item.property().name
+                value = item.property(index.row())
+                if isinstance(value, Enum):
+                    return value.name
                 else:
-                    return str(item.property())
+                    return str(value)
 
         return QVariant()
 
@@ -157,15 +187,18 @@ class LabelModel(QAbstractItemModel):
     def setData(self, index, value, role = Qt.EditRole):
         if role != Qt.EditRole:
             return False
-        index.internalPointer().setProperty(value)
-        self.labelEdited.emit(self.__selectedImage, index.internalPointer().parent())
+        label = index.internalPointer().parent()
+        previousState = label.__getstate__()
+        index.internalPointer().setProperty(index.row(), value)
+        self.labelEdited.emit(self.__selectedImage, label, previousState)
         return True
 
 class LabelWidget(QDockWidget):
     remainingClicksChanged = pyqtSignal(int)
     labelCreated = pyqtSignal(LabeledImage, LabelBase)
-    labelEdited = pyqtSignal(LabeledImage, LabelBase)
+    labelEdited = pyqtSignal(LabeledImage, LabelBase, object)
     labelDeleted = pyqtSignal(LabeledImage, LabelBase)
+    labelSelected = pyqtSignal(LabeledImage, LabelBase)
 
     def __init__(self, imageDatabase, parent=None):
         super().__init__(parent)
@@ -178,6 +211,7 @@ class LabelWidget(QDockWidget):
 
         self.__currentCls = None
         self.__currentPoints = []
+        self.__insertedRow = 0
 
         self.__treeModels = []
 
@@ -203,6 +237,7 @@ class LabelWidget(QDockWidget):
         self.__treeView.setAlternatingRowColors(True)
         self.__treeView.setContextMenuPolicy(Qt.NoContextMenu)
         self.__treeView.customContextMenuRequested.connect(self.__prepareMenu)
+        self.__treeView.selectionModel().currentChanged.connect(self.__changeCurrent)
 
         self.__mainLayout.addWidget(self.__tabBar)
         self.__mainLayout.addWidget(self.__treeView)
@@ -229,6 +264,10 @@ class LabelWidget(QDockWidget):
             model.setImage(None)
             model.endResetModel()
 
+    def removeImages(self, images):
+        if any(image is self.__selectedImage for image in images):
+            self.removeImage(self.__selectedImage)
+
     def selectImage(self, image):
         if image == self.__selectedImage:
             return
@@ -239,33 +278,50 @@ class LabelWidget(QDockWidget):
             model.setImage(image)
             model.endResetModel()
 
-    def preAddLabel(self, image, label):
+    def preAddLabel(self, image, label, index):
         if image != self.__selectedImage:
             return
-        index = len(self.__selectedImage.labels[type(label)]) if type(label) in self.__selectedImage.labels else 0
-        self.__treeModels[self.__typeToIndex[type(label)]].beginInsertRows(QModelIndex(), index, index)
+        self.__treeModels[self.__typeToIndex[type(label)]].beginInsertLabel(index)
+        self.__insertedRow = index
 
     def addLabel(self, image, label):
         if image != self.__selectedImage:
             return
-        self.__treeModels[self.__typeToIndex[type(label)]].endInsertRows()
+        self.__treeModels[self.__typeToIndex[type(label)]].endInsertLabel(self.__insertedRow)
 
     def changeLabel(self, image, label):
         if image != self.__selectedImage:
             return
-        index = self.__treeModels[self.__typeToIndex[type(label)]].index(self.__selectedImage.labels[type(label)].index(label), 0, QModelIndex())
-        self.__treeModels[self.__typeToIndex[type(label)]].dataChanged.emit(index, index)
+        model = self.__treeModels[self.__typeToIndex[type(label)]]
+        index = model.index(model.rowOfLabel(label), 0, QModelIndex())
+        model.dataChanged.emit(index, model.index(index.row(), 1, QModelIndex()))
+        if model.hasChildren(index):
+            model.dataChanged.emit(model.index(0, 1, index), model.index(model.rowCount(index) - 1, 1, index))
 
     def preRemoveLabel(self, image, label):
         if image != self.__selectedImage:
             return
-        index = self.__selectedImage.labels[type(label)].index(label)
-        self.__treeModels[self.__typeToIndex[type(label)]].beginRemoveRows(QModelIndex(), index, index)
+        self.__treeModels[self.__typeToIndex[type(label)]].beginRemoveLabel(label)
 
     def removeLabel(self, image, label):
         if image != self.__selectedImage:
             return
-        self.__treeModels[self.__typeToIndex[type(label)]].endRemoveRows()
+        self.__treeModels[self.__typeToIndex[type(label)]].endRemoveLabel(label)
+
+    def changeLabels(self, images):
+        if not any(image is self.__selectedImage for image in images):
+            return
+        for model in self.__treeModels:
+            model.beginResetModel()
+            model.setImage(self.__selectedImage)
+            model.endResetModel()
+
+    def selectLabel(self, image, label):
+        if image != self.__selectedImage:
+            return
+        self.__tabBar.setCurrentIndex(self.__typeToIndex[type(label)])
+        model = self.__treeModels[self.__typeToIndex[type(label)]]
+        self.__treeView.setCurrentIndex(model.index(model.rowOfLabel(label), 0, QModelIndex()))
 
     def addPoint(self, point):
         if not self.__selectedImage or not self.__currentCls:
@@ -291,11 +347,24 @@ class LabelWidget(QDockWidget):
             menu.addSeparator()
 
             removeLabelAction = QAction('Remove Label', self)
-            removeLabelAction.triggered.connect(lambda: self.labelDeleted.emit(self.__selectedImage, index.internalPointer() if isinstance(index.internalPointer(), LabelBase) else index.internalPointer().parent()))
+            removeLabelAction.triggered.connect(lambda: self.labelDeleted.emit(self.__selectedImage, self.__treeView.model().labelAt(index)))
             menu.addAction(removeLabelAction)
 
         menu.exec_(self.__treeView.mapToGlobal(pos))
 
+    def startLabel(self, cls):
+        if not self.__selectedImage:
+            return
+        self.__tabBar.setCurrentIndex(self.__typeToIndex[cls])
+        self.__startLabel()
+
+    def cancelLabel(self):
+        if not self.__currentCls:
+            return
+        self.__currentPoints.clear()
+        self.__currentCls = None
+        self.remainingClicksChanged.emit(0)
+
     def __startLabel(self):
         if self.__tabBar.currentIndex() < 0:
             return
@@ -308,3 +377,10 @@ class LabelWidget(QDockWidget):
         index = self.__tabBar.currentIndex()
 
         self.__treeView.setModel(self.__treeModels[index] if index >= 0 else None)
+        if index >= 0:
+            self.__treeView.selectionModel().currentChanged.connect(self.__changeCurrent)
+
+    def __changeCurrent(self, current, previous):
+        if not current.isValid() or not self.__selectedImage:
+            return
+        self.labelSelected.emit(self.__selectedImage, self.__treeView.model().labelAt(current))
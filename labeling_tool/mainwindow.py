@@ -1,10 +1,19 @@
 from PyQt5.QtCore import QFileInfo, QSettings, Qt
 from PyQt5.QtGui import QKeySequence
-from PyQt5.QtWidgets import QAction, QApplication, QFileDialog, QMainWindow, QMessageBox
+from PyQt5.QtWidgets import QAction, QApplication, QFileDialog, QInputDialog, QMainWindow, QMessageBox, QProgressDialog
+from labeling_tool.autosave import Autosaver, isRecoverable, readRecoveryFile, recoverableFiles, removeRecoveryFile, removeStaleLocks
 from labeling_tool.imagedatabase import ImageDatabase, LabeledImage, LabelBase
+from labeling_tool.imagecache import ImageCache
 from labeling_tool.imagedatabasewidget import ImageDatabaseWidget
+from labeling_tool.imagehashes import findDuplicates, mergeDuplicates
+from labeling_tool.imagequery import ImageIndex
+from labeling_tool.interpolation import findKeyframes, interpolationProposals
+from labeling_tool.duplicatesdialog import DuplicatesDialog
 from labeling_tool.labels import *
 from labeling_tool.labelwidget import LabelWidget
+from labeling_tool.statisticsdialog import StatisticsDialog
+from labeling_tool.thumbnailcache import ThumbnailCache
+from labeling_tool.workers import DirectoryScanner, ImageHasher, JsonExporter, LabelTracker, imageFilePatterns
 
 from labeling_tool.imagewidget import ImageWidget
 
@@ -36,6 +45,11 @@ class MainWindow(QMainWindow):
         self.__fileSaveAsAction.setEnabled(False)
         self.__fileSaveAsAction.setShortcuts(QKeySequence.SaveAs)
 
+        self.__fileImportAction = QAction('&Import...', self)
+
+        self.__fileCompactAction = QAction('Co&mpact', self)
+        self.__fileCompactAction.setEnabled(False)
+
         self.__fileExportAction = QAction('&Export...', self)
         self.__fileExportAction.setEnabled(False)
 
@@ -46,27 +60,79 @@ class MainWindow(QMainWindow):
         self.__fileExitAction = QAction('E&xit', self)
         self.__fileExitAction.setShortcuts(QKeySequence.Quit)
 
-        self.__imageDatabaseWidget = ImageDatabaseWidget(self.__imageDatabase, self)
+        self.__imageCache = ImageCache(int(self.__settings.value('ImageCacheMegabytes', 512)) * 1024 * 1024, self)
+
+        self.__thumbnailCache = ThumbnailCache(parent=self)
+
+        self.__autosaver = Autosaver(self.__imageDatabase, int(self.__settings.value('AutosaveSeconds', 60)) * 1000, parent=self)
+
+        self.__imageIndex = ImageIndex(self.__imageDatabase, self)
+        self.__imageDatabaseWidget = ImageDatabaseWidget(self.__imageDatabase, self.__imageIndex, self.__thumbnailCache, parent=self)
         self.addDockWidget(Qt.LeftDockWidgetArea, self.__imageDatabaseWidget)
 
         self.__labelWidget = LabelWidget(self.__imageDatabase, self)
         self.addDockWidget(Qt.RightDockWidgetArea, self.__labelWidget)
 
-        self.__imageWidget = ImageWidget(self)
+        self.__imageWidget = ImageWidget(self.__imageCache, parent=self)
         self.setCentralWidget(self.__imageWidget)
 
         self.__fileMenu = self.menuBar().addMenu('&File')
 
+        self.__editMenu = self.menuBar().addMenu('&Edit')
+        self.__editUndoAction = self.__editMenu.addAction('&Undo')
+        self.__editUndoAction.setShortcuts(QKeySequence.Undo)
+        self.__editRedoAction = self.__editMenu.addAction('&Redo')
+        self.__editRedoAction.setShortcuts(QKeySequence.Redo)
+        self.updateEditMenu()
+
         self.__labelMenu = self.menuBar().addMenu('&Labels')
         for cls in sorted(LabelBase.__subclasses__(), key=lambda _: _.name().lower()):
             act = self.__labelMenu.addAction(cls.icon(), cls.name())
             act.triggered.connect(lambda checked, cls=cls: self.__imageWidget.showLabelType(cls) if checked else self.__imageWidget.hideLabelType(cls))
             act.setCheckable(True)
             act.setChecked(True)
+        self.__labelMenu.addSeparator()
+        for number, cls in enumerate(sorted(LabelBase.__subclasses__(), key=lambda _: _.name().lower()), 1):
+            act = self.__labelMenu.addAction(cls.icon(), 'Add ' + cls.name())
+            act.setShortcut(QKeySequence(str(number)))
+            act.triggered.connect(lambda checked, cls=cls: self.__labelWidget.startLabel(cls))
+        cancelLabelAction = self.__labelMenu.addAction('Cancel Label')
+        cancelLabelAction.setShortcut(QKeySequence(Qt.Key_Escape))
+        self.__labelMenu.addSeparator()
+        copyLabelsAction = self.__labelMenu.addAction('&Copy Labels from Previous Image')
+        copyLabelsAction.setShortcut(QKeySequence('C'))
+        self.__carryLabelsAction = self.__labelMenu.addAction('Carry Labels &Forward')
+        self.__carryLabelsAction.setCheckable(True)
+        self.__carryLabelsAction.setChecked(self.__settings.value('CarryLabelsForward', False, type=bool))
+        self.__labelMenu.addSeparator()
+        interpolateLabelsAction = self.__labelMenu.addAction('&Interpolate Between Keyframes')
+        interpolateLabelsAction.setShortcut(QKeySequence('I'))
+        trackLabelsAction = self.__labelMenu.addAction('&Track Between Keyframes')
+        trackLabelsAction.setShortcut(QKeySequence('T'))
 
         self.__viewMenu = self.menuBar().addMenu('&View')
         self.__viewMenu.addAction(self.__imageDatabaseWidget.toggleViewAction())
         self.__viewMenu.addAction(self.__labelWidget.toggleViewAction())
+        thumbnailsAction = self.__viewMenu.addAction('&Thumbnails')
+        thumbnailsAction.setCheckable(True)
+        thumbnailsAction.setChecked(self.__settings.value('ShowThumbnails', False, type=bool))
+        self.__imageDatabaseWidget.setThumbnailsVisible(thumbnailsAction.isChecked())
+        self.__viewMenu.addSeparator()
+        zoomInAction = self.__viewMenu.addAction('Zoom &In')
+        zoomInAction.setShortcuts(QKeySequence.ZoomIn)
+        zoomOutAction = self.__viewMenu.addAction('Zoom &Out')
+        zoomOutAction.setShortcuts(QKeySequence.ZoomOut)
+        actualSizeAction = self.__viewMenu.addAction('&Actual Size')
+        actualSizeAction.setShortcut(QKeySequence('Ctrl+0'))
+        fitToWindowAction = self.__viewMenu.addAction('&Fit to Window')
+        self.__viewMenu.addSeparator()
+        nextImageAction = self.__viewMenu.addAction('&Next Image')
+        nextImageAction.setShortcuts([QKeySequence('D'), QKeySequence(Qt.Key_PageDown)])
+        previousImageAction = self.__viewMenu.addAction('&Previous Image')
+        previousImageAction.setShortcuts([QKeySequence('A'), QKeySequence(Qt.Key_PageUp)])
+        self.__viewMenu.addSeparator()
+        statisticsAction = self.__viewMenu.addAction('&Statistics...')
+        duplicatesAction = self.__viewMenu.addAction('&Duplicates...')
 
         self.__helpMenu = self.menuBar().addMenu('&Help')
         aboutAction = self.__helpMenu.addAction('&About')
@@ -76,8 +142,12 @@ class MainWindow(QMainWindow):
         self.__fileOpenAction.triggered.connect(self.open)
         self.__fileSaveAction.triggered.connect(self.save)
         self.__fileSaveAsAction.triggered.connect(lambda: self.save(saveAs=True))
+        self.__fileImportAction.triggered.connect(self.importDatabase)
+        self.__fileCompactAction.triggered.connect(self.compact)
         self.__fileExportAction.triggered.connect(self.export)
         self.__fileExitAction.triggered.connect(self.close)
+        self.__editUndoAction.triggered.connect(self.__imageDatabase.undo)
+        self.__editRedoAction.triggered.connect(self.__imageDatabase.redo)
 
         self.__imageDatabase.preImageDatabaseChanged.connect(self.__imageDatabaseWidget.preChangeImageDatabase)
         self.__imageDatabase.imageDatabaseChanged.connect(self.__imageDatabaseWidget.changeImageDatabase)
@@ -85,10 +155,24 @@ class MainWindow(QMainWindow):
         self.__imageDatabase.imageDatabaseChanged.connect(self.__labelWidget.changeImageDatabase)
         self.__imageDatabase.preImageAdded.connect(self.__imageDatabaseWidget.preAddImage)
         self.__imageDatabase.imageAdded.connect(self.__imageDatabaseWidget.addImage)
+        self.__imageDatabase.preImagesAdded.connect(self.__imageDatabaseWidget.preAddImages)
+        self.__imageDatabase.imagesAdded.connect(self.__imageDatabaseWidget.addImages)
         self.__imageDatabase.preImageRemoved.connect(self.__imageDatabaseWidget.preRemoveImage)
         self.__imageDatabase.imageRemoved.connect(self.__imageDatabaseWidget.removeImage)
         self.__imageDatabase.imageRemoved.connect(self.__imageWidget.removeImage)
         self.__imageDatabase.imageRemoved.connect(self.__labelWidget.removeImage)
+        self.__imageDatabase.preImagesRemoved.connect(self.__imageDatabaseWidget.preRemoveImages)
+        self.__imageDatabase.imagesRemoved.connect(self.__imageDatabaseWidget.removeImages)
+        self.__imageDatabase.imagesRemoved.connect(self.__imageWidget.removeImages)
+        self.__imageDatabase.imagesRemoved.connect(self.__labelWidget.removeImages)
+        self.__imageDatabase.preImagesChanged.connect(self.__imageDatabaseWidget.preChangeImages)
+        self.__imageDatabase.imagesChanged.connect(self.__imageDatabaseWidget.changeImages)
+        self.__imageDatabase.imagesChanged.connect(self.__imageWidget.removeImages)
+        self.__imageDatabase.imagesChanged.connect(self.__labelWidget.removeImages)
+        self.__imageDatabase.labelsChanged.connect(self.__imageWidget.changeLabels)
+        self.__imageDatabase.labelsChanged.connect(self.__labelWidget.changeLabels)
+        self.__imageDatabase.undoStackChanged.connect(self.updateEditMenu)
+        self.__imageIndex.imagesUpdated.connect(self.__imageDatabaseWidget.updateImages)
         self.__imageDatabase.labelAdded.connect(self.__imageWidget.addLabel)
         self.__imageDatabase.preLabelAdded.connect(self.__labelWidget.preAddLabel)
         self.__imageDatabase.labelAdded.connect(self.__labelWidget.addLabel)
@@ -98,10 +182,18 @@ class MainWindow(QMainWindow):
         self.__imageDatabase.labelRemoved.connect(self.__imageWidget.removeLabel)
         self.__imageDatabase.labelRemoved.connect(self.__labelWidget.removeLabel)
         self.__imageDatabaseWidget.addImageClicked.connect(self.addImage)
+        self.__imageDatabaseWidget.addDirectoryClicked.connect(self.addDirectory)
         self.__imageDatabaseWidget.selectImageClicked.connect(self.__imageWidget.selectImage)
         self.__imageDatabaseWidget.selectImageClicked.connect(self.__labelWidget.selectImage)
+        self.__imageDatabaseWidget.selectImageClicked.connect(self.__imageDatabase.setCurrentImage)
+        self.__imageDatabaseWidget.prefetchRequested.connect(self.__imageCache.prefetch)
+        self.__imageDatabaseWidget.imageStepped.connect(self.carryLabels)
         self.__imageDatabaseWidget.removeImageClicked.connect(self.__imageDatabase.removeImage)
         self.__imageWidget.mousePressed.connect(self.__labelWidget.addPoint)
+        self.__imageWidget.labelClicked.connect(self.__labelWidget.selectLabel)
+        self.__imageWidget.labelMoved.connect(self.__imageDatabase.changeLabel)
+        self.__labelWidget.remainingClicksChanged.connect(self.__imageWidget.setRemainingClicks)
+        self.__labelWidget.labelSelected.connect(self.__imageWidget.selectLabel)
         self.__labelWidget.labelCreated.connect(self.__imageDatabase.addLabel)
         self.__labelWidget.labelEdited.connect(self.__imageDatabase.changeLabel)
         self.__labelWidget.labelDeleted.connect(self.__imageDatabase.removeLabel)
@@ -113,6 +205,21 @@ class MainWindow(QMainWindow):
 
         self.__fileMenu.aboutToShow.connect(self.updateFileMenu)
 
+        zoomInAction.triggered.connect(self.__imageWidget.zoomIn)
+        zoomOutAction.triggered.connect(self.__imageWidget.zoomOut)
+        actualSizeAction.triggered.connect(self.__imageWidget.resetZoom)
+        fitToWindowAction.triggered.connect(self.__imageWidget.fitToWindow)
+        nextImageAction.triggered.connect(self.__imageDatabaseWidget.selectNextImage)
+        previousImageAction.triggered.connect(self.__imageDatabaseWidget.selectPreviousImage)
+        cancelLabelAction.triggered.connect(self.__labelWidget.cancelLabel)
+        copyLabelsAction.triggered.connect(self.copyLabelsFromPreviousImage)
+        interpolateLabelsAction.triggered.connect(lambda: self.interpolateLabels(track=False))
+        trackLabelsAction.triggered.connect(lambda: self.interpolateLabels(track=True))
+        self.__carryLabelsAction.toggled.connect(lambda checked: self.__settings.setValue('CarryLabelsForward', checked))
+        thumbnailsAction.toggled.connect(self.__imageDatabaseWidget.setThumbnailsVisible)
+        thumbnailsAction.toggled.connect(lambda checked: self.__settings.setValue('ShowThumbnails', checked))
+        statisticsAction.triggered.connect(self.showStatistics)
+        duplicatesAction.triggered.connect(self.findDuplicates)
         aboutAction.triggered.connect(self.about)
         aboutQtAction.triggered.connect(QApplication.instance().aboutQt)
 
@@ -131,6 +238,7 @@ class MainWindow(QMainWindow):
 
         self.__fileSaveAction.setEnabled(True)
         self.__fileSaveAsAction.setEnabled(True)
+        self.__fileCompactAction.setEnabled(True)
         self.__fileExportAction.setEnabled(True)
         self.__fileCloseAction.setEnabled(True)
 
@@ -158,6 +266,31 @@ class MainWindow(QMainWindow):
 
         self.saveFile(self.__filePath)
 
+    def compact(self):
+        if self.__filePath == '':
+            return self.save(saveAs=True)
+
+        self.__imageDatabase.writeToFile(self.__filePath, compact=True)
+        return True
+
+    def importDatabase(self):
+        importName, _ = QFileDialog.getOpenFileName(self, 'Import Database', self.__settings.value('ExportDirectory', ''), 'JSON files (*.json);;All files (*)')
+        if importName == '':
+            return
+        self.__settings.setValue('ExportDirectory', QFileInfo(importName).dir().path())
+
+        if not self.closeFile():
+            return
+
+        self.__imageDatabase.importFromJson(importName)
+        self.__filePath = ''
+
+        self.__fileSaveAction.setEnabled(True)
+        self.__fileSaveAsAction.setEnabled(True)
+        self.__fileCompactAction.setEnabled(True)
+        self.__fileExportAction.setEnabled(True)
+        self.__fileCloseAction.setEnabled(True)
+
     def export(self):
         if not self.__imageDatabase.exists():
             return
@@ -170,7 +303,117 @@ class MainWindow(QMainWindow):
         self.__settings.setValue('ExportDirectory', fileInfo.dir().path())
         exportPath = fileInfo.absoluteDir().canonicalPath() + '/' + fileInfo.fileName()
 
-        self.__imageDatabase.exportToJson(exportPath)
+        labeledImages = list(self.__imageDatabase.labeledImages)
+        exporter = JsonExporter(labeledImages, exportPath, self)
+        progress = QProgressDialog('Exporting to ' + exportPath + '...', 'Cancel', 0, len(labeledImages), self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.canceled.connect(exporter.requestInterruption)
+        exporter.progressChanged.connect(progress.setValue)
+        exporter.exportFailed.connect(lambda error: QMessageBox.warning(self, 'Export', 'Exporting to {} failed: {}'.format(exportPath, error)))
+        exporter.finished.connect(progress.close)
+        exporter.finished.connect(exporter.deleteLater)
+        exporter.start()
+        progress.show()
+
+    def showStatistics(self):
+        if not self.__imageDatabase.exists():
+            return
+
+        dialog = StatisticsDialog(self.__imageDatabase.labeledImages, self)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.labelActivated.connect(self.showLabel)
+        dialog.show()
+
+    def showLabel(self, image, label):
+        # The statistics are a snapshot, so the label may have been removed since.
+        if self.__imageDatabase.rowOfImage(image) is None or label not in image.labels.get(type(label), []):
+            return
+        self.__imageDatabaseWidget.selectImage(image)
+        self.__labelWidget.selectLabel(image, label)
+
+    def findDuplicates(self):
+        if not self.__imageDatabase.exists():
+            return
+
+        maximumDistance, ok = QInputDialog.getInt(self, 'Find Duplicates', 'Maximum number of differing bits between similar images\n(0 only finds exact copies):', 4, 0, 16)
+        if not ok:
+            return
+
+        labeledImages = list(self.__imageDatabase.labeledImages)
+        hasher = ImageHasher([labeledImage.imageFile for labeledImage in labeledImages], maximumDistance > 0, self)
+        progress = QProgressDialog('Hashing images...', 'Cancel', 0, len(labeledImages), self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.canceled.connect(hasher.requestInterruption)
+        hasher.progressChanged.connect(progress.setValue)
+        hasher.hashesComputed.connect(lambda hashes: self.showDuplicates(findDuplicates(labeledImages, hashes, maximumDistance), hashes))
+        hasher.finished.connect(progress.close)
+        hasher.finished.connect(hasher.deleteLater)
+        hasher.start()
+        progress.show()
+
+    def showDuplicates(self, groups, hashes):
+        if not groups:
+            QMessageBox.information(self, 'Duplicates', 'No duplicates found.')
+            return
+
+        dialog = DuplicatesDialog(groups, hashes, self)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.imageActivated.connect(self.__imageDatabaseWidget.selectImage)
+        dialog.mergeRequested.connect(self.mergeDuplicates)
+        dialog.show()
+
+    def mergeDuplicates(self, groups):
+        with self.__imageDatabase.transaction('Merge Duplicates'):
+            for group in groups:
+                # The groups are a snapshot, so images may have been removed since.
+                group = [labeledImage for labeledImage in group if self.__imageDatabase.rowOfImage(labeledImage) is not None]
+                if len(group) > 1:
+                    mergeDuplicates(self.__imageDatabase, group)
+
+    def copyLabelsFromPreviousImage(self):
+        image = self.__imageDatabaseWidget.currentImage()
+        row = self.__imageDatabase.rowOfImage(image) if image is not None else None
+        if not row:
+            return
+        self.__imageDatabase.copyLabels(self.__imageDatabase.labeledImages[row - 1], image)
+
+    def carryLabels(self, previousImage, image):
+        # Only frames without labels get the labels of the frame before, so stepping back and forth does not stack them.
+        if not self.__carryLabelsAction.isChecked() or any(image.labels.values()):
+            return
+        self.__imageDatabase.copyLabels(previousImage, image)
+
+    def interpolateLabels(self, track):
+        image = self.__imageDatabaseWidget.currentImage()
+        if image is None:
+            return
+        labeledImages = list(self.__imageDatabase.labeledImages)
+        keyframes = findKeyframes(labeledImages, self.__imageDatabase.rowOfImage(image))
+        if keyframes is None:
+            QMessageBox.information(self, 'Keyframes', 'The current image has to be between two labeled images with unlabeled images between them, or be the second of them.')
+            return
+        first, last = keyframes
+        if not track:
+            self.addProposals('Interpolate Labels', interpolationProposals(labeledImages, first, last))
+            return
+
+        tracker = LabelTracker(labeledImages, first, last, self)
+        progress = QProgressDialog('Tracking labels...', 'Cancel', 0, last - first - 1, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.canceled.connect(tracker.requestInterruption)
+        tracker.progressChanged.connect(progress.setValue)
+        tracker.proposalsComputed.connect(lambda proposals: self.addProposals('Track Labels', proposals))
+        tracker.finished.connect(progress.close)
+        tracker.finished.connect(tracker.deleteLater)
+        tracker.start()
+        progress.show()
+
+    def addProposals(self, text, proposals):
+        with self.__imageDatabase.transaction(text):
+            for labeledImage, label in proposals:
+                # The images are a snapshot, so they may have been removed since.
+                if self.__imageDatabase.rowOfImage(labeledImage) is not None:
+                    self.__imageDatabase.addLabel(labeledImage, label)
 
     def openFile(self, fileName):
         if not self.closeFile():
@@ -195,6 +438,7 @@ class MainWindow(QMainWindow):
 
         self.__fileSaveAction.setEnabled(True)
         self.__fileSaveAsAction.setEnabled(True)
+        self.__fileCompactAction.setEnabled(True)
         self.__fileExportAction.setEnabled(True)
         self.__fileCloseAction.setEnabled(True)
 
@@ -211,6 +455,7 @@ class MainWindow(QMainWindow):
 
         self.__imageDatabase.writeToFile(filePath)
         self.__filePath = filePath
+        self.__autosaver.discard()
 
     def closeFile(self):
         if self.__imageDatabase.modified():
@@ -224,20 +469,30 @@ class MainWindow(QMainWindow):
 
         self.__fileSaveAction.setEnabled(False)
         self.__fileSaveAsAction.setEnabled(False)
+        self.__fileCompactAction.setEnabled(False)
         self.__fileExportAction.setEnabled(False)
         self.__fileCloseAction.setEnabled(False)
 
         self.__imageDatabase.clear()
+        self.__autosaver.discard()
 
         return True
 
+    def updateEditMenu(self):
+        self.__editUndoAction.setEnabled(self.__imageDatabase.canUndo())
+        self.__editUndoAction.setText('&Undo ' + self.__imageDatabase.undoText() if self.__imageDatabase.canUndo() else '&Undo')
+        self.__editRedoAction.setEnabled(self.__imageDatabase.canRedo())
+        self.__editRedoAction.setText('&Redo ' + self.__imageDatabase.redoText() if self.__imageDatabase.canRedo() else '&Redo')
+
     def updateFileMenu(self):
         self.__fileMenu.clear()
         self.__fileMenu.addAction(self.__fileNewAction)
         self.__fileMenu.addAction(self.__fileOpenAction)
+        self.__fileMenu.addAction(self.__fileImportAction)
         self.__fileMenu.addSeparator()
         self.__fileMenu.addAction(self.__fileSaveAction)
         self.__fileMenu.addAction(self.__fileSaveAsAction)
+        self.__fileMenu.addAction(self.__fileCompactAction)
         self.__fileMenu.addAction(self.__fileExportAction)
 
         if self.__recentFiles:
@@ -256,8 +511,45 @@ class MainWindow(QMainWindow):
         if not self.closeFile():
             event.ignore()
             return
+        self.__autosaver.close()
         super().closeEvent(event)
 
+    def recover(self):
+        removeStaleLocks()
+        for fileName, lock in recoverableFiles():
+            recovery = readRecoveryFile(fileName)
+            if recovery is None:
+                removeRecoveryFile(fileName, lock)
+                continue
+            origin, records = recovery
+            name = origin[1] if origin[0] != 'new' else 'a new database'
+            if not isRecoverable(origin):
+                QMessageBox.warning(self, 'Recovery', 'The unsaved changes to {} cannot be recovered because it has changed since.'.format(name))
+                removeRecoveryFile(fileName, lock)
+                continue
+            reply = QMessageBox.question(self, 'Recovery', 'The labeling tool was not closed properly. Do you want to recover the unsaved changes to {}?'.format(name), QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                if origin[0] == 'database':
+                    self.openFile(origin[1])
+                elif origin[0] == 'json':
+                    self.__imageDatabase.importFromJson(origin[1])
+                    self.__filePath = ''
+                else:
+                    self.__imageDatabase.createNew()
+                    self.__filePath = ''
+                self.__imageDatabase.applyOperations(records)
+
+                self.__fileSaveAction.setEnabled(True)
+                self.__fileSaveAsAction.setEnabled(True)
+                self.__fileCompactAction.setEnabled(True)
+                self.__fileExportAction.setEnabled(True)
+                self.__fileCloseAction.setEnabled(True)
+            removeRecoveryFile(fileName, lock)
+            # Only one database can be open, other recovery files are offered on the next start.
+            if reply == QMessageBox.Yes:
+                self.__autosaver.autosave()
+                return
+
     def addImage(self):
         if not self.__imageDatabase.exists():
             return
@@ -270,3 +562,26 @@ class MainWindow(QMainWindow):
         self.__settings.setValue('ImageDirectory', fileInfo.dir().path())
 
         self.__imageDatabase.addImage(LabeledImage(filePath))
+
+    def addDirectory(self):
+        if not self.__imageDatabase.exists():
+            return
+
+        directory = QFileDialog.getExistingDirectory(self, 'Add Directory', self.__settings.value('ImageDirectory', ''))
+        if directory == '':
+            return
+        self.__settings.setValue('ImageDirectory', directory)
+
+        patterns, ok = QInputDialog.getText(self, 'Add Directory', 'File patterns:', text=' '.join(imageFilePatterns()))
+        if not ok or not patterns.split():
+            return
+
+        scanner = DirectoryScanner(QFileInfo(directory).canonicalFilePath(), patterns.split(), self)
+        progress = QProgressDialog('Scanning ' + directory + '...', 'Cancel', 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.canceled.connect(scanner.requestInterruption)
+        scanner.imagesFound.connect(self.__imageDatabase.addImages)
+        scanner.finished.connect(progress.close)
+        scanner.finished.connect(scanner.deleteLater)
+        scanner.start()
+        progress.show()
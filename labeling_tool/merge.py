@@ -0,0 +1,273 @@
+import itertools
+import math
+import os
+import pickle
+import sqlite3
+import tempfile
+
+from labeling_tool import journal
+from labeling_tool.imagedatabase import LabeledImage, canonicalPath, iterDecodeImageDatabase, iterEncodeImageDatabase
+import labeling_tool.labels
+
+
+SCHEMA = '''
+CREATE TABLE entries (
+    key TEXT NOT NULL,
+    input INTEGER NOT NULL,
+    ordinal INTEGER NOT NULL,
+    imageFile TEXT NOT NULL,
+    labels BLOB NOT NULL
+);
+CREATE TABLE merged (
+    input INTEGER NOT NULL,
+    ordinal INTEGER NOT NULL,
+    imageFile TEXT NOT NULL,
+    labels BLOB NOT NULL
+);
+'''
+
+def iterLabeledImages(fileName):
+    # JSON, SQLite and sharded databases are read one image at a time. A pickled snapshot can only be loaded as a whole,
+    # but its images are let go of as soon as they have been passed on.
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension == '.json':
+        with open(fileName, 'r') as f:
+            yield from iterDecodeImageDatabase(f)
+    elif extension in ('.sqlite', '.db'):
+        from labeling_tool.sqlitestorage import iterReadDatabase
+        yield from iterReadDatabase(fileName)
+    elif extension == '.shards':
+        from labeling_tool.shardedstorage import iterReadDatabase
+        yield from iterReadDatabase(fileName)
+    else:
+        labeledImages = journal.readDatabase(fileName)
+        labeledImages.reverse()
+        while labeledImages:
+            yield labeledImages.pop()
+
+def writeLabeledImages(fileName, labeledImages):
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension == '.json':
+        with open(fileName, 'w') as f:
+            for chunk in iterEncodeImageDatabase(labeledImages):
+                f.write(chunk)
+    elif extension in ('.sqlite', '.db'):
+        from labeling_tool.sqlitestorage import SqliteStorage
+        storage = SqliteStorage()
+        storage.write(fileName, labeledImages)
+        storage.close()
+    elif extension == '.shards':
+        from labeling_tool.shardedstorage import ShardedStorage
+        ShardedStorage().write(fileName, labeledImages)
+    else:
+        # A pickled snapshot is a single list, so only this format needs the whole result in memory.
+        journal.writeSnapshot(fileName, list(labeledImages))
+
+def isNearlyIdentical(a, b, tolerance):
+    # Compares the states of two labels of the same type. Coordinates may differ by the tolerance, everything else has to be equal.
+    if a == b:
+        return True
+    for x, y in zip(a, b):
+        if type(x) in (int, float) and type(y) in (int, float):
+            if abs(x - y) > tolerance:
+                return False
+        elif x != y:
+            return False
+    return True
+
+def overlaps(a, b, tolerance):
+    # Two labels are of the same object if their bounding boxes, grown by the tolerance, share at least half of their union.
+    # Growing them gives lines and points an area.
+    aLeft, aTop, aRight, aBottom = a.boundingBox()
+    bLeft, bTop, bRight, bBottom = b.boundingBox()
+    margin = max(tolerance, 1)
+    aLeft, aTop, aRight, aBottom = aLeft - margin, aTop - margin, aRight + margin, aBottom + margin
+    bLeft, bTop, bRight, bBottom = bLeft - margin, bTop - margin, bRight + margin, bBottom + margin
+    intersection = max(0, min(aRight, bRight) - max(aLeft, bLeft)) * max(0, min(aBottom, bBottom) - max(aTop, bTop))
+    union = (aRight - aLeft) * (aBottom - aTop) + (bRight - bLeft) * (bBottom - bTop) - intersection
+    return union > 0 and intersection >= union / 2
+
+def labelCenter(label):
+    left, top, right, bottom = label.boundingBox()
+    return ((left + right) / 2, (top + bottom) / 2)
+
+def replacementDistance(label, other, tolerance):
+    # A side that changes a label may resize or move it well beyond any overlap, so the label that takes its place only has
+    # to be close: its center at most the size of the larger of both labels away. Returns None for labels too far apart.
+    aLeft, aTop, aRight, aBottom = label.boundingBox()
+    bLeft, bTop, bRight, bBottom = other.boundingBox()
+    distance = math.dist(labelCenter(label), labelCenter(other))
+    return distance if distance <= max(aRight - aLeft, aBottom - aTop, bRight - bLeft, bBottom - bTop, 1) + tolerance else None
+
+def uniteLabels(labels, otherLabels, tolerance):
+    # The labels of two images that are the same image within one input.
+    for cls, others in otherLabels.items():
+        united = labels.setdefault(cls, [])
+        states = [label.__getstate__() for label in united]
+        for label in others:
+            state = label.__getstate__()
+            if not any(isNearlyIdentical(state, other, tolerance) for other in states):
+                united.append(label)
+                states.append(state)
+    return labels
+
+def mergeLabels(base, sides, tolerance):
+    # A three-way merge of the labels of one image. base is None if the image is new, a side is None if it removed the image.
+    # Without a common base every input is a side that only adds labels. Returns the merged labels, or None if the image
+    # is removed, and the conflicts as (label type, reason).
+    conflicts = []
+    present = [side for side in sides if side is not None]
+    if base is not None and len(present) < len(sides):
+        if not any(isRelabeled(base, side, tolerance) for side in present):
+            return None, conflicts
+        conflicts.append((None, 'image removed by one side and relabeled by another'))
+    base = base or {}
+
+    merged = {}
+    for cls in dict.fromkeys(itertools.chain(base, *present)):
+        labels, _, _, typeConflicts = mergeLabelType(base.get(cls, []), [side.get(cls, []) for side in present], tolerance)
+        if labels:
+            merged[cls] = labels
+        conflicts += [(cls, reason) for reason in typeConflicts]
+    return merged, conflicts
+
+def isRelabeled(base, side, tolerance):
+    for cls in set(base) | set(side):
+        _, removed, added, _ = mergeLabelType(base.get(cls, []), [side.get(cls, [])], tolerance)
+        if removed or added:
+            return True
+    return False
+
+def mergeLabelType(baseLabels, sideLabels, tolerance):
+    # Labels every side kept are kept. Labels a side does not have a nearly identical copy of are removed, and labels of a
+    # side that are not in the base are added. Returns the merged labels, the removed and added ones and the conflicts.
+    baseStates = [label.__getstate__() for label in baseLabels]
+    sideStates = [[label.__getstate__() for label in labels] for labels in sideLabels]
+    # Most images are not touched by any side.
+    if all(states == baseStates for states in sideStates):
+        return list(baseLabels), [], [], []
+
+    removed = {}
+    additions = []
+    for side, (labels, states) in enumerate(zip(sideLabels, sideStates)):
+        for i, state in enumerate(baseStates):
+            if not any(isNearlyIdentical(state, other, tolerance) for other in states):
+                removed.setdefault(i, []).append(side)
+        additions += [(side, label, state) for label, state in zip(labels, states) if not any(isNearlyIdentical(state, other, tolerance) for other in baseStates)]
+
+    conflicts = []
+    merged = [label for i, label in enumerate(baseLabels) if i not in removed]
+    mergedStates = [state for i, state in enumerate(baseStates) if i not in removed]
+    added = []
+    for side, label, state in additions:
+        if any(isNearlyIdentical(state, other, tolerance) for other in mergedStates):
+            continue
+        # Different labels of the same object from different sides disagree. The label of the first side wins.
+        if any(otherSide != side and overlaps(label, other, tolerance) for otherSide, other in added):
+            conflicts.append('labeled differently by the sides')
+            continue
+        added.append((side, label))
+        merged.append(label)
+        mergedStates.append(state)
+
+    # A side that changed a label has a new one in its place, the closest of the labels it removed. If another side removed
+    # the label without a replacement, they disagree.
+    replacedBy = {}
+    for side, label, _ in additions:
+        candidates = [(replacementDistance(baseLabels[i], label, tolerance), i) for i, sides in removed.items() if side in sides]
+        candidates = [(distance, i) for distance, i in candidates if distance is not None]
+        if candidates:
+            replacedBy.setdefault(min(candidates)[1], set()).add(side)
+    for i, sides in removed.items():
+        if i in replacedBy and len(replacedBy[i]) < len(sides):
+            conflicts.append('label changed by one side and removed by another')
+    return merged, [baseLabels[i] for i in removed], [label for _, label in added], conflicts
+
+def imageKeys(labeledImages, match, cache):
+    if match == 'path':
+        return [canonicalPath(labeledImage.imageFile) for labeledImage in labeledImages]
+    from labeling_tool.imagehashes import hashImages
+    # Images that cannot be read are matched by their path.
+    hashes = hashImages([labeledImage.imageFile for labeledImage in labeledImages], cache)
+    return ['sha256:' + hashes[labeledImage.imageFile][0] if labeledImage.imageFile in hashes else canonicalPath(labeledImage.imageFile) for labeledImage in labeledImages]
+
+def mergeDatabases(output, inputs, base=None, match='path', tolerance=1.0, cacheFile=None, conflict=None, batchSize=1024):
+    # The inputs are spilled into a temporary SQLite database, which sorts them by image on disk. The merge then reads
+    # the images of all inputs one at a time, so memory does not grow with the size of the databases.
+    cache = None
+    if match == 'content':
+        from labeling_tool.imagehashes import HashCache
+        cache = HashCache(cacheFile)
+    fileNames = ([base] if base is not None else []) + list(inputs)
+    imageCount = 0
+    conflictCount = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as directory:
+        connection = sqlite3.connect(os.path.join(directory, 'merge.sqlite'))
+        try:
+            # The database only lives as long as the merge, so it does not need to survive a crash.
+            connection.execute('PRAGMA journal_mode = OFF')
+            connection.execute('PRAGMA synchronous = OFF')
+            connection.executescript(SCHEMA)
+            for inputIndex, fileName in enumerate(fileNames):
+                labeledImages = iterLabeledImages(fileName)
+                ordinal = 0
+                while True:
+                    batch = list(itertools.islice(labeledImages, batchSize))
+                    if not batch:
+                        break
+                    with connection:
+                        connection.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                                               ((key, inputIndex, ordinal + i, labeledImage.imageFile, pickle.dumps(labeledImage.labels, pickle.HIGHEST_PROTOCOL))
+                                                for i, (key, labeledImage) in enumerate(zip(imageKeys(batch, match, cache), batch))))
+                    ordinal += len(batch)
+            connection.execute('CREATE INDEX entriesByKey ON entries (key, input, ordinal)')
+
+            merged = []
+            rows = connection.execute('SELECT key, input, ordinal, imageFile, labels FROM entries ORDER BY key, input, ordinal')
+            for _, group in itertools.groupby(rows, key=lambda row: row[0]):
+                entries = {}
+                for _, inputIndex, ordinal, imageFile, labels in group:
+                    labels = pickle.loads(labels)
+                    if inputIndex in entries:
+                        uniteLabels(entries[inputIndex][2], labels, tolerance)
+                    else:
+                        entries[inputIndex] = (ordinal, imageFile, labels)
+                # The image keeps its place in the first input that has it, so the base keeps its order and new images follow.
+                first = min(entries)
+                ordinal, imageFile, _ = entries[first]
+                if base is not None:
+                    baseLabels = entries[0][2] if 0 in entries else None
+                    sides = [entries[i][2] if i in entries else None for i in range(1, len(fileNames))]
+                    # An image that is not in the base is new, so a side that does not have it did not remove it.
+                    if baseLabels is None:
+                        sides = [side for side in sides if side is not None]
+                else:
+                    baseLabels = None
+                    sides = [entries[i][2] for i in sorted(entries)]
+                labels, conflicts = mergeLabels(baseLabels, sides, tolerance)
+                for cls, reason in conflicts:
+                    conflictCount += 1
+                    if conflict:
+                        conflict(imageFile, cls, reason)
+                if labels is None:
+                    continue
+                merged.append((first, ordinal, imageFile, pickle.dumps(labels, pickle.HIGHEST_PROTOCOL)))
+                if len(merged) == batchSize:
+                    connection.executemany('INSERT INTO merged VALUES (?, ?, ?, ?)', merged)
+                    merged = []
+            connection.executemany('INSERT INTO merged VALUES (?, ?, ?, ?)', merged)
+            connection.commit()
+            connection.execute('CREATE INDEX mergedByOrder ON merged (input, ordinal)')
+
+            def mergedImages():
+                for imageFile, labels in connection.execute('SELECT imageFile, labels FROM merged ORDER BY input, ordinal'):
+                    labeledImage = LabeledImage(imageFile)
+                    labeledImage.labels = pickle.loads(labels)
+                    yield labeledImage
+            imageCount, = connection.execute('SELECT COUNT(*) FROM merged').fetchone()
+            writeLabeledImages(output, mergedImages())
+        finally:
+            connection.close()
+            if cache is not None:
+                cache.close()
+    return imageCount, conflictCount
@@ -0,0 +1,115 @@
+import collections
+import concurrent.futures
+import csv
+import itertools
+import math
+import os
+import random
+
+from PyQt5.QtCore import QRect, Qt
+from PyQt5.QtGui import QImage
+
+from labeling_tool.imagedatabase import jsonName
+
+
+def labelRegion(label, margin):
+    left, top, right, bottom = label.boundingBox()
+    dx = (right - left) * margin
+    dy = (bottom - top) * margin
+    return (math.floor(left - dx), math.floor(top - dy), math.ceil(right + dx), math.ceil(bottom + dy))
+
+def squareRegion(region):
+    # Patches are square, so the region grows to its longer side around the center and is never distorted.
+    left, top, right, bottom = region
+    side = max(right - left, bottom - top, 1)
+    left = (left + right - side) // 2
+    top = (top + bottom - side) // 2
+    return (left, top, left + side, top + side)
+
+def clampRegion(region, width, height):
+    # A square that reaches over the border of the image is moved into it. Only squares larger than the image stick out,
+    # and QImage.copy() pads them with zeros.
+    left, top, right, bottom = region
+    side = right - left
+    left = min(max(left, 0), width - side) if side <= width else (width - side) // 2
+    top = min(max(top, 0), height - side) if side <= height else (height - side) // 2
+    return (left, top, left + side, top + side)
+
+def patchRegion(region, width, height):
+    return clampRegion(squareRegion(region), width, height)
+
+def overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def sampleNegatives(rng, width, height, occupied, sides, count):
+    negatives = []
+    for _ in range(count * 20):
+        if len(negatives) == count:
+            break
+        side = min(rng.choice(sides), width, height)
+        left = rng.randint(0, width - side)
+        top = rng.randint(0, height - side)
+        region = (left, top, left + side, top + side)
+        if not any(overlaps(region, other) for other in occupied):
+            negatives.append(region)
+            occupied.append(region)
+    return negatives
+
+def extractPatches(task):
+    row, imageFile, positives, occupied, negatives, size, directory, seed = task
+    image = QImage(imageFile)
+    if image.isNull():
+        return []
+
+    # Negatives are tested against the squares that are cut around the labels, not only against the labels themselves.
+    positives = [(name, index, patchRegion(region, image.width(), image.height())) for name, index, region in positives]
+    occupied = [patchRegion(region, image.width(), image.height()) for region in occupied]
+
+    # Every image gets its own generator, so the negatives do not depend on which process handles which image.
+    rng = random.Random('{}:{}'.format(seed, imageFile))
+    sides = [right - left for _, _, (left, _, right, _) in positives] or [size, 2 * size, 4 * size]
+    regions = positives + [('negative', i, region) for i, region in enumerate(sampleNegatives(rng, image.width(), image.height(), occupied, sides, negatives))]
+
+    patches = []
+    for name, index, (left, top, right, bottom) in regions:
+        patchFile = os.path.join(name, '{:06d}_{}.png'.format(row, index))
+        image.copy(QRect(left, top, right - left, bottom - top)).scaled(size, size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation).save(os.path.join(directory, patchFile))
+        patches.append((patchFile, imageFile, name, left, top, right, bottom))
+    return patches
+
+def patchTasks(labeledImages, labelTypes, directory, size, margin, negatives, seed):
+    for row, labeledImage in enumerate(labeledImages):
+        positives = []
+        for cls in labelTypes:
+            for index, label in enumerate(labeledImage.labels.get(cls, [])):
+                positives.append((jsonName(cls), index, labelRegion(label, margin)))
+        if not positives and not negatives:
+            continue
+        # Negatives avoid every labeled area, not only the ones of the exported types.
+        occupied = [labelRegion(label, margin) for labels in labeledImage.labels.values() for label in labels]
+        yield (row, labeledImage.imageFile, positives, occupied, negatives, size, directory, seed)
+
+def exportPatches(labeledImages, directory, labelTypes, size=32, margin=0.0, negatives=0, seed=0, workers=None, progress=None):
+    for name in [jsonName(cls) for cls in labelTypes] + (['negative'] if negatives else []):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    numberOfPatches = 0
+    with open(os.path.join(directory, 'patches.csv'), 'w', newline='') as f, concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        writer = csv.writer(f)
+        writer.writerow(['patch', 'image', 'type', 'left', 'top', 'right', 'bottom'])
+        # Only a few images per process are in flight, so neither the queue nor the results grow with the database.
+        # Results are collected in submission order, which keeps the index deterministic.
+        maximumPending = 2 * (workers or os.cpu_count() or 1)
+        pending = collections.deque()
+        processed = 0
+        for task in itertools.chain(patchTasks(labeledImages, labelTypes, directory, size, margin, negatives, seed), [None]):
+            if task is not None:
+                pending.append(executor.submit(extractPatches, task))
+            while pending and (task is None or len(pending) >= maximumPending):
+                patches = pending.popleft().result()
+                writer.writerows(patches)
+                numberOfPatches += len(patches)
+                processed += 1
+                if progress:
+                    progress(processed)
+    return numberOfPatches
@@ -0,0 +1,215 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from labeling_tool import journal
+from labeling_tool.imagedatabase import LabeledImage, LazyLabeledImage
+
+
+# A sharded database is a manifest file with the order of the images and the shard each of them is in. The labels are in
+# the shard files in a directory next to it. Shard files are never changed, a save writes new ones and then the manifest.
+
+def shardDirectory(fileName):
+    return fileName + '.d'
+
+def readManifest(fileName):
+    with open(fileName, 'rb') as f:
+        return pickle.load(f)
+
+def writeManifest(fileName, manifest):
+    tempFileName = fileName + '.tmp'
+    with open(tempFileName, 'wb') as f:
+        pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tempFileName, fileName)
+
+def readShard(fileName, name):
+    with open(os.path.join(shardDirectory(fileName), name), 'rb') as f:
+        return pickle.load(f)
+
+def writeShard(fileName, name, labeledImages):
+    with open(os.path.join(shardDirectory(fileName), name), 'wb') as f:
+        pickle.dump([(labeledImage.imageFile, labeledImage.labels) for labeledImage in labeledImages], f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+def nextFreeShard(fileName):
+    names = os.listdir(shardDirectory(fileName)) if os.path.isdir(shardDirectory(fileName)) else []
+    return max((int(name.split('.')[0]) for name in names if name.endswith('.shard')), default=-1) + 1
+
+def iterReadDatabase(fileName):
+    # Reads the images one shard at a time.
+    for name, _ in readManifest(fileName)['shards']:
+        for imageFile, labels in readShard(fileName, name):
+            labeledImage = LabeledImage(imageFile)
+            labeledImage.labels = labels
+            yield labeledImage
+
+class ShardedStorage:
+    def __init__(self, shardSize=1024, maximumLoadedShards=64, isPinned=lambda labeledImage: False):
+        self.__shardSize = shardSize
+        self.__maximumLoadedShards = maximumLoadedShards
+        # Pinned images keep their labels when their shard is evicted, because something else refers to the label objects.
+        self.__isPinned = isPinned
+        self.__lock = threading.RLock()
+        self.__fileName = None
+        self.__nextShard = 0
+        self.__shardFiles = {}
+        self.__shardImages = {}
+        self.__shardOf = {}
+        self.__loaded = OrderedDict()
+        self.__dirty = set()
+
+    def read(self, fileName):
+        manifest = readManifest(fileName)
+        labeledImages = []
+        with self.__lock:
+            self.__reset(fileName, manifest['nextShard'])
+            for name, imageFiles in manifest['shards']:
+                shardImages = [LazyLabeledImage(imageFile, self.loadLabels) for imageFile in imageFiles]
+                self.__addShard(name, shardImages)
+                labeledImages += shardImages
+        return labeledImages
+
+    def write(self, fileName, labeledImages):
+        with self.__lock:
+            if fileName != self.__fileName:
+                os.makedirs(shardDirectory(fileName), exist_ok=True)
+                # Shard files that are still there from an earlier database are not overwritten before the manifest is.
+                self.__reset(fileName, nextFreeShard(fileName))
+            self.__save(self.__writeShards(labeledImages))
+
+    def update(self, fileName, records, labeledImages):
+        # Runs of images that are still exactly the images of a clean shard keep that shard. Everything else, the images of
+        # shards that changed and new images, is written to new shards.
+        with self.__lock:
+            for record in records:
+                self.touch(journal.decodeOperation(record))
+            shards = []
+            pending = []
+            start = 0
+            while start < len(labeledImages):
+                name = self.__shardOf.get(labeledImages[start].imageFile)
+                end = start + 1
+                while end < len(labeledImages) and self.__shardOf.get(labeledImages[end].imageFile) == name:
+                    end += 1
+                run = labeledImages[start:end]
+                if name is not None and name not in self.__dirty and [labeledImage.imageFile for labeledImage in run] == self.__shardFiles[name]:
+                    shards += self.__writeShards(pending)
+                    pending = []
+                    shards.append((name, self.__shardFiles[name]))
+                else:
+                    pending += run
+                start = end
+            shards += self.__writeShards(pending)
+            self.__save(shards)
+
+    def compact(self, fileName, labeledImages):
+        # Rewrites every shard, which evens out shards that have become small over many saves.
+        self.write(fileName, labeledImages)
+
+    def close(self):
+        pass
+
+    def touch(self, operation):
+        # Shards with changes that have not been saved must not be evicted.
+        with self.__lock:
+            for imageFile in journal.operationImageFiles(operation):
+                name = self.__shardOf.get(imageFile)
+                if name is not None:
+                    self.__dirty.add(name)
+
+    def markUsed(self, labeledImage):
+        # Labels that are already loaded are accessed without the storage knowing, so the images that are shown are marked.
+        with self.__lock:
+            name = self.__shardOf.get(labeledImage.imageFile)
+            if name in self.__loaded:
+                self.__loaded.move_to_end(name)
+
+    def loadLabels(self, imageFile):
+        # All images of the shard get their labels at once. Labels may also be loaded by worker threads, e.g. while exporting.
+        with self.__lock:
+            name = self.__shardOf[imageFile]
+            labels = dict(readShard(self.__fileName, name))
+            for labeledImage in self.__shardImages[name]:
+                if 'labels' not in vars(labeledImage) and labeledImage.imageFile in labels:
+                    labeledImage.labels = labels[labeledImage.imageFile]
+            self.__loaded[name] = None
+            self.__loaded.move_to_end(name)
+            self.__evict()
+            return labels[imageFile]
+
+    def __reset(self, fileName, nextShard):
+        self.__fileName = fileName
+        self.__nextShard = nextShard
+        self.__shardFiles = {}
+        self.__shardImages = {}
+        self.__shardOf = {}
+        self.__loaded = OrderedDict()
+        self.__dirty = set()
+
+    def __save(self, shards):
+        # The manifest is replaced in one step, so a crash leaves either the old or the new database.
+        writeManifest(self.__fileName, {'nextShard': self.__nextShard, 'shards': shards})
+        kept = {name for name, _ in shards}
+        for name in [name for name in self.__shardFiles if name not in kept]:
+            self.__removeShard(name)
+        for name in set(os.listdir(shardDirectory(self.__fileName))) - kept:
+            os.remove(os.path.join(shardDirectory(self.__fileName), name))
+        self.__dirty = set()
+
+    def __addShard(self, name, labeledImages):
+        self.__shardFiles[name] = [labeledImage.imageFile for labeledImage in labeledImages]
+        # Only lazily loaded images can give their labels back and load them again. Those that came from another storage
+        # load them from the shard from now on.
+        self.__shardImages[name] = [labeledImage for labeledImage in labeledImages if isinstance(labeledImage, LazyLabeledImage)]
+        for labeledImage in self.__shardImages[name]:
+            labeledImage.setLoadLabels(self.loadLabels)
+        for imageFile in self.__shardFiles[name]:
+            self.__shardOf[imageFile] = name
+
+    def __removeShard(self, name):
+        for imageFile in self.__shardFiles.pop(name):
+            if self.__shardOf.get(imageFile) == name:
+                del self.__shardOf[imageFile]
+        del self.__shardImages[name]
+        self.__loaded.pop(name, None)
+
+    def __writeShards(self, labeledImages):
+        # A shard is full at shardSize images. It also ends where the images of another directory begin, unless it would
+        # be too small then. The images may come from a generator, e.g. when merging.
+        shards = []
+        shardImages = []
+        for labeledImage in labeledImages:
+            if len(shardImages) >= self.__shardSize or \
+               (len(shardImages) >= self.__shardSize // 4 and os.path.dirname(labeledImage.imageFile) != os.path.dirname(shardImages[0].imageFile)):
+                shards.append(self.__writeShard(shardImages))
+                shardImages = []
+            shardImages.append(labeledImage)
+        if shardImages:
+            shards.append(self.__writeShard(shardImages))
+        return shards
+
+    def __writeShard(self, labeledImages):
+        name = '{:08d}.shard'.format(self.__nextShard)
+        self.__nextShard += 1
+        writeShard(self.__fileName, name, labeledImages)
+        self.__addShard(name, labeledImages)
+        # The labels of the images that were written are in memory, so the shard counts as loaded.
+        self.__loaded[name] = None
+        self.__evict()
+        return name, self.__shardFiles[name]
+
+    def __evict(self):
+        # The shards that were used the longest time ago give their labels back first. The last one is the one that is
+        # being loaded and shards with unsaved changes stay.
+        while len(self.__loaded) > self.__maximumLoadedShards:
+            name = next((name for name in list(self.__loaded)[:-1] if name not in self.__dirty), None)
+            if name is None:
+                return
+            del self.__loaded[name]
+            for labeledImage in self.__shardImages[name]:
+                if 'labels' in vars(labeledImage) and not self.__isPinned(labeledImage):
+                    del labeledImage.labels
@@ -0,0 +1,49 @@
+import math
+
+
+class SpatialIndex:
+    def __init__(self, cellSize=64):
+        self.__cellSize = cellSize
+        self.__cells = {}
+        self.__labelCells = {}
+
+    def clear(self):
+        self.__cells = {}
+        self.__labelCells = {}
+
+    def insert(self, label):
+        keys = self.__keys(*label.boundingBox())
+        for key in keys:
+            self.__cells.setdefault(key, set()).add(label)
+        self.__labelCells[label] = keys
+
+    def remove(self, label):
+        for key in self.__labelCells.pop(label, ()):
+            cell = self.__cells[key]
+            cell.discard(label)
+            if not cell:
+                del self.__cells[key]
+
+    def update(self, label):
+        self.remove(label)
+        self.insert(label)
+
+    def labelAt(self, x, y, tolerance, accept=lambda label: True):
+        candidates = set()
+        for key in self.__keys(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+            candidates.update(self.__cells.get(key, ()))
+
+        nearestLabel = None
+        nearestDistance = tolerance
+        for label in candidates:
+            if not accept(label):
+                continue
+            distance = label.distanceTo(x, y)
+            if distance <= nearestDistance:
+                nearestLabel = label
+                nearestDistance = distance
+        return nearestLabel
+
+    def __keys(self, left, top, right, bottom):
+        return [(cx, cy) for cx in range(math.floor(left / self.__cellSize), math.floor(right / self.__cellSize) + 1)
+                         for cy in range(math.floor(top / self.__cellSize), math.floor(bottom / self.__cellSize) + 1)]
@@ -0,0 +1,187 @@
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+
+from labeling_tool.imagedatabase import LabelBase, LabeledImage, LazyLabeledImage
+import labeling_tool.labels
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    imageFile TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS labels (
+    image INTEGER NOT NULL REFERENCES images(id),
+    type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    label BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS labelsByImageAndType ON labels (image, type, position);
+CREATE TABLE IF NOT EXISTS labelTypes (
+    image INTEGER NOT NULL REFERENCES images(id),
+    type TEXT NOT NULL,
+    UNIQUE (image, type)
+);
+'''
+
+def openDatabase(fileName, **kwargs):
+    connection = sqlite3.connect(fileName, **kwargs)
+    tables = { name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'") }
+    connection.executescript(SCHEMA)
+    if 'images' in tables and 'labelTypes' not in tables:
+        # Databases from before the label types were stored on their own get them from their labels.
+        with connection:
+            connection.execute('INSERT INTO labelTypes (image, type) SELECT image, type FROM labels GROUP BY image, type ORDER BY image, MIN(rowid)')
+    return connection
+
+def decodeLabels(rows, labelTypes):
+    # The types of an image are stored on their own and keep the order in which they were added, so a type whose labels
+    # have all been removed is kept, too. Labels that were inserted in between, e.g. by undoing a removal, come later in
+    # the table, so they are sorted by their position.
+    labels = {}
+    positions = {}
+    for typeName, position, data in rows:
+        entries = positions.setdefault(labelTypes[typeName], [])
+        if data is not None:
+            entries.append((position, data))
+    for cls, entries in positions.items():
+        entries.sort(key=lambda entry: entry[0])
+        labels[cls] = [pickle.loads(data) for _, data in entries]
+    return labels
+
+def iterReadDatabase(fileName):
+    # Reads all images with their labels in a single pass, holding only one image in memory at a time.
+    labelTypes = { cls.__name__: cls for cls in LabelBase.__subclasses__() }
+    connection = openDatabase(fileName)
+    try:
+        rows = connection.execute('SELECT images.id, images.imageFile, labelTypes.type, labels.position, labels.label FROM images LEFT JOIN labelTypes ON labelTypes.image = images.id LEFT JOIN labels ON labels.image = images.id AND labels.type = labelTypes.type ORDER BY images.id, labelTypes.rowid, labels.rowid')
+        for _, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            labeledImage = LabeledImage(group[0][1])
+            labeledImage.labels = decodeLabels((row[2:] for row in group if row[2] is not None), labelTypes)
+            yield labeledImage
+    finally:
+        connection.close()
+
+class SqliteStorage:
+    def __init__(self):
+        self.__connection = None
+        self.__lock = threading.Lock()
+        self.__labelTypes = { cls.__name__: cls for cls in LabelBase.__subclasses__() }
+
+    def read(self, fileName):
+        self.__open(fileName)
+        return [LazyLabeledImage(imageFile, self.loadLabels) for imageFile, in self.__connection.execute('SELECT imageFile FROM images ORDER BY id')]
+
+    def write(self, fileName, labeledImages):
+        self.close()
+        tempFileName = fileName + '.tmp'
+        if os.path.exists(tempFileName):
+            os.remove(tempFileName)
+        self.__open(tempFileName)
+        with self.__connection:
+            for labeledImage in labeledImages:
+                self.__insertImage(labeledImage)
+        self.close()
+        os.replace(tempFileName, fileName)
+        self.__open(fileName)
+
+    def update(self, fileName, records, labeledImages):
+        with self.__connection:
+            for record in records:
+                self.__apply(pickle.loads(record))
+
+    def compact(self, fileName, labeledImages):
+        self.__connection.execute('VACUUM')
+
+    def close(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def touch(self, operation):
+        pass
+
+    def markUsed(self, labeledImage):
+        pass
+
+    def loadLabels(self, imageFile):
+        # Labels may also be loaded by worker threads, e.g. while exporting.
+        with self.__lock:
+            rows = self.__connection.execute('SELECT labelTypes.type, labels.position, labels.label FROM images JOIN labelTypes ON labelTypes.image = images.id LEFT JOIN labels ON labels.image = images.id AND labels.type = labelTypes.type WHERE images.imageFile = ? ORDER BY labelTypes.rowid, labels.rowid', (imageFile,)).fetchall()
+        return decodeLabels(rows, self.__labelTypes)
+
+    def __open(self, fileName):
+        self.__connection = openDatabase(fileName, check_same_thread=False)
+
+    def __imageId(self, imageFile):
+        return self.__connection.execute('SELECT id FROM images WHERE imageFile = ?', (imageFile,)).fetchone()[0]
+
+    def __insertImage(self, labeledImage, imageId=None):
+        imageId = self.__connection.execute('INSERT INTO images (id, imageFile) VALUES (?, ?)', (imageId, labeledImage.imageFile)).lastrowid
+        self.__connection.executemany('INSERT INTO labelTypes (image, type) VALUES (?, ?)', ((imageId, cls.__name__) for cls in labeledImage.labels))
+        self.__connection.executemany('INSERT INTO labels (image, type, position, label) VALUES (?, ?, ?, ?)',
+            ((imageId, cls.__name__, position, pickle.dumps(label, pickle.HIGHEST_PROTOCOL)) for cls, labels in labeledImage.labels.items() for position, label in enumerate(labels)))
+
+    def __addLabelType(self, imageFile, label):
+        imageId = self.__imageId(imageFile)
+        self.__connection.execute('INSERT OR IGNORE INTO labelTypes (image, type) VALUES (?, ?)', (imageId, type(label).__name__))
+        return imageId
+
+    def __removeImage(self, imageFile):
+        imageId = self.__imageId(imageFile)
+        self.__connection.execute('DELETE FROM labels WHERE image = ?', (imageId,))
+        self.__connection.execute('DELETE FROM labelTypes WHERE image = ?', (imageId,))
+        self.__connection.execute('DELETE FROM images WHERE id = ?', (imageId,))
+
+    def __shiftImageIds(self, firstId, count):
+        # Going through negative ids keeps the ids unique while they are updated.
+        for table, column in (('images', 'id'), ('labels', 'image'), ('labelTypes', 'image')):
+            self.__connection.execute('UPDATE {0} SET {1} = -({1} + ?) WHERE {1} >= ?'.format(table, column), (count, firstId))
+            self.__connection.execute('UPDATE {0} SET {1} = -{1} WHERE {1} < 0'.format(table, column))
+
+    def __apply(self, operation):
+        name = operation[0]
+        if name == 'addImage':
+            self.__insertImage(operation[1])
+        elif name == 'addImages':
+            for labeledImage in operation[1]:
+                self.__insertImage(labeledImage)
+        elif name == 'insertImages':
+            _, row, labeledImages = operation
+            # The order of the images is the order of their ids, so the inserted images need ids between their neighbours.
+            # If there are not enough unused ids, the following images are moved up.
+            previousId = self.__connection.execute('SELECT id FROM images ORDER BY id LIMIT 1 OFFSET ?', (row - 1,)).fetchone()[0] if row > 0 else 0
+            nextId = self.__connection.execute('SELECT id FROM images WHERE id > ? ORDER BY id LIMIT 1', (previousId,)).fetchone()[0]
+            if nextId - previousId - 1 < len(labeledImages):
+                self.__shiftImageIds(nextId, len(labeledImages))
+            for offset, labeledImage in enumerate(labeledImages, 1):
+                self.__insertImage(labeledImage, previousId + offset)
+        elif name == 'removeImage':
+            self.__removeImage(operation[1])
+        elif name == 'removeImages':
+            for imageFile in operation[1]:
+                self.__removeImage(imageFile)
+        elif name == 'addLabel':
+            _, imageFile, label = operation
+            imageId = self.__addLabelType(imageFile, label)
+            position, = self.__connection.execute('SELECT COUNT(*) FROM labels WHERE image = ? AND type = ?', (imageId, type(label).__name__)).fetchone()
+            self.__connection.execute('INSERT INTO labels (image, type, position, label) VALUES (?, ?, ?, ?)', (imageId, type(label).__name__, position, pickle.dumps(label, pickle.HIGHEST_PROTOCOL)))
+        elif name == 'insertLabel':
+            _, imageFile, index, label = operation
+            imageId = self.__addLabelType(imageFile, label)
+            self.__connection.execute('UPDATE labels SET position = position + 1 WHERE image = ? AND type = ? AND position >= ?', (imageId, type(label).__name__, index))
+            self.__connection.execute('INSERT INTO labels (image, type, position, label) VALUES (?, ?, ?, ?)', (imageId, type(label).__name__, index, pickle.dumps(label, pickle.HIGHEST_PROTOCOL)))
+        elif name == 'changeLabel':
+            _, imageFile, index, label = operation
+            self.__connection.execute('UPDATE labels SET label = ? WHERE image = ? AND type = ? AND position = ?', (pickle.dumps(label, pickle.HIGHEST_PROTOCOL), self.__imageId(imageFile), type(label).__name__, index))
+        elif name == 'removeLabel':
+            _, imageFile, labelType, index = operation
+            imageId = self.__imageId(imageFile)
+            self.__connection.execute('DELETE FROM labels WHERE image = ? AND type = ? AND position = ?', (imageId, labelType.__name__, index))
+            self.__connection.execute('UPDATE labels SET position = position - 1 WHERE image = ? AND type = ? AND position > ?', (imageId, labelType.__name__, index))
+        else:
+            raise ValueError('Unknown journal operation ' + repr(name))
@@ -0,0 +1,37 @@
+from PyQt5.QtCore import pyqtSignal, Qt
+from PyQt5.QtGui import QFontDatabase
+from PyQt5.QtWidgets import QDialog, QLabel, QListWidget, QListWidgetItem, QPlainTextEdit, QVBoxLayout
+
+from labeling_tool.imagedatabase import LabeledImage, LabelBase
+from labeling_tool.labelstatistics import LabelStatistics
+
+
+class StatisticsDialog(QDialog):
+    labelActivated = pyqtSignal(LabeledImage, LabelBase)
+
+    def __init__(self, labeledImages, parent=None):
+        super().__init__(parent)
+
+        self.setWindowTitle('Statistics')
+
+        statistics = LabelStatistics(labeledImages)
+
+        summary = QPlainTextEdit(self)
+        summary.setReadOnly(True)
+        summary.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        summary.setPlainText('\n'.join(statistics.summary()))
+
+        outliers = statistics.outliers()
+        outlierList = QListWidget(self)
+        outlierList.setAlternatingRowColors(True)
+        for labeledImage, label, reason in outliers:
+            item = QListWidgetItem(label.icon(), labeledImage.imageFile + ': ' + reason, outlierList)
+            item.setData(Qt.UserRole, (labeledImage, label))
+        outlierList.itemActivated.connect(lambda item: self.labelActivated.emit(*item.data(Qt.UserRole)))
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(summary)
+        layout.addWidget(QLabel('Suspicious labels ({}):'.format(len(outliers)), self))
+        layout.addWidget(outlierList)
+
+        self.resize(640, 640)
@@ -0,0 +1,99 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+from PyQt5.QtCore import pyqtSignal, QObject, QRunnable, QSize, Qt, QThreadPool
+from PyQt5.QtGui import QImage, QImageReader, QPixmap
+
+from labeling_tool.imagecache import DecoderSignals
+from labeling_tool.imagedatabase import canonicalPath
+from labeling_tool.imagehashes import cacheDirectory
+
+
+class ThumbnailLoader(QRunnable):
+    def __init__(self, imageFile, size, directory):
+        super().__init__()
+
+        self.setAutoDelete(False)
+        self.__imageFile = imageFile
+        self.__size = size
+        self.__directory = directory
+        self.signals = DecoderSignals()
+
+    def run(self):
+        try:
+            stat = os.stat(self.__imageFile)
+        except OSError:
+            self.signals.deliver(self.__imageFile, QImage())
+            return
+
+        # Size and mtime are part of the key, so a changed image never gets the thumbnail of its old content.
+        key = hashlib.sha1('{}\0{}\0{}'.format(canonicalPath(self.__imageFile), stat.st_size, stat.st_mtime_ns).encode()).hexdigest()
+        cacheFile = os.path.join(self.__directory, key[:2], key + '.png')
+        thumbnail = QImage(cacheFile) if os.path.exists(cacheFile) else QImage()
+        if thumbnail.isNull():
+            reader = QImageReader(self.__imageFile)
+            if reader.size().isValid():
+                reader.setScaledSize(reader.size().scaled(self.__size, Qt.KeepAspectRatio))
+            thumbnail = reader.read()
+            if not thumbnail.isNull():
+                os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+                tempFile = cacheFile + '.' + str(os.getpid()) + '.tmp'
+                if thumbnail.save(tempFile, 'PNG'):
+                    os.replace(tempFile, cacheFile)
+        self.signals.deliver(self.__imageFile, thumbnail)
+
+class ThumbnailCache(QObject):
+    thumbnailLoaded = pyqtSignal(str)
+
+    def __init__(self, size=QSize(96, 72), maximumCount=2048, maximumPending=256, directory=None, parent=None):
+        super().__init__(parent)
+
+        self.__size = size
+        self.__maximumCount = maximumCount
+        self.__maximumPending = maximumPending
+        self.__directory = directory or os.path.join(cacheDirectory(), 'thumbnails', '{}x{}'.format(size.width(), size.height()))
+        self.__thumbnails = OrderedDict()
+        self.__pending = OrderedDict()
+        self.__priority = 0
+        self.__threadPool = QThreadPool(self)
+        self.__placeholder = QPixmap(size)
+        self.__placeholder.fill(Qt.transparent)
+
+    def size(self):
+        return self.__size
+
+    def thumbnail(self, imageFile):
+        pixmap = self.__thumbnails.get(imageFile)
+        if pixmap is not None:
+            self.__thumbnails.move_to_end(imageFile)
+            return pixmap
+        self.__load(imageFile)
+        return self.__placeholder
+
+    def __load(self, imageFile):
+        # Views only ask for the rows they paint, so the latest requests are the visible ones.
+        # They get the highest priority and the oldest requests that have not started are dropped.
+        self.__priority += 1
+        loader = self.__pending.get(imageFile)
+        if loader is not None:
+            if not self.__threadPool.tryTake(loader):
+                return
+            del self.__pending[imageFile]
+        loader = ThumbnailLoader(imageFile, self.__size, self.__directory)
+        loader.signals.decoded.connect(self.__insert)
+        self.__pending[imageFile] = loader
+        self.__threadPool.start(loader, self.__priority)
+        for pendingFile, pending in list(self.__pending.items()):
+            if len(self.__pending) <= self.__maximumPending:
+                break
+            if self.__threadPool.tryTake(pending):
+                del self.__pending[pendingFile]
+
+    def __insert(self, imageFile, image):
+        self.__pending.pop(imageFile, None)
+        # Images that cannot be read keep the placeholder instead of being requested again on every paint.
+        self.__thumbnails[imageFile] = QPixmap.fromImage(image) if not image.isNull() else self.__placeholder
+        while len(self.__thumbnails) > self.__maximumCount:
+            self.__thumbnails.popitem(last=False)
+        self.thumbnailLoaded.emit(imageFile)
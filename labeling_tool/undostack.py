@@ -0,0 +1,118 @@
+from PyQt5.QtCore import pyqtSignal, QObject
+
+
+stepNames = {
+    'insertImages': 'Add Images',
+    'removeImages': 'Remove Images',
+    'insertLabel': 'Add Label',
+    'changeLabel': 'Change Label',
+    'removeLabel': 'Remove Label'
+}
+
+def inverseStep(step):
+    # Steps only reference the images and labels they touch. A change only keeps the old and new values of the attributes that differ.
+    name = step[0]
+    if name == 'insertImages':
+        return ('removeImages',) + step[1:]
+    elif name == 'removeImages':
+        return ('insertImages',) + step[1:]
+    elif name == 'insertLabel':
+        return ('removeLabel',) + step[1:]
+    elif name == 'removeLabel':
+        return ('insertLabel',) + step[1:]
+    elif name == 'changeLabel':
+        _, labeledImage, label, changes = step
+        return ('changeLabel', labeledImage, label, tuple((field, new, old) for field, old, new in changes))
+    raise ValueError('Unknown undo step ' + repr(name))
+
+class UndoStack(QObject):
+    changed = pyqtSignal()
+
+    def __init__(self, limit=10000, parent=None):
+        super().__init__(parent)
+
+        self.__limit = limit
+        # An entry is either a single step or a macro ('macro', text, steps) of steps that are undone together.
+        self.__entries = []
+        self.__index = 0
+        self.__macro = None
+        self.__macroDepth = 0
+
+    def clear(self):
+        self.__entries = []
+        self.__index = 0
+        self.__macro = None
+        self.__macroDepth = 0
+        self.changed.emit()
+
+    def push(self, step):
+        if self.__macroDepth > 0:
+            self.__macro[2].append(step)
+            return
+        self.__append(step)
+
+    def beginMacro(self, text):
+        if self.__macroDepth == 0:
+            self.__macro = ('macro', text, [])
+        self.__macroDepth += 1
+
+    def endMacro(self):
+        self.__macroDepth -= 1
+        if self.__macroDepth == 0:
+            macro, self.__macro = self.__macro, None
+            if len(macro[2]) == 1:
+                self.__append(macro[2][0])
+            elif macro[2]:
+                self.__append(macro)
+
+    def canUndo(self):
+        return self.__index > 0
+
+    def canRedo(self):
+        return self.__index < len(self.__entries)
+
+    def undoText(self):
+        return self.__text(self.__entries[self.__index - 1]) if self.canUndo() else ''
+
+    def redoText(self):
+        return self.__text(self.__entries[self.__index]) if self.canRedo() else ''
+
+    def takeUndo(self):
+        self.__index -= 1
+        self.changed.emit()
+        return self.__steps(self.__entries[self.__index])
+
+    def takeRedo(self):
+        self.__index += 1
+        self.changed.emit()
+        return self.__steps(self.__entries[self.__index - 1])
+
+    def images(self):
+        # The images that the steps refer to, together with their labels.
+        images = set()
+        entries = self.__entries + ([self.__macro] if self.__macro is not None else [])
+        for entry in entries:
+            for step in self.__steps(entry):
+                if step[0] in ('insertImages', 'removeImages'):
+                    images.update(step[2])
+                else:
+                    images.add(step[1])
+        return images
+
+    def __append(self, entry):
+        del self.__entries[self.__index:]
+        self.__entries.append(entry)
+        if len(self.__entries) > self.__limit:
+            del self.__entries[0]
+        self.__index = len(self.__entries)
+        self.changed.emit()
+
+    def __steps(self, entry):
+        return entry[2] if entry[0] == 'macro' else [entry]
+
+    def __text(self, entry):
+        if entry[0] == 'macro':
+            return entry[1]
+        if entry[0] in ('insertImages', 'removeImages') and len(entry[2]) == 1:
+            return stepNames[entry[0]][:-1]
+        return stepNames[entry[0]]
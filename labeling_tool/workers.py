@@ -0,0 +1,100 @@
+import fnmatch
+import os
+
+from PyQt5.QtCore import pyqtSignal, QThread
+from PyQt5.QtGui import QImageReader
+
+from labeling_tool.imagedatabase import iterEncodeImageDatabase
+from labeling_tool.imagehashes import HashCache, hashImages
+from labeling_tool.interpolation import trackingProposals
+
+
+def imageFilePatterns():
+    return ['*.' + bytes(imageFormat).decode() for imageFormat in QImageReader.supportedImageFormats()]
+
+class DirectoryScanner(QThread):
+    imagesFound = pyqtSignal(list)
+
+    def __init__(self, directory, patterns, parent=None):
+        super().__init__(parent)
+
+        self.__directory = directory
+        self.__patterns = [pattern.lower() for pattern in patterns]
+
+    def run(self):
+        imageFiles = []
+        for root, directories, files in os.walk(self.__directory):
+            if self.isInterruptionRequested():
+                return
+            directories.sort()
+            for f in sorted(files):
+                if any(fnmatch.fnmatchcase(f.lower(), pattern) for pattern in self.__patterns):
+                    imageFiles.append(os.path.join(root, f))
+        self.imagesFound.emit(imageFiles)
+
+class JsonExporter(QThread):
+    progressChanged = pyqtSignal(int)
+    exportFailed = pyqtSignal(str)
+
+    def __init__(self, labeledImages, fileName, parent=None):
+        super().__init__(parent)
+
+        self.__labeledImages = labeledImages
+        self.__fileName = fileName
+
+    def run(self):
+        tempFileName = self.__fileName + '.tmp'
+        # An exception leaving run() would abort the whole application and take the unsaved labels with it.
+        try:
+            with open(tempFileName, 'w') as f:
+                # The first chunk only opens the document, so the number of chunks written before is the number of exported images.
+                for exported, chunk in enumerate(iterEncodeImageDatabase(self.__labeledImages)):
+                    if self.isInterruptionRequested():
+                        break
+                    f.write(chunk)
+                    if exported % 256 == 0:
+                        self.progressChanged.emit(min(exported, len(self.__labeledImages)))
+            if self.isInterruptionRequested():
+                os.remove(tempFileName)
+                return
+            os.replace(tempFileName, self.__fileName)
+        except OSError as error:
+            if os.path.exists(tempFileName):
+                os.remove(tempFileName)
+            self.exportFailed.emit(str(error))
+
+class ImageHasher(QThread):
+    progressChanged = pyqtSignal(int)
+    hashesComputed = pyqtSignal(dict)
+
+    def __init__(self, imageFiles, perceptual, parent=None):
+        super().__init__(parent)
+
+        self.__imageFiles = imageFiles
+        self.__perceptual = perceptual
+
+    def run(self):
+        # SQLite connections must stay in the thread that opened them.
+        cache = HashCache()
+        try:
+            hashes = hashImages(self.__imageFiles, cache, self.__perceptual, progress=self.progressChanged.emit, interrupted=self.isInterruptionRequested)
+        finally:
+            cache.close()
+        if not self.isInterruptionRequested():
+            self.hashesComputed.emit(hashes)
+
+class LabelTracker(QThread):
+    progressChanged = pyqtSignal(int)
+    proposalsComputed = pyqtSignal(list)
+
+    def __init__(self, labeledImages, first, last, parent=None):
+        super().__init__(parent)
+
+        self.__labeledImages = labeledImages
+        self.__first = first
+        self.__last = last
+
+    def run(self):
+        proposals = trackingProposals(self.__labeledImages, self.__first, self.__last, progress=self.progressChanged.emit, interrupted=self.isInterruptionRequested)
+        if proposals is not None and not self.isInterruptionRequested():
+            self.proposalsComputed.emit(proposals)
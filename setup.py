@@ -6,10 +6,8 @@ def version():
         return version_file.readline()
 
 def dependencies():
-    deps = []
     with open("dependencies.txt") as deps_file:
-        deps.append(deps_file.readline())
-    return deps
+        return [line.strip() for line in deps_file if line.strip()]
 
 setup(
     name="LabelingTool",
@@ -18,7 +16,7 @@ setup(
     url="https://github.com/ahasselbring/LabelingTool",
     author="Arne Hasselbring",
     packages=['labeling_tool'],
-    scripts=['bin/LabelingTool'],
+    scripts=['bin/LabelingTool', 'bin/labeling_tool'],
     install_requires=dependencies(),
     include_package_data=True,
     cmdclass={
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+from labeling_tool.autosave import lockRecoveryFile, removeStaleLocks
+
+
+def test_stale_locks_are_removed(tmp_path):
+    crashed = str(tmp_path / 'crashed.autosave')
+    running = str(tmp_path / 'running.autosave')
+    # The process exits without unlocking, like an instance that crashed before it autosaved.
+    script = 'import os, sys; from PyQt5.QtCore import QLockFile; lock = QLockFile(sys.argv[1] + ".lock"); lock.tryLock(0); os._exit(0)'
+    subprocess.run([sys.executable, '-c', script, crashed], check=True)
+    assert os.path.exists(crashed + '.lock')
+    lock = lockRecoveryFile(running)
+    assert lock.tryLock(0)
+    removeStaleLocks(str(tmp_path))
+    assert not os.path.exists(crashed + '.lock')
+    assert os.path.exists(running + '.lock')
+    lock.unlock()
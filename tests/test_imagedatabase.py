@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+from labeling_tool.imagedatabase import ImageDatabase
+from labeling_tool.labels import BallLabel
+
+
+def test_labels_unpack_without_importing_the_label_module(tmp_path):
+    fileName = str(tmp_path / 'database')
+    database = ImageDatabase()
+    database.createNew()
+    database.addImages(['/a.png'])
+    database.addLabel(database.labeledImages[0], BallLabel((1, 2), 3))
+    database.writeToFile(fileName)
+    # The labels module is already imported here, so the database is opened in a new interpreter.
+    script = '''
+import sys
+from labeling_tool.imagedatabase import ImageDatabase
+database = ImageDatabase()
+database.readFromFile(sys.argv[1])
+assert 'labeling_tool.labels' not in sys.modules
+print([(cls.__name__, label.center, label.radius) for cls, labels in database.labeledImages[0].labels.items() for label in labels])
+'''
+    output = subprocess.run([sys.executable, '-c', script, fileName], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.PIPE, check=True).stdout
+    assert output.decode().strip() == "[('BallLabel', (1, 2), 3)]"
@@ -0,0 +1,19 @@
+from labeling_tool.imagedatabase import ImageDatabase
+from labeling_tool.imagequery import ImageIndex, parseQuery
+from labeling_tool.labels import BallLabel, RobotLabel
+
+
+def test_matching_rows():
+    database = ImageDatabase()
+    database.createNew()
+    index = ImageIndex(database)
+    database.addImages(['/game_{}/{:03d}.png'.format(i % 2, i) for i in range(20)])
+    for row in range(0, 20, 3):
+        database.addLabel(database.labeledImages[row], BallLabel((1, 1), 1))
+    for row in range(0, 20, 4):
+        database.addLabel(database.labeledImages[row], RobotLabel((0, 0), (1, 1)))
+    database.removeImage(database.labeledImages[5])
+    database.removeImage(database.labeledImages[9])
+    for query in ('balls', '-balls', 'balls robots', 'game_1/*', 'game_0/* -robots', 'unlabeled'):
+        terms = parseQuery(query)
+        assert index.matchingRows(terms) == [row for row, labeledImage in enumerate(database.labeledImages) if index.matches(terms, labeledImage)]
@@ -0,0 +1,52 @@
+import os
+
+from labeling_tool import journal
+from labeling_tool.imagedatabase import ImageDatabase
+from labeling_tool.labels import BallLabel
+
+
+def createDatabase(fileName):
+    database = ImageDatabase()
+    database.createNew()
+    database.addImages(['/a.png', '/b.png'])
+    database.writeToFile(fileName)
+    for x in range(5):
+        database.addLabel(database.labeledImages[0], BallLabel((x, x), 5))
+        database.writeToFile(fileName)
+    return database
+
+def ballCenters(database):
+    return [label.center for labeledImage in database.labeledImages for label in labeledImage.labels.get(BallLabel, [])]
+
+def test_save_after_torn_journal(tmp_path):
+    fileName = str(tmp_path / 'database')
+    createDatabase(fileName)
+    journalFileName = journal.journalFileName(fileName)
+    with open(journalFileName, 'r+b') as f:
+        f.truncate(os.path.getsize(journalFileName) - 40)
+    database = ImageDatabase()
+    database.readFromFile(fileName)
+    expected = ballCenters(database)
+    for x in range(3):
+        database.addLabel(database.labeledImages[1], BallLabel((10 + x, 10), 5))
+        database.writeToFile(fileName)
+        expected.append((10 + x, 10))
+    database = ImageDatabase()
+    database.readFromFile(fileName)
+    assert ballCenters(database) == expected
+
+def test_torn_journal_is_read_up_to_the_last_complete_record(tmp_path):
+    fileName = str(tmp_path / 'database')
+    createDatabase(fileName)
+    journalFileName = journal.journalFileName(fileName)
+    size = os.path.getsize(journalFileName)
+    for cut in (1, 4, 8, 40, size // 2):
+        with open(journalFileName, 'rb') as f:
+            data = f.read()
+        with open(journalFileName, 'wb') as f:
+            f.write(data[:size - cut])
+        database = ImageDatabase()
+        database.readFromFile(fileName)
+        assert ballCenters(database) == [(x, x) for x in range(len(ballCenters(database)))]
+        with open(journalFileName, 'wb') as f:
+            f.write(data)
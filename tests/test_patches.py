@@ -0,0 +1,26 @@
+import csv
+import os
+
+from PyQt5.QtGui import QColor, QImage
+
+from labeling_tool.imagedatabase import LabeledImage
+from labeling_tool.labels import RobotLabel
+from labeling_tool.patches import exportPatches, overlaps
+
+
+def test_negatives_do_not_overlap_positive_patches(tmp_path):
+    image = QImage(400, 100, QImage.Format_RGB32)
+    image.fill(QColor(0, 0, 0))
+    image.save(str(tmp_path / 'image.png'))
+    labeledImage = LabeledImage(str(tmp_path / 'image.png'))
+    # The patch around the narrow robot is much wider than the robot itself.
+    labeledImage.labels = {RobotLabel: [RobotLabel((95, 10), (105, 90))]}
+    exportPatches([labeledImage], str(tmp_path / 'patches'), [RobotLabel], negatives=20, workers=1)
+    with open(os.path.join(str(tmp_path / 'patches'), 'patches.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+    regions = { row['type']: [] for row in rows }
+    for row in rows:
+        regions[row['type']].append(tuple(int(row[name]) for name in ('left', 'top', 'right', 'bottom')))
+    assert regions['Robots'] == [(60, 10, 140, 90)]
+    assert regions['negative']
+    assert not any(overlaps(negative, regions['Robots'][0]) for negative in regions['negative'])
@@ -0,0 +1,46 @@
+import pytest
+
+from labeling_tool.imagedatabase import ImageDatabase, iterEncodeImageDatabase
+from labeling_tool.labels import BallLabel, RobotLabel
+
+
+def labelStates(database):
+    return [(labeledImage.imageFile, [(cls.__name__, [label.__getstate__() for label in labels]) for cls, labels in labeledImage.labels.items()]) for labeledImage in database.labeledImages]
+
+def createDatabase():
+    database = ImageDatabase()
+    database.createNew()
+    database.addImages(['/a.png', '/b.png', '/c.png'])
+    ball = BallLabel((1, 2), 3)
+    database.addLabel(database.labeledImages[0], ball)
+    database.addLabel(database.labeledImages[0], RobotLabel((0, 0), (4, 5)))
+    database.addLabel(database.labeledImages[1], BallLabel((6, 7), 8))
+    # The first image keeps a ball type without any balls.
+    database.removeLabel(database.labeledImages[0], ball)
+    return database
+
+@pytest.mark.parametrize('extension', ['.pickle', '.sqlite', '.shards'])
+def test_round_trip(tmp_path, extension):
+    fileName = str(tmp_path / ('database' + extension))
+    database = createDatabase()
+    expected = labelStates(database)
+    database.writeToFile(fileName)
+    # Saving again only applies the operations since the last save.
+    robot = RobotLabel((1, 1), (2, 2))
+    database.addLabel(database.labeledImages[2], robot)
+    database.removeLabel(database.labeledImages[2], robot)
+    database.writeToFile(fileName)
+    expected[2] = ('/c.png', [('RobotLabel', [])])
+    database = ImageDatabase()
+    database.readFromFile(fileName)
+    assert labelStates(database) == expected
+
+def test_storages_export_the_same(tmp_path):
+    exports = set()
+    for extension in ('.pickle', '.sqlite', '.shards'):
+        fileName = str(tmp_path / ('database' + extension))
+        createDatabase().writeToFile(fileName)
+        database = ImageDatabase()
+        database.readFromFile(fileName)
+        exports.add(''.join(iterEncodeImageDatabase(database.labeledImages)))
+    assert len(exports) == 1